@@ -0,0 +1,217 @@
+"""
+Admission control - Per-route concurrency limits and load shedding for the HTTP API
+
+Each limited path prefix admits a fixed number of concurrent requests and
+lets a bounded number wait, in arrival order, for a free slot. A request that
+finds the wait queue full is rejected at once with 429; one that waits longer
+than ADMISSION_QUEUE_TIMEOUT_SECONDS gets 503. Both carry a Retry-After
+estimated from the route's recent service time, so callers back off instead
+of piling up. Exempt paths (/health by default) and unlimited routes pass
+straight through.
+
+Implemented as a plain ASGI middleware so a streamed response keeps its slot
+until the last chunk is sent.
+"""
+import json
+import math
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Optional, Dict, Any, List, Deque
+from app.services.metrics_service import percentile
+from app.config.config import (
+    ADMISSION_CONTROL_ENABLED,
+    ADMISSION_ROUTE_LIMITS,
+    ADMISSION_QUEUE_SIZE,
+    ADMISSION_ROUTE_QUEUE_SIZES,
+    ADMISSION_QUEUE_TIMEOUT_SECONDS,
+    ADMISSION_EXEMPT_PATHS,
+)
+
+logger = logging.getLogger(__name__)
+
+# Wait times kept per route for the percentiles
+_WAIT_WINDOW = 500
+_SERVICE_TIME_ALPHA = 0.2
+
+
+class RouteGate:
+    """Concurrency slots and FIFO wait queue of one path prefix
+
+    Only touched from the event loop, so no lock is needed.
+    """
+
+    def __init__(self, prefix: str, concurrency: int, queue_size: int):
+        self.prefix = prefix
+        self.concurrency = max(1, concurrency)
+        self.queue_size = max(0, queue_size)
+        self.in_flight = 0
+        self.waiters: Deque[asyncio.Future] = deque()
+        self.service_seconds = 1.0
+        self.waits: Deque[float] = deque(maxlen=_WAIT_WINDOW)
+        self.stats = {"admitted": 0, "queued": 0, "rejected_queue_full": 0, "rejected_timeout": 0}
+
+    async def acquire(self, timeout: float) -> Optional[int]:
+        """Take a slot, waiting in line if needed; returns the rejection status code, or None once admitted"""
+        if self.in_flight < self.concurrency and not self.waiters:
+            self.in_flight += 1
+            self.stats["admitted"] += 1
+            return None
+        if len(self.waiters) >= self.queue_size:
+            self.stats["rejected_queue_full"] += 1
+            return 429
+
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        self.stats["queued"] += 1
+        start = time.monotonic()
+        try:
+            # release() hands its slot straight to the first waiter, so in_flight is already counted
+            await asyncio.wait_for(waiter, timeout)
+        except asyncio.TimeoutError:
+            self._forget(waiter)
+            self.stats["rejected_timeout"] += 1
+            return 503
+        except asyncio.CancelledError:
+            # Client went away while waiting; give back a slot handed over at the same moment
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            self._forget(waiter)
+            raise
+
+        self.waits.append(time.monotonic() - start)
+        self.stats["admitted"] += 1
+        return None
+
+    def release(self, service_seconds: Optional[float] = None) -> None:
+        """Free a slot, handing it to the first live waiter"""
+        if service_seconds is not None:
+            self.service_seconds += _SERVICE_TIME_ALPHA * (service_seconds - self.service_seconds)
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def retry_after(self) -> int:
+        """Seconds until a slot is likely free for a new request"""
+        ahead = len(self.waiters) + 1
+        return max(1, math.ceil(ahead / self.concurrency * self.service_seconds))
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Limits, occupancy and counters"""
+        waits = list(self.waits)
+        rejected = self.stats["rejected_queue_full"] + self.stats["rejected_timeout"]
+        offered = self.stats["admitted"] + rejected
+        return {
+            "concurrency": self.concurrency,
+            "queue_size": self.queue_size,
+            "in_flight": self.in_flight,
+            "waiting": len(self.waiters),
+            **self.stats,
+            "rejection_rate": round(rejected / offered, 3) if offered else 0.0,
+            "wait_p50_seconds": round(percentile(waits, 50), 3),
+            "wait_p95_seconds": round(percentile(waits, 95), 3),
+            "service_seconds": round(self.service_seconds, 3),
+        }
+
+    def _forget(self, waiter: asyncio.Future) -> None:
+        """Drop a waiter that gave up from the queue"""
+        try:
+            self.waiters.remove(waiter)
+        except ValueError:
+            pass
+
+
+class AdmissionController:
+    """Route gates keyed by path prefix"""
+
+    def __init__(
+        self,
+        limits: Optional[Dict[str, int]] = None,
+        queue_sizes: Optional[Dict[str, int]] = None,
+        queue_size: int = ADMISSION_QUEUE_SIZE,
+        queue_timeout: float = ADMISSION_QUEUE_TIMEOUT_SECONDS,
+        exempt_paths: Optional[List[str]] = None,
+        enabled: bool = ADMISSION_CONTROL_ENABLED
+    ):
+        limits = ADMISSION_ROUTE_LIMITS if limits is None else limits
+        queue_sizes = ADMISSION_ROUTE_QUEUE_SIZES if queue_sizes is None else queue_sizes
+        self.enabled = enabled
+        self.queue_timeout = queue_timeout
+        self.exempt_paths = set(ADMISSION_EXEMPT_PATHS if exempt_paths is None else exempt_paths)
+        # Longest prefix first so /api/v1/test-llm wins over /api/v1
+        self.gates = [
+            RouteGate(prefix, limit, queue_sizes.get(prefix, queue_size))
+            for prefix, limit in sorted(limits.items(), key=lambda item: -len(item[0]))
+        ]
+
+    def gate_for(self, path: str) -> Optional[RouteGate]:
+        """Gate limiting a path; None for exempt or unlimited paths"""
+        if not self.enabled or path in self.exempt_paths:
+            return None
+        for gate in self.gates:
+            if path == gate.prefix or path.startswith(gate.prefix.rstrip("/") + "/"):
+                return gate
+        return None
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Per-route limits and rejection counters"""
+        return {
+            "enabled": self.enabled,
+            "queue_timeout_seconds": self.queue_timeout,
+            "exempt_paths": sorted(self.exempt_paths),
+            "routes": {gate.prefix: gate.to_dict() for gate in self.gates},
+        }
+
+
+class AdmissionControlMiddleware:
+    """ASGI middleware applying the admission controller to HTTP requests"""
+
+    def __init__(self, app, controller: Optional[AdmissionController] = None):
+        self.app = app
+        self.controller = controller or admission_controller
+
+    async def __call__(self, scope, receive, send):
+        gate = self.controller.gate_for(scope.get("path", "")) if scope["type"] == "http" else None
+        if gate is None:
+            await self.app(scope, receive, send)
+            return
+
+        status = await gate.acquire(self.controller.queue_timeout)
+        if status is not None:
+            await self._reject(send, status, gate)
+            return
+
+        start = time.monotonic()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            gate.release(time.monotonic() - start)
+
+    async def _reject(self, send, status: int, gate: RouteGate) -> None:
+        """Fast rejection with Retry-After"""
+        retry_after = gate.retry_after()
+        if status == 429:
+            detail = f"Limite de requisições simultâneas atingido para {gate.prefix}; tente novamente em {retry_after}s"
+        else:
+            detail = f"Serviço sobrecarregado em {gate.prefix}; tente novamente em {retry_after}s"
+        logger.warning(f"Requisição rejeitada com {status} em {gate.prefix} ({gate.in_flight} em andamento, {len(gate.waiters)} na fila)")
+
+        body = json.dumps({"detail": detail}, ensure_ascii=False).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(retry_after).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+# Global instance for easy import
+admission_controller = AdmissionController()
@@ -1,16 +1,34 @@
 """
 API routes for LLM and PDF processing operations
 """
+import json
+import asyncio
 from fastapi import APIRouter, HTTPException, UploadFile, File, Query
-from typing import Optional
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import iterate_in_threadpool
+from typing import Optional, AsyncIterator
 from app.services.pdf_service import PDFProcessingService
 from app.clients.llm_client import OpenRouterClient, LLMModel
 from app.models.llm_models import DocumentChecklistResponse
 from app.config.config import DEFAULT_LLM_MODEL
+from app.services.result_store_service import checklist_store
+from app.services.bidding_service import BiddingService
+from app.api.admission import admission_controller
 
 router = APIRouter(prefix="/api/v1", tags=["Processing"])
 
 pdf_service = PDFProcessingService()
+bidding_service = BiddingService()
+
+
+def _validate_model(model: str) -> None:
+    """Raise 400 if the model is not configured"""
+    available_models = OpenRouterClient.get_available_models()
+    if model not in available_models:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Modelo '{model}' não disponível. Modelos disponíveis: {list(available_models.keys())}"
+        )
 
 
 @router.get("/models")
@@ -22,6 +40,26 @@ async def get_available_models():
     }
 
 
+@router.get("/models/status")
+async def get_models_status():
+    """Get concurrency, circuit breaker, routing and JSON parsing statistics"""
+    from app.clients.llm_client import llm_service
+    from app.services.model_router_service import model_router
+    from app.services.json_repair_service import json_repair_service
+    
+    return {
+        "resilience": llm_service.get_resilience_status(),
+        "routing": model_router.snapshot(),
+        "json_parsing": json_repair_service.snapshot()
+    }
+
+
+@router.get("/admission/status")
+async def get_admission_status():
+    """Get per-route concurrency limits, wait queues and rejected requests"""
+    return admission_controller.snapshot()
+
+
 @router.post("/test-llm")
 async def test_llm_endpoint(
     prompt: str,
@@ -30,29 +68,102 @@ async def test_llm_endpoint(
     """Test LLM with custom prompt"""
     
     # Validate model
-    available_models = OpenRouterClient.get_available_models()
-    if model not in available_models:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Modelo '{model}' não disponível. Modelos disponíveis: {list(available_models.keys())}"
-        )
+    _validate_model(model)
     
     try:
         from app.clients.llm_client import llm_service
         
-        response = llm_service.generate_completion(
+        # Run the blocking client on a worker thread so the event loop stays free;
+        # concurrency is bounded by the admission gate of /api/v1/test-llm
+        response = await asyncio.to_thread(
+            llm_service.generate,
             prompt=prompt,
             model=model
         )
         
-        if not response:
+        if not response.content:
             raise HTTPException(status_code=500, detail="Falha ao gerar resposta")
         
         return {
-            "model_used": model,
+            "model_used": response.model,
             "prompt": prompt,
-            "response": response
+            "response": response.content
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro interno: {str(e)}")
+
+
+@router.post("/test-llm/stream")
+async def test_llm_stream_endpoint(
+    prompt: str,
+    model: str = Query(DEFAULT_LLM_MODEL, description="LLM model to use")
+):
+    """Test LLM with custom prompt, streaming tokens as Server-Sent Events"""
+    
+    # Validate model
+    _validate_model(model)
+    
+    from app.clients.llm_client import llm_service
+    
+    async def event_stream() -> AsyncIterator[str]:
+        tokens = llm_service.stream_completion(prompt=prompt, model=model)
+        try:
+            async for token in iterate_in_threadpool(tokens):
+                yield f"data: {json.dumps({'token': token}, ensure_ascii=False)}\n\n"
+            yield "event: done\ndata: {}\n\n"
+        except Exception as e:
+            yield f"event: error\ndata: {json.dumps({'error': str(e)}, ensure_ascii=False)}\n\n"
+        finally:
+            # A client that disconnects cancels this generator; release the model slot now, not on GC
+            llm_service.close_stream(tokens)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.get("/checklists/{bidding_id}")
+async def get_stored_checklists(
+    bidding_id: str,
+    limit: int = Query(1, ge=1, le=100, description="Number of stored results to return")
+):
+    """Get stored checklist results for a bidding, newest first"""
+    results = await asyncio.to_thread(checklist_store.list_results, bidding_id, limit)
+    if not results:
+        raise HTTPException(status_code=404, detail=f"Nenhum checklist armazenado para o bidding {bidding_id}")
+    
+    return {
+        "bidding_id": bidding_id,
+        "latest": results[0],
+        "history": results[1:]
+    }
+
+
+@router.post("/checklists/{bidding_id}/push")
+async def push_stored_checklist(bidding_id: str):
+    """Re-send the latest stored checklist to the bidding API without calling the LLM"""
+    stored = await asyncio.to_thread(checklist_store.get_latest, bidding_id)
+    if not stored:
+        raise HTTPException(status_code=404, detail=f"Nenhum checklist armazenado para o bidding {bidding_id}")
+    
+    checklist = DocumentChecklistResponse.from_dict(stored["result"])
+    if checklist.status != "processed":
+        raise HTTPException(
+            status_code=409,
+            detail=f"Último resultado do bidding {bidding_id} não tem checklist (status {checklist.status})"
+        )
+    success = await bidding_service.update_bidding_checklist(bidding_id, checklist)
+    if not success:
+        raise HTTPException(status_code=502, detail="Falha ao enviar checklist para a API de bidding")
+    
+    return {
+        "bidding_id": bidding_id,
+        "content_hash": stored["content_hash"],
+        "total_documents": checklist.total_documents,
+        "pushed": True
+    }
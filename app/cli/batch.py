@@ -0,0 +1,253 @@
+"""
+Offline batch processing - Run the PDF pipeline over an S3 prefix or a local directory
+
+Usage:
+    python -m app.cli.batch s3://bucket/editais/2023/ --output results.jsonl
+    python -m app.cli.batch ./editais --threads 8 --processes 4 --model gemma
+"""
+import sys
+import json
+import time
+import logging
+import argparse
+import threading
+from pathlib import Path
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from typing import Optional, List, Iterator, Set, Dict, Any
+from app.config.logging_config import setup_logging
+from app.config.config import DEFAULT_LLM_MODEL
+from app.services.s3_service import S3Service
+from app.services.pdf_service import PDFProcessingService
+from app.services.metrics_service import percentile
+
+logger = logging.getLogger(__name__)
+
+
+_worker_pdf_service: Optional[PDFProcessingService] = None
+
+
+def _get_worker_pdf_service() -> PDFProcessingService:
+    """Lazily create one PDF service per worker process"""
+    global _worker_pdf_service
+    if _worker_pdf_service is None:
+        _worker_pdf_service = PDFProcessingService()
+    return _worker_pdf_service
+
+
+def _extract_pages(file_content: bytes) -> Optional[List[str]]:
+    """Text extraction entry point for worker processes"""
+    return _get_worker_pdf_service().extract_pages_from_pdf(file_content)
+
+
+class DocumentSource:
+    """Lists and reads PDFs from a local directory or an S3 prefix"""
+
+    def __init__(self, location: str):
+        self.location = location
+        self.s3_service: Optional[S3Service] = None
+        self.root: Optional[Path] = None
+
+        if location.startswith("s3://"):
+            bucket, _, prefix = location[len("s3://"):].partition("/")
+            self.s3_service = S3Service(bucket_name=bucket)
+            self.prefix = prefix
+        else:
+            self.root = Path(location)
+            if not self.root.is_dir():
+                raise ValueError(f"Diretório não encontrado: {location}")
+
+    def list_documents(self) -> Iterator[str]:
+        """Yield document identifiers (S3 keys or local paths)"""
+        if self.s3_service:
+            yield from self.s3_service.list_pdf_keys(self.prefix)
+        else:
+            for path in sorted(self.root.rglob("*")):
+                if path.is_file() and path.suffix.lower() == ".pdf":
+                    yield str(path)
+
+    def read(self, document_id: str) -> Optional[bytes]:
+        """Read document content"""
+        if self.s3_service:
+            return self.s3_service.download_file(document_id)
+        return Path(document_id).read_bytes()
+
+
+class Checkpoint:
+    """Append-only record of documents already processed"""
+
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self.done: Set[str] = set()
+        self._lock = threading.Lock()
+
+        if path and Path(path).exists():
+            with open(path, encoding="utf-8") as f:
+                self.done = {line.strip() for line in f if line.strip()}
+            logger.info(f"Checkpoint carregado: {len(self.done)} documentos já processados")
+
+    def mark_done(self, document_id: str) -> None:
+        """Record a finished document"""
+        if not self.path:
+            return
+        with self._lock:
+            self.done.add(document_id)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(document_id + "\n")
+
+
+@dataclass
+class BatchSummary:
+    """Throughput and latency summary of a batch run"""
+    succeeded: int = 0
+    failed: int = 0
+    skipped: int = 0
+    latencies: List[float] = field(default_factory=list)
+    started_at: float = field(default_factory=time.monotonic)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Convert to dictionary"""
+        elapsed = time.monotonic() - self.started_at
+        processed = self.succeeded + self.failed
+        return {
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "skipped": self.skipped,
+            "elapsed_seconds": round(elapsed, 2),
+            "documents_per_minute": round(processed / elapsed * 60, 2) if elapsed else 0.0,
+            "latency_p50_seconds": round(percentile(self.latencies, 50), 2),
+            "latency_p95_seconds": round(percentile(self.latencies, 95), 2),
+            "latency_p99_seconds": round(percentile(self.latencies, 99), 2),
+        }
+
+
+class BatchProcessor:
+    """Run the PDF pipeline over many documents with thread/process parallelism"""
+
+    def __init__(
+        self,
+        source: DocumentSource,
+        output_path: str,
+        checkpoint_path: Optional[str] = None,
+        model: str = DEFAULT_LLM_MODEL,
+        threads: int = 4,
+        processes: int = 0,
+    ):
+        self.source = source
+        self.output_path = output_path
+        self.checkpoint = Checkpoint(checkpoint_path)
+        self.model = model
+        self.threads = threads
+        self.processes = processes
+        self.pdf_service = PDFProcessingService()
+        self.summary = BatchSummary()
+        self._extract_pool: Optional[ProcessPoolExecutor] = None
+        self._output_lock = threading.Lock()
+
+    def run(self, limit: Optional[int] = None) -> BatchSummary:
+        """Process every pending document and return the run summary"""
+        pending = []
+        for document_id in self.source.list_documents():
+            if document_id in self.checkpoint.done:
+                self.summary.skipped += 1
+                continue
+            pending.append(document_id)
+            if limit and len(pending) >= limit:
+                break
+
+        logger.info(f"Iniciando batch: {len(pending)} documentos pendentes, {self.summary.skipped} já processados")
+
+        if self.processes > 0:
+            self._extract_pool = ProcessPoolExecutor(max_workers=self.processes)
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.threads) as executor, \
+                    open(self.output_path, "a", encoding="utf-8") as output:
+                futures = [executor.submit(self._process_document, doc) for doc in pending]
+                for future in as_completed(futures):
+                    record = future.result()
+                    self._write_record(output, record)
+        finally:
+            if self._extract_pool:
+                self._extract_pool.shutdown()
+
+        return self.summary
+
+    def _process_document(self, document_id: str) -> Dict[str, Any]:
+        """Download, extract and analyze a single document"""
+        start = time.monotonic()
+        record: Dict[str, Any] = {"document": document_id, "model": self.model}
+
+        try:
+            content = self.source.read(document_id)
+            if not content:
+                raise ValueError("Falha ao ler documento")
+
+            if self._extract_pool:
+                pages = self._extract_pool.submit(_extract_pages, content).result()
+            else:
+                pages = self.pdf_service.extract_pages_from_pdf(content)
+            if pages is None:
+                raise ValueError("Falha na extração de texto do PDF")
+
+            result = self.pdf_service.process_pages(pages, self.model)
+            if not result:
+                raise ValueError("Falha no processamento com LLM")
+
+            record.update({"status": "success", "result": result.to_dict()})
+
+        except Exception as e:
+            logger.error(f"Erro ao processar {document_id}: {e}")
+            record.update({"status": "failed", "error": str(e)})
+
+        record["latency_seconds"] = round(time.monotonic() - start, 3)
+        return record
+
+    def _write_record(self, output, record: Dict[str, Any]) -> None:
+        """Append result line and update checkpoint and summary"""
+        with self._output_lock:
+            output.write(json.dumps(record, ensure_ascii=False) + "\n")
+            output.flush()
+
+            if record["status"] == "success":
+                self.summary.succeeded += 1
+                self.summary.latencies.append(record["latency_seconds"])
+                self.checkpoint.mark_done(record["document"])
+            else:
+                self.summary.failed += 1
+
+            processed = self.summary.succeeded + self.summary.failed
+            if processed % 50 == 0:
+                logger.info(f"Progresso: {processed} documentos processados ({self.summary.failed} falhas)")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Processamento offline de editais em lote")
+    parser.add_argument("source", help="Diretório local ou prefixo S3 (s3://bucket/prefixo)")
+    parser.add_argument("--output", default="batch_results.jsonl", help="Arquivo JSONL de saída")
+    parser.add_argument("--checkpoint", default=None, help="Arquivo de checkpoint (padrão: <output>.checkpoint)")
+    parser.add_argument("--model", default=DEFAULT_LLM_MODEL, help="Modelo LLM a usar")
+    parser.add_argument("--threads", type=int, default=4, help="Documentos processados em paralelo")
+    parser.add_argument("--processes", type=int, default=0, help="Processos para extração de texto (0 = na thread)")
+    parser.add_argument("--limit", type=int, default=None, help="Número máximo de documentos")
+    args = parser.parse_args(argv)
+
+    setup_logging()
+
+    processor = BatchProcessor(
+        source=DocumentSource(args.source),
+        output_path=args.output,
+        checkpoint_path=args.checkpoint or f"{args.output}.checkpoint",
+        model=args.model,
+        threads=args.threads,
+        processes=args.processes,
+    )
+    summary = processor.run(limit=args.limit)
+
+    print(json.dumps(summary.to_dict(), indent=2))
+    return 0 if summary.failed == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
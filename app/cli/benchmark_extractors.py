@@ -0,0 +1,190 @@
+"""
+Extraction benchmark - Compare PDF text extraction backends on a local corpus
+
+Usage:
+    python -m app.cli.benchmark_extractors ./editais
+    python -m app.cli.benchmark_extractors ./editais --backends pypdf2,pymupdf --show-diff 40
+
+Each backend runs in a fresh process so its peak RSS is measured in isolation.
+Text from every backend is compared word by word against the baseline backend.
+"""
+import sys
+import json
+import time
+import difflib
+import logging
+import argparse
+import resource
+import multiprocessing
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, List, Dict, Any
+from app.config.logging_config import setup_logging
+from app.services.pdf_extraction_backends import BACKENDS, DEFAULT_BACKEND, available_backends
+
+
+def _rss_mb() -> float:
+    """Peak resident set size of this process (ru_maxrss is KB on Linux)"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _benchmark_backend(name: str, paths: List[str]) -> Dict[str, Any]:
+    """Extract every document with one backend; runs in its own process"""
+    backend = BACKENDS[name]()
+    baseline_rss = _rss_mb()
+    texts: Dict[str, str] = {}
+    errors: Dict[str, str] = {}
+    pages = 0
+    seconds = 0.0
+
+    for path in paths:
+        content = Path(path).read_bytes()
+        start = time.perf_counter()
+        try:
+            document_pages = list(backend.iter_pages(content))
+        except Exception as e:
+            errors[path] = str(e)
+            continue
+        seconds += time.perf_counter() - start
+        pages += len(document_pages)
+        texts[path] = "\n".join(document_pages)
+
+    return {
+        "backend": name,
+        "documents": len(texts),
+        "pages": pages,
+        "seconds": seconds,
+        "baseline_rss_mb": baseline_rss,
+        "peak_rss_mb": _rss_mb(),
+        "errors": errors,
+        "texts": texts,
+    }
+
+
+def _similarity(text_a: str, text_b: str, max_words: int) -> float:
+    """Word-level similarity ratio between two extractions"""
+    words_a = text_a.split()[:max_words]
+    words_b = text_b.split()[:max_words]
+    if not words_a and not words_b:
+        return 1.0
+    return difflib.SequenceMatcher(None, words_a, words_b).ratio()
+
+
+class ExtractionBenchmark:
+    """Run backends over a corpus and compare speed, memory and text"""
+
+    def __init__(self, paths: List[str], backends: List[str], baseline: str, max_diff_words: int = 20000):
+        self.paths = paths
+        self.backends = backends
+        self.baseline = baseline
+        self.max_diff_words = max_diff_words
+        self.results: Dict[str, Dict[str, Any]] = {}
+
+    def run(self) -> Dict[str, Any]:
+        """Benchmark each backend and return the report"""
+        context = multiprocessing.get_context("spawn")
+        for name in self.backends:
+            # Progress goes to stderr so it stays out of the JSON report on stdout
+            print(f"Executando backend {name} em {len(self.paths)} documentos", file=sys.stderr)
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                self.results[name] = executor.submit(_benchmark_backend, name, self.paths).result()
+
+        return {
+            "documents": len(self.paths),
+            "baseline": self.baseline,
+            "backends": {name: self._backend_report(result) for name, result in self.results.items()},
+        }
+
+    def _backend_report(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        """Speed, memory and text agreement of one backend"""
+        seconds = result["seconds"]
+        report = {
+            "documents": result["documents"],
+            "pages": result["pages"],
+            "seconds": round(seconds, 3),
+            "pages_per_second": round(result["pages"] / seconds, 2) if seconds else 0.0,
+            "peak_rss_mb": round(result["peak_rss_mb"], 1),
+            "extraction_rss_mb": round(result["peak_rss_mb"] - result["baseline_rss_mb"], 1),
+            "chars": sum(len(text) for text in result["texts"].values()),
+            "errors": len(result["errors"]),
+        }
+        if result["backend"] != self.baseline and self.baseline in self.results:
+            report["text_vs_baseline"] = self._compare(result)
+        return report
+
+    def _compare(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        """Similarity of each document's text against the baseline backend"""
+        baseline_texts = self.results[self.baseline]["texts"]
+        scores = {
+            path: _similarity(baseline_texts[path], text, self.max_diff_words)
+            for path, text in result["texts"].items()
+            if path in baseline_texts
+        }
+        if not scores:
+            return {}
+        worst = min(scores, key=scores.get)
+        return {
+            "mean_similarity": round(sum(scores.values()) / len(scores), 4),
+            "min_similarity": round(scores[worst], 4),
+            "least_similar_document": worst,
+        }
+
+    def diff(self, backend: str, path: str, max_lines: int) -> List[str]:
+        """Unified diff between the baseline and a backend for one document"""
+        baseline_lines = self.results[self.baseline]["texts"].get(path, "").splitlines()
+        backend_lines = self.results[backend]["texts"].get(path, "").splitlines()
+        lines = difflib.unified_diff(
+            baseline_lines, backend_lines, fromfile=self.baseline, tofile=backend, lineterm=""
+        )
+        return list(lines)[:max_lines]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Benchmark dos backends de extração de texto de PDF")
+    parser.add_argument("corpus", help="Diretório local com PDFs")
+    parser.add_argument("--backends", default=None, help="Backends separados por vírgula (padrão: todos instalados)")
+    parser.add_argument("--baseline", default=DEFAULT_BACKEND, help="Backend de referência para comparar o texto")
+    parser.add_argument("--limit", type=int, default=None, help="Número máximo de documentos")
+    parser.add_argument("--max-diff-words", type=int, default=20000, help="Palavras comparadas por documento")
+    parser.add_argument("--show-diff", type=int, default=0, help="Linhas de diff do documento menos similar")
+    args = parser.parse_args(argv)
+
+    setup_logging()
+    logging.getLogger("app").setLevel(logging.WARNING)
+
+    root = Path(args.corpus)
+    if not root.is_dir():
+        print(f"Diretório não encontrado: {args.corpus}", file=sys.stderr)
+        return 1
+    paths = sorted(str(path) for path in root.rglob("*") if path.suffix.lower() == ".pdf")[:args.limit]
+    if not paths:
+        print(f"Nenhum PDF encontrado em {args.corpus}", file=sys.stderr)
+        return 1
+
+    installed = available_backends()
+    backends = [name.strip() for name in args.backends.split(",")] if args.backends else installed
+    missing = [name for name in backends if name not in installed]
+    if missing:
+        print(f"Backends não instalados ou desconhecidos: {', '.join(missing)}", file=sys.stderr)
+        return 1
+    # Run the baseline first so it is available for comparisons
+    if args.baseline in backends:
+        backends.remove(args.baseline)
+        backends.insert(0, args.baseline)
+
+    benchmark = ExtractionBenchmark(paths, backends, args.baseline, args.max_diff_words)
+    report = benchmark.run()
+    print(json.dumps(report, indent=2))
+
+    if args.show_diff:
+        for name, backend_report in report["backends"].items():
+            comparison = backend_report.get("text_vs_baseline")
+            if comparison:
+                print(f"\n# {name}: {comparison['least_similar_document']}")
+                print("\n".join(benchmark.diff(name, comparison["least_similar_document"], args.show_diff)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,351 @@
+"""
+Corpus evaluation - Re-run a prompt or model over stored page text and compare checklists
+
+Usage:
+    python -m app.cli.evaluate import ./editais
+    python -m app.cli.evaluate run --model deepseek --limit 200 --workers 8
+    python -m app.cli.evaluate run --prompt-file novo_prompt.txt --bidding-ids 123,456 --output eval.jsonl
+
+`import` fills the corpus store from historical PDFs (local directory or S3
+prefix); the consumer adds every PDF it processes while CORPUS_STORE_ENABLED
+is on. `run` sends the stored pages through the pipeline after extraction and
+compares each checklist with the one stored for the same content hash in the
+result store (documents matched by normalized name). Messages with several
+files are stored under a combined hash, so their files have no reference and
+are only reported.
+
+Prompt files replace LLMPromptTemplate's extraction prompt ({document_content})
+or residual prompt ({known_documents}, {document_content}); literal braces
+must be doubled.
+"""
+import sys
+import json
+import time
+import hashlib
+import logging
+import argparse
+import threading
+from collections import Counter
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from typing import Optional, List, Dict, Any
+from app.config.logging_config import setup_logging
+from app.config.config import DEFAULT_LLM_MODEL
+from app.cli.batch import DocumentSource
+from app.models.llm_models import DocumentChecklistResponse, LLMPromptTemplate
+from app.services.pdf_service import PDFProcessingService
+from app.services.corpus_store_service import CorpusStore, CorpusEntry
+from app.services.result_store_service import checklist_store
+from app.services.similarity_index_service import SimilarityIndexService
+from app.services.llm_batch_service import LLMBatchService
+from app.services.metrics_service import percentile
+
+logger = logging.getLogger(__name__)
+
+# Documents listed in the summary as most often missed or added
+_TOP_DIFFERENCES = 10
+
+_worker_pdf_service: Optional[PDFProcessingService] = None
+
+
+def _extract_pages(file_content: bytes) -> Optional[List[str]]:
+    """Text extraction entry point for worker processes"""
+    global _worker_pdf_service
+    if _worker_pdf_service is None:
+        _worker_pdf_service = PDFProcessingService()
+    return _worker_pdf_service.extract_pages_from_pdf(file_content)
+
+
+class FilePromptTemplate(LLMPromptTemplate):
+    """Prompt template with the extraction and/or residual prompt read from files"""
+
+    def __init__(self, prompt_file: Optional[str] = None, residual_prompt_file: Optional[str] = None):
+        self.prompt = self._read(prompt_file)
+        self.residual_prompt = self._read(residual_prompt_file)
+
+    def get_document_extraction_prompt(self) -> str:
+        """Extraction prompt from the file, or the built-in one"""
+        return self.prompt or super().get_document_extraction_prompt()
+
+    def get_residual_extraction_prompt(self) -> str:
+        """Residual prompt from the file, or the built-in one"""
+        return self.residual_prompt or super().get_residual_extraction_prompt()
+
+    def _read(self, path: Optional[str]) -> Optional[str]:
+        """Prompt text of a file"""
+        if not path:
+            return None
+        with open(path, encoding="utf-8") as f:
+            return f.read()
+
+
+def compare_checklists(reference: List[Any], candidate: List[Any]) -> Dict[str, Any]:
+    """Precision, recall and status agreement of a checklist against a reference, by normalized name"""
+    def by_key(documents: List[Any]) -> Dict[str, Any]:
+        return {
+            DocumentChecklistResponse.document_key(DocumentChecklistResponse.document_field(doc, "name", "")): doc
+            for doc in documents
+        }
+
+    expected = {key: doc for key, doc in by_key(reference).items() if key}
+    found = {key: doc for key, doc in by_key(candidate).items() if key}
+    matched = expected.keys() & found.keys()
+    same_status = sum(
+        1 for key in matched
+        if DocumentChecklistResponse.document_field(expected[key], "exigenceStatus")
+        == DocumentChecklistResponse.document_field(found[key], "exigenceStatus")
+    )
+    precision = len(matched) / len(found) if found else float(not expected)
+    recall = len(matched) / len(expected) if expected else float(not found)
+    return {
+        "precision": round(precision, 3),
+        "recall": round(recall, 3),
+        "f1": round(2 * precision * recall / (precision + recall), 3) if precision + recall else 0.0,
+        "status_agreement": round(same_status / len(matched), 3) if matched else None,
+        "missing": sorted(DocumentChecklistResponse.document_field(expected[key], "name") for key in expected.keys() - matched),
+        "added": sorted(DocumentChecklistResponse.document_field(found[key], "name") for key in found.keys() - matched),
+    }
+
+
+@dataclass
+class EvaluationSummary:
+    """Quality, cost and latency of an evaluation run"""
+    evaluated: int = 0
+    failed: int = 0
+    without_reference: int = 0
+    scores: List[Dict[str, Any]] = field(default_factory=list)
+    latencies: List[float] = field(default_factory=list)
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    missing: Counter = field(default_factory=Counter)
+    added: Counter = field(default_factory=Counter)
+    # Model that actually answered; preflight may move a document that does not fit to another model
+    models: Counter = field(default_factory=Counter)
+    started_at: float = field(default_factory=time.monotonic)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Convert to dictionary"""
+        def mean(name: str) -> Optional[float]:
+            values = [score[name] for score in self.scores if score[name] is not None]
+            return round(sum(values) / len(values), 3) if values else None
+
+        return {
+            "evaluated": self.evaluated,
+            "failed": self.failed,
+            "compared": len(self.scores),
+            "without_reference": self.without_reference,
+            "precision": mean("precision"),
+            "recall": mean("recall"),
+            "f1": mean("f1"),
+            "status_agreement": mean("status_agreement"),
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "models": dict(self.models.most_common()),
+            "elapsed_seconds": round(time.monotonic() - self.started_at, 2),
+            "latency_p50_seconds": round(percentile(self.latencies, 50), 2),
+            "latency_p95_seconds": round(percentile(self.latencies, 95), 2),
+            "most_missed": self.missing.most_common(_TOP_DIFFERENCES),
+            "most_added": self.added.most_common(_TOP_DIFFERENCES),
+        }
+
+
+class CorpusEvaluator:
+    """Run the pipeline after extraction over corpus documents and score it against stored checklists"""
+
+    def __init__(
+        self,
+        corpus: CorpusStore,
+        model: str = DEFAULT_LLM_MODEL,
+        workers: int = 4,
+        prompt_template: Optional[LLMPromptTemplate] = None,
+        output_path: Optional[str] = None
+    ):
+        self.corpus = corpus
+        self.model = model
+        self.workers = workers
+        self.output_path = output_path
+        self.result_store = checklist_store
+        self.pdf_service = PDFProcessingService()
+        if prompt_template:
+            self.pdf_service.prompt_template = prompt_template
+        # Stored checklists must not stand in for the prompt under test, and each
+        # document gets its own call so the prompt is what is measured
+        self.pdf_service.similarity_index = SimilarityIndexService(enabled=False)
+        self.pdf_service.batcher = LLMBatchService(enabled=False)
+        self.summary = EvaluationSummary()
+        self._lock = threading.Lock()
+
+    def run(self, bidding_ids: Optional[List[str]] = None, limit: Optional[int] = None) -> EvaluationSummary:
+        """Evaluate the selected corpus documents in parallel"""
+        entries = list(self.corpus.entries(bidding_ids))
+        if limit:
+            entries = entries[-limit:]
+        logger.info(f"Avaliando {len(entries)} documentos do corpus com o modelo {self.model}")
+
+        output = open(self.output_path, "w", encoding="utf-8") if self.output_path else None
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                futures = [executor.submit(self._evaluate, entry) for entry in entries]
+                for future in as_completed(futures):
+                    self._record(future.result(), output)
+        finally:
+            if output:
+                output.close()
+        return self.summary
+
+    def _evaluate(self, entry: CorpusEntry) -> Dict[str, Any]:
+        """Process one stored document and compare it with its stored checklist"""
+        start = time.monotonic()
+        record: Dict[str, Any] = {
+            "content_hash": entry.content_hash,
+            "bidding_id": entry.bidding_id,
+            "requested_model": self.model,
+            "model": None,
+        }
+
+        try:
+            pages = self.corpus.get_pages(entry.content_hash)
+            if pages is None:
+                raise ValueError("Documento não encontrado no corpus")
+
+            result = self.pdf_service.process_pages(pages, self.model)
+            if not result:
+                raise ValueError("Falha no processamento com LLM")
+            # None when the rules found every document and no LLM call was made
+            record.update({"status": "success", "model": result.model_used, "result": result.to_dict()})
+
+            stored = self.result_store.get_by_content_hash(entry.content_hash)
+            if stored:
+                record["comparison"] = compare_checklists(stored["result"].get("documents", []), result.documents)
+
+        except Exception as e:
+            logger.error(f"Erro ao avaliar {entry.content_hash[:12]}: {e}")
+            record.update({"status": "failed", "error": str(e)})
+
+        record["latency_seconds"] = round(time.monotonic() - start, 3)
+        return record
+
+    def _record(self, record: Dict[str, Any], output) -> None:
+        """Add a record to the summary and the output file"""
+        with self._lock:
+            if output:
+                output.write(json.dumps(record, ensure_ascii=False) + "\n")
+                output.flush()
+
+            self.summary.evaluated += 1
+            if record["status"] != "success":
+                self.summary.failed += 1
+                return
+            self.summary.latencies.append(record["latency_seconds"])
+            self.summary.models[record["model"] or "sem LLM"] += 1
+            self.summary.prompt_tokens += record["result"].get("prompt_tokens") or 0
+            self.summary.completion_tokens += record["result"].get("completion_tokens") or 0
+
+            comparison = record.get("comparison")
+            if comparison is None:
+                self.summary.without_reference += 1
+            else:
+                self.summary.scores.append(comparison)
+                self.summary.missing.update(comparison["missing"])
+                self.summary.added.update(comparison["added"])
+
+            if self.summary.evaluated % 50 == 0:
+                logger.info(f"Progresso: {self.summary.evaluated} documentos avaliados ({self.summary.failed} falhas)")
+
+
+def import_documents(
+    source: DocumentSource,
+    corpus: CorpusStore,
+    threads: int = 4,
+    processes: int = 0,
+    limit: Optional[int] = None
+) -> Dict[str, int]:
+    """Extract historical PDFs into the corpus, linking each to the bidding stored for its content hash"""
+    document_ids = []
+    for document_id in source.list_documents():
+        document_ids.append(document_id)
+        if limit and len(document_ids) >= limit:
+            break
+
+    counts = {"imported": 0, "failed": 0}
+    lock = threading.Lock()
+    extract_pool = ProcessPoolExecutor(max_workers=processes) if processes > 0 else None
+    pdf_service = PDFProcessingService()
+
+    def import_document(document_id: str) -> bool:
+        content = source.read(document_id)
+        if not content:
+            return False
+        content_hash = hashlib.sha256(content).hexdigest()
+        if corpus.get_pages(content_hash) is not None:
+            return True
+        if extract_pool:
+            pages = extract_pool.submit(_extract_pages, content).result()
+        else:
+            pages = pdf_service.extract_pages_from_pdf(content)
+        if pages is None:
+            return False
+        stored = checklist_store.get_by_content_hash(content_hash)
+        return corpus.add(content_hash, stored["bidding_id"] if stored else None, pages)
+
+    try:
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            futures = {executor.submit(import_document, document_id): document_id for document_id in document_ids}
+            for future in as_completed(futures):
+                try:
+                    imported = future.result()
+                except Exception as e:
+                    logger.error(f"Erro ao importar {futures[future]}: {e}")
+                    imported = False
+                with lock:
+                    counts["imported" if imported else "failed"] += 1
+    finally:
+        if extract_pool:
+            extract_pool.shutdown()
+    return counts
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Avaliação de prompts e modelos sobre o corpus de editais")
+    parser.add_argument("--corpus", default=None, help="Diretório do corpus (padrão: CORPUS_STORE_PATH)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    importer = commands.add_parser("import", help="Extrair PDFs históricos para o corpus")
+    importer.add_argument("source", help="Diretório local ou prefixo S3 (s3://bucket/prefixo)")
+    importer.add_argument("--threads", type=int, default=4, help="Documentos lidos em paralelo")
+    importer.add_argument("--processes", type=int, default=0, help="Processos para extração de texto (0 = na thread)")
+    importer.add_argument("--limit", type=int, default=None, help="Número máximo de documentos")
+
+    runner = commands.add_parser("run", help="Reprocessar o corpus e comparar com os checklists armazenados")
+    runner.add_argument("--model", default=DEFAULT_LLM_MODEL, help="Modelo LLM a avaliar")
+    runner.add_argument("--prompt-file", default=None, help="Arquivo com o prompt de extração a avaliar")
+    runner.add_argument("--residual-prompt-file", default=None, help="Arquivo com o prompt residual a avaliar")
+    runner.add_argument("--bidding-ids", default=None, help="IDs de bidding separados por vírgula")
+    runner.add_argument("--limit", type=int, default=None, help="Avaliar apenas os N documentos mais recentes")
+    runner.add_argument("--workers", type=int, default=4, help="Documentos avaliados em paralelo")
+    runner.add_argument("--output", default=None, help="Arquivo JSONL com o resultado de cada documento")
+    args = parser.parse_args(argv)
+
+    setup_logging()
+    corpus = CorpusStore(path=args.corpus, enabled=True) if args.corpus else CorpusStore(enabled=True)
+
+    if args.command == "import":
+        counts = import_documents(DocumentSource(args.source), corpus, args.threads, args.processes, args.limit)
+        print(json.dumps({**counts, **corpus.snapshot()}, indent=2))
+        return 0 if counts["failed"] == 0 else 1
+
+    prompt_template = None
+    if args.prompt_file or args.residual_prompt_file:
+        prompt_template = FilePromptTemplate(args.prompt_file, args.residual_prompt_file)
+    bidding_ids = [item.strip() for item in args.bidding_ids.split(",") if item.strip()] if args.bidding_ids else None
+
+    evaluator = CorpusEvaluator(corpus, args.model, args.workers, prompt_template, args.output)
+    summary = evaluator.run(bidding_ids=bidding_ids, limit=args.limit)
+
+    print(json.dumps(summary.to_dict(), indent=2, ensure_ascii=False))
+    return 0 if summary.failed == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,351 @@
+"""
+Replay load test - Replay recorded consumer traffic against local stand-ins
+
+Record in production with TRAFFIC_RECORD_PATH=traffic.jsonl.gz, then:
+    python -m app.cli.replay traffic.jsonl.gz --speed 10 --workers 8
+
+Message arrivals are replayed at --speed times the recorded rate through the
+real MessageProcessor pipeline. S3, PDF extraction, the LLM provider and the
+bidding API are replaced by stand-ins that reproduce the recorded sizes,
+timings and payloads, so no external service is called.
+"""
+import io
+import sys
+import gzip
+import json
+import time
+import zlib
+import random
+import asyncio
+import logging
+import argparse
+import threading
+import contextvars
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, List, Dict, Any, Iterator
+from app.config.logging_config import setup_logging
+from app.models.llm_models import LLMResponse
+from app.consumers.message_processor import MessageProcessor
+from app.services.s3_service import DownloadedFile
+from app.services.deadline import Deadline
+from app.services.pdf_service import PDFProcessingService
+from app.services.result_store_service import ChecklistResultStore
+from app.services.similarity_index_service import SimilarityIndexService
+from app.services.corpus_store_service import CorpusStore
+from app.services.llm_batch_service import LLMBatchService
+from app.services.bidding_service import BiddingService
+from app.services.checklist_dispatcher_service import ChecklistUpdateDispatcher
+from app.services.metrics_service import percentile
+
+logger = logging.getLogger(__name__)
+
+_FILLER_WORDS = (
+    "licitante", "deverá", "apresentar", "certidão", "negativa", "débitos", "habilitação",
+    "jurídica", "fiscal", "trabalhista", "qualificação", "técnica", "econômico", "financeira",
+    "proposta", "edital", "contratação", "prazo", "validade", "documento", "original", "cópia",
+)
+
+
+@dataclass
+class RecordedMessage:
+    """Everything recorded for one SQS message"""
+    message_id: str
+    ts: float
+    body: str
+    download: Optional[Dict[str, Any]] = None
+    extraction: Optional[Dict[str, Any]] = None
+    llm_calls: List[Dict[str, Any]] = field(default_factory=list)
+
+
+def load_recording(path: str) -> List[RecordedMessage]:
+    """Group recorded events by message, ordered by arrival
+
+    A recording cut short by a crash or a full disk ends in a truncated gzip
+    stream; the complete lines read up to that point are kept.
+    """
+    messages: Dict[str, RecordedMessage] = {}
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        try:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning("Linha inválida ignorada na gravação")
+                    continue
+                _add_record(messages, record)
+        except (EOFError, zlib.error, gzip.BadGzipFile) as e:
+            logger.warning(f"Gravação {path} truncada ({e}); usando as {len(messages)} mensagens lidas até aqui")
+
+    return sorted(messages.values(), key=lambda message: message.ts)
+
+
+def _add_record(messages: Dict[str, RecordedMessage], record: Dict[str, Any]) -> None:
+    """Attach a recorded event to its message"""
+    message_id = record.get("message_id")
+    if record["type"] == "message":
+        messages[message_id] = RecordedMessage(message_id, record["ts"], record.get("body", ""))
+        return
+
+    message = messages.get(message_id)
+    if message is None:
+        return
+    if record["type"] == "download":
+        message.download = record
+    elif record["type"] == "extraction":
+        message.extraction = record
+    elif record["type"] == "llm":
+        message.llm_calls.append(record)
+
+
+@dataclass
+class _Binding:
+    """Recorded message bound to a worker and its position in the LLM calls"""
+    message: RecordedMessage
+    llm_index: int = 0
+
+
+class ReplaySession:
+    """Maps worker threads to the recorded message they are replaying
+
+    The binding is a context variable, so the helper threads MessageProcessor
+    starts for multi-file messages see the message of the thread that started them.
+    """
+
+    def __init__(self, messages: List[RecordedMessage]):
+        self.messages = {message.message_id: message for message in messages}
+        self._binding: contextvars.ContextVar[_Binding] = contextvars.ContextVar("replay_binding")
+        self._lock = threading.Lock()
+
+    def bind(self, message: RecordedMessage) -> None:
+        """Bind a message to the current thread"""
+        self._binding.set(_Binding(message))
+
+    @property
+    def current(self) -> RecordedMessage:
+        """Message being replayed on this thread"""
+        return self._binding.get().message
+
+    def next_llm_call(self) -> Optional[Dict[str, Any]]:
+        """Next recorded LLM call for the current message"""
+        binding = self._binding.get()
+        calls = binding.message.llm_calls
+        if not calls:
+            return None
+        # Helper threads of one message share the binding
+        with self._lock:
+            call = calls[min(binding.llm_index, len(calls) - 1)]
+            binding.llm_index += 1
+        return call
+
+
+class ReplayS3Service:
+    """S3 stand-in returning the recorded object size and hash"""
+
+    def __init__(self, session: ReplaySession, bandwidth_mbps: float):
+        self.session = session
+        self.bandwidth_mbps = bandwidth_mbps
+
+    @contextmanager
+    def open_file_from_url(self, url: str, deadline: Optional[Deadline] = None) -> Iterator[Optional[DownloadedFile]]:
+        """Simulate the download time of the recorded object"""
+        download = self.session.current.download
+        if not download:
+            yield None
+            return
+        size = download["size"]
+        if self.bandwidth_mbps > 0:
+            time.sleep(size * 8 / (self.bandwidth_mbps * 1_000_000))
+        yield DownloadedFile(key=url, stream=io.BytesIO(b""), size=size, content_hash=download["content_hash"])
+
+
+class ReplayLLMService:
+    """LLM stand-in replaying recorded latencies and payloads"""
+
+    def __init__(self, session: ReplaySession):
+        self.session = session
+
+    def generate(
+        self,
+        prompt: str,
+        model: str,
+        max_tokens: int = 4000,
+        temperature: float = 0.1,
+        json_schema: Optional[Dict[str, Any]] = None,
+        deadline: Optional[Deadline] = None
+    ) -> LLMResponse:
+        """Sleep for the recorded latency and return the recorded content"""
+        call = self.session.next_llm_call()
+        if call is None:
+            return LLMResponse(content="", model=model, success=False)
+        time.sleep(call["latency"])
+        return LLMResponse(
+            content=call["content"],
+            model=call["model"],
+            prompt_tokens=call.get("prompt_tokens"),
+            completion_tokens=call.get("completion_tokens"),
+            latency_seconds=call["latency"]
+        )
+
+    def generate_completion(self, prompt: str, model: str, max_tokens: int = 4000, temperature: float = 0.1) -> Optional[str]:
+        """Content-only variant"""
+        return self.generate(prompt, model, max_tokens, temperature).content
+
+
+class ReplayPDFProcessingService(PDFProcessingService):
+    """PDF service whose extraction reproduces the recorded page count, size and time"""
+
+    def __init__(self, session: ReplaySession):
+        super().__init__()
+        self.session = session
+        self.llm_service = ReplayLLMService(session)
+        # The shared batcher calls the real provider; recorded calls are replayed one document at a time
+        self.batcher = LLMBatchService(enabled=False)
+        # Synthetic text must not reach the similarity index or the evaluation corpus
+        self.similarity_index = SimilarityIndexService(enabled=False)
+        self.corpus_store = CorpusStore(enabled=False)
+
+    def extract_pages_from_pdf(self, file_content, deadline: Optional[Deadline] = None) -> Optional[List[str]]:
+        """Synthetic pages matching the recorded extraction"""
+        extraction = self.session.current.extraction
+        if not extraction:
+            return None
+        time.sleep(extraction.get("seconds", 0.0))
+
+        pages = max(1, extraction["pages"])
+        rng = random.Random(self.session.current.message_id)
+        per_page = extraction["chars"] // pages
+        return [self._filler_text(rng, per_page) for _ in range(pages)]
+
+    def _filler_text(self, rng: random.Random, chars: int) -> str:
+        """Non-repeating filler text of roughly the given length"""
+        words = []
+        length = 0
+        while length < chars:
+            word = rng.choice(_FILLER_WORDS)
+            words.append(word)
+            length += len(word) + 1
+        return " ".join(words)
+
+
+class ReplayBiddingService(BiddingService):
+    """Bidding API stand-in"""
+
+    async def update_bidding_checklist(self, bidding_id: str, checklist) -> bool:
+        """Accept every update"""
+        await asyncio.sleep(0)
+        return True
+
+
+class ReplayRunner:
+    """Dispatch recorded messages at N× speed and measure latency"""
+
+    def __init__(self, messages: List[RecordedMessage], speed: float, workers: int, bandwidth_mbps: float):
+        self.messages = messages
+        self.speed = speed
+        self.workers = workers
+        self.session = ReplaySession(messages)
+
+        self.processor = MessageProcessor()
+        self.processor.s3_service = ReplayS3Service(self.session, bandwidth_mbps)
+        self.processor.pdf_service = ReplayPDFProcessingService(self.session)
+        self.processor.bidding_service = ReplayBiddingService()
+        self.processor.update_dispatcher = ChecklistUpdateDispatcher(self.processor.bidding_service)
+        self.processor.result_store = ChecklistResultStore(enabled=False)
+
+        self._lock = threading.Lock()
+        self.latencies: List[float] = []
+        self.service_times: List[float] = []
+        self.succeeded = 0
+        self.failed = 0
+
+    def run(self) -> Dict[str, Any]:
+        """Replay every message and return the report"""
+        if not self.messages:
+            return {"messages": 0}
+
+        first_ts = self.messages[0].ts
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for message in self.messages:
+                arrival = start + (message.ts - first_ts) / self.speed
+                delay = arrival - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                executor.submit(self._replay_message, message, arrival)
+        elapsed = time.monotonic() - start
+
+        return {
+            "messages": len(self.messages),
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "speed": self.speed,
+            "workers": self.workers,
+            "elapsed_seconds": round(elapsed, 2),
+            "messages_per_minute": round(len(self.messages) / elapsed * 60, 2) if elapsed else 0.0,
+            "latency_seconds": self._distribution(self.latencies),
+            "service_time_seconds": self._distribution(self.service_times),
+        }
+
+    def _replay_message(self, message: RecordedMessage, arrival: float) -> None:
+        """Run one recorded message through the processor"""
+        self.session.bind(message)
+        started = time.monotonic()
+        try:
+            body = json.loads(message.body)
+        except (json.JSONDecodeError, TypeError):
+            body = {"message": message.body, "type": "text"}
+
+        try:
+            success = self.processor.process_message(body)
+        except Exception as e:
+            logger.error(f"Erro ao reproduzir mensagem {message.message_id}: {e}")
+            success = False
+
+        finished = time.monotonic()
+        with self._lock:
+            self.latencies.append(finished - arrival)
+            self.service_times.append(finished - started)
+            if success:
+                self.succeeded += 1
+            else:
+                self.failed += 1
+
+    def _distribution(self, values: List[float]) -> Dict[str, float]:
+        """Percentile summary"""
+        return {
+            "p50": round(percentile(values, 50), 3),
+            "p95": round(percentile(values, 95), 3),
+            "p99": round(percentile(values, 99), 3),
+            "max": round(max(values), 3) if values else 0.0,
+        }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Reprodução de tráfego gravado do consumer")
+    parser.add_argument("recording", help="Arquivo gravado com TRAFFIC_RECORD_PATH (.jsonl.gz)")
+    parser.add_argument("--speed", type=float, default=1.0, help="Multiplicador da taxa de chegada")
+    parser.add_argument("--workers", type=int, default=4, help="Mensagens processadas em paralelo")
+    parser.add_argument("--bandwidth-mbps", type=float, default=0.0, help="Banda simulada do S3 (0 = instantâneo)")
+    parser.add_argument("--limit", type=int, default=None, help="Número máximo de mensagens")
+    args = parser.parse_args(argv)
+
+    setup_logging()
+    logging.getLogger("app").setLevel(logging.WARNING)
+
+    messages = load_recording(args.recording)
+    if args.limit:
+        messages = messages[:args.limit]
+    logger.warning(f"Reproduzindo {len(messages)} mensagens a {args.speed}x com {args.workers} workers")
+
+    report = ReplayRunner(messages, args.speed, args.workers, args.bandwidth_mbps).run()
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
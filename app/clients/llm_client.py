@@ -2,10 +2,41 @@
 OpenRouter LLM Client configuration
 Provides access to multiple LLM models through OpenRouter API
 """
+import time
+import logging
+import threading
 from openai import OpenAI  # Mudança aqui
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Iterator
 from enum import Enum
-from app.config.config import OPENROUTER_API_KEY, OPENROUTER_BASE_URL, LLM_MODELS, DEFAULT_LLM_MODEL
+from app.config.config import (
+    OPENROUTER_API_KEY,
+    OPENROUTER_BASE_URL,
+    LLM_MODELS,
+    DEFAULT_LLM_MODEL,
+    LLM_MAX_RETRIES,
+    LLM_FALLBACK_ENABLED,
+    LLM_SLOT_WAIT_SECONDS,
+    LLM_STRUCTURED_OUTPUT_MODELS,
+    LLM_REQUEST_TIMEOUT_SECONDS,
+)
+from app.config.exceptions import AIServiceError, DeadlineExceeded
+from app.services.deadline import Deadline
+from app.services.token_estimator import token_estimator
+from app.models.llm_models import LLMResponse
+from app.services.model_router_service import model_router
+from app.services.traffic_recorder import traffic_recorder
+from app.clients.llm_resilience import (
+    AdaptiveConcurrencyLimiter,
+    CircuitBreaker,
+    ConcurrencySlotTimeout,
+    MalformedResponseError,
+    is_retryable_error,
+    get_status_code,
+    parse_retry_after,
+    backoff_delay,
+)
+
+logger = logging.getLogger(__name__)
 
 
 class LLMModel(Enum):
@@ -26,7 +57,9 @@ class OpenRouterClient:
         if cls._instance is None:
             cls._instance = OpenAI(  # Mudança aqui - removido 'openai.'
                 api_key=OPENROUTER_API_KEY,
-                base_url=OPENROUTER_BASE_URL
+                base_url=OPENROUTER_BASE_URL,
+                max_retries=0,  # Retries are handled by LLMService
+                timeout=LLM_REQUEST_TIMEOUT_SECONDS
             )
         return cls._instance
     
@@ -51,6 +84,12 @@ class LLMService:
     
     def __init__(self):
         self.client = OpenRouterClient.get_client()
+        self.limiters: Dict[str, AdaptiveConcurrencyLimiter] = {
+            model: AdaptiveConcurrencyLimiter(model) for model in LLM_MODELS
+        }
+        self.breakers: Dict[str, CircuitBreaker] = {
+            model: CircuitBreaker(model) for model in LLM_MODELS
+        }
     
     def generate_completion(
         self, 
@@ -59,23 +98,271 @@ class LLMService:
         max_tokens: int = 4000,
         temperature: float = 0.1
     ) -> Optional[str]:
-        """Generate completion using specified model"""
+        """Generate completion using specified model, with retries and fallback"""
+        return self.generate(prompt, model, max_tokens, temperature).content
+    
+    def generate(
+        self, 
+        prompt: str, 
+        model: str = DEFAULT_LLM_MODEL,
+        max_tokens: int = 4000,
+        temperature: float = 0.1,
+        json_schema: Optional[Dict[str, Any]] = None,
+        deadline: Optional[Deadline] = None
+    ) -> LLMResponse:
+        """Generate completion returning content, model actually used and token usage
+        
+        json_schema is sent as structured output only to models listed in
+        LLM_STRUCTURED_OUTPUT_MODELS; other models rely on the prompt alone.
+        Each request's timeout is capped by the deadline's remaining budget and
+        retries stop with DeadlineExceeded once it runs out.
+        """
+        if model not in LLM_MODELS:
+            model = DEFAULT_LLM_MODEL
+        deadline = deadline or Deadline.unbounded()
+        
+        candidates = self._get_candidate_models(model)
+        last_error: Optional[Exception] = None
+        previous_model: Optional[str] = None
+        delay = 0.0
+        
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            deadline.check("llm")
+            current_model = self._select_model(candidates)
+            if current_model is None:
+                # Every breaker is open: wait for the earliest one to half-open
+                wait = min(self.breakers[name].seconds_until_retry() for name in candidates)
+                logger.warning(f"Todos os modelos indisponíveis, aguardando {wait:.1f}s")
+                self._sleep(max(wait, delay), deadline)
+                current_model = self._select_model(candidates)
+                if current_model is None:
+                    continue
+            elif current_model == previous_model and delay:
+                self._sleep(delay, deadline)
+            
+            if current_model != model:
+                logger.info(f"Roteando requisição de {model} para {current_model}")
+            
+            try:
+                response = self._call_model(current_model, prompt, max_tokens, temperature, json_schema, deadline)
+                traffic_recorder.record_llm(
+                    response.model,
+                    response.latency_seconds,
+                    len(prompt),
+                    response.content,
+                    response.prompt_tokens,
+                    response.completion_tokens
+                )
+                token_estimator.observe(response.model, prompt, response.prompt_tokens)
+                return response
+            except DeadlineExceeded:
+                raise
+            except Exception as e:
+                last_error = e
+                if not is_retryable_error(e):
+                    raise AIServiceError(f"Erro ao gerar completion com modelo {current_model}: {e}") from e
+                
+                retry_after = parse_retry_after(e)
+                delay = backoff_delay(attempt, retry_after)
+                previous_model = current_model
+                logger.warning(
+                    f"Erro transitório no modelo {current_model} (status {get_status_code(e)}), "
+                    f"tentativa {attempt + 1}/{LLM_MAX_RETRIES + 1}: {e}"
+                )
+        
+        raise AIServiceError(f"Erro ao gerar completion com modelo {model}: {last_error}")
+    
+    def _sleep(self, seconds: float, deadline: Deadline) -> None:
+        """Back off between attempts, giving up if the wait would outlast the deadline"""
+        remaining = deadline.remaining()
+        if remaining is not None and seconds >= remaining:
+            raise DeadlineExceeded("llm", f"Prazo esgotaria durante espera de {seconds:.1f}s entre tentativas")
+        time.sleep(seconds)
+    
+    def stream_completion(
+        self, 
+        prompt: str, 
+        model: str = DEFAULT_LLM_MODEL,
+        max_tokens: int = 4000,
+        temperature: float = 0.1
+    ) -> Iterator[str]:
+        """Stream completion tokens from the first available model (no mid-stream retries)
+
+        The model slot is held until the generator finishes or is closed;
+        callers that may stop early must close it (see close_stream).
+        """
+        if model not in LLM_MODELS:
+            model = DEFAULT_LLM_MODEL
+        
+        current_model = self._select_model(self._get_candidate_models(model))
+        if current_model is None:
+            raise AIServiceError("Nenhum modelo disponível no momento")
+        
+        limiter = self.limiters[current_model]
+        breaker = self.breakers[current_model]
+        if not limiter.acquire(timeout=LLM_SLOT_WAIT_SECONDS):
+            breaker.release_probe()
+            raise ConcurrencySlotTimeout(f"Tempo esgotado aguardando vaga de concorrência para {current_model}")
+        
+        start = time.monotonic()
+        rate_limited = False
+        success = False
+        cancelled = False
+        stream = None
         try:
-            model_name = OpenRouterClient.get_model_name(model)
+            stream = self.client.chat.completions.create(
+                model=OpenRouterClient.get_model_name(current_model),
+                messages=[
+                    {"role": "user", "content": prompt}
+                ],
+                max_tokens=max_tokens,
+                temperature=temperature,
+                stream=True
+            )
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                token = chunk.choices[0].delta.content
+                if token:
+                    yield token
+            success = True
             
+        except GeneratorExit:
+            # Client went away mid-stream; says nothing about provider health
+            cancelled = True
+            raise
+        
+        except Exception as e:
+            rate_limited = get_status_code(e) == 429
+            if is_retryable_error(e):
+                breaker.record_failure(parse_retry_after(e))
+            raise AIServiceError(f"Erro ao gerar completion com modelo {current_model}: {e}") from e
+        
+        finally:
+            latency = time.monotonic() - start
+            if stream is not None and hasattr(stream, "close"):
+                # Give the provider connection back instead of leaving it half-read
+                try:
+                    stream.close()
+                except Exception as e:
+                    logger.warning(f"Erro ao fechar stream do modelo {current_model}: {e}")
+            limiter.release(latency=latency if success else None, rate_limited=rate_limited)
+            if not cancelled:
+                model_router.record_call(current_model, latency, success=success)
+            if success:
+                breaker.record_success()
+            else:
+                breaker.release_probe()
+    
+    def close_stream(self, tokens: Iterator[str]) -> None:
+        """Close a stream_completion generator now, or once a next() still running on a worker thread returns"""
+        try:
+            tokens.close()
+        except ValueError:
+            # "generator already executing": wait for the pending token off the event loop
+            threading.Thread(target=self._close_when_idle, args=(tokens,), daemon=True).start()
+    
+    def _close_when_idle(self, tokens: Iterator[str]) -> None:
+        """Retry closing a generator until no other thread is running it"""
+        while True:
+            try:
+                tokens.close()
+                return
+            except ValueError:
+                time.sleep(0.05)
+    
+    def _get_candidate_models(self, model: str) -> List[str]:
+        """Requested model first, followed by the fallback order in LLM_MODELS"""
+        if not LLM_FALLBACK_ENABLED:
+            return [model]
+        return [model] + [name for name in LLM_MODELS if name != model]
+    
+    def _select_model(self, candidates: List[str]) -> Optional[str]:
+        """First candidate whose circuit breaker allows a request"""
+        for name in candidates:
+            if self.breakers[name].allow_request():
+                return name
+        return None
+    
+    def _call_model(
+        self,
+        model: str,
+        prompt: str,
+        max_tokens: int,
+        temperature: float,
+        json_schema: Optional[Dict[str, Any]] = None,
+        deadline: Optional[Deadline] = None
+    ) -> LLMResponse:
+        """Single completion call guarded by the model's limiter and breaker"""
+        deadline = deadline or Deadline.unbounded()
+        extra_args: Dict[str, Any] = {}
+        if json_schema and model in LLM_STRUCTURED_OUTPUT_MODELS:
+            extra_args["response_format"] = {"type": "json_schema", "json_schema": json_schema}
+        
+        limiter = self.limiters[model]
+        breaker = self.breakers[model]
+        
+        try:
+            slot_timeout = deadline.timeout("llm", cap=LLM_SLOT_WAIT_SECONDS)
+        except DeadlineExceeded:
+            breaker.release_probe()
+            raise
+        
+        if not limiter.acquire(timeout=slot_timeout):
+            breaker.release_probe()
+            raise ConcurrencySlotTimeout(f"Tempo esgotado aguardando vaga de concorrência para {model}")
+        
+        start = time.monotonic()
+        try:
             response = self.client.chat.completions.create(
-                model=model_name,
+                model=OpenRouterClient.get_model_name(model),
                 messages=[
                     {"role": "user", "content": prompt}
                 ],
                 max_tokens=max_tokens,
-                temperature=temperature
+                temperature=temperature,
+                timeout=deadline.timeout("llm", cap=LLM_REQUEST_TIMEOUT_SECONDS),
+                **extra_args
             )
-            
-            return response.choices[0].message.content
-            
+            usage = getattr(response, "usage", None)
+            try:
+                content = response.choices[0].message.content
+            except (IndexError, AttributeError, TypeError) as e:
+                # An empty or malformed body counts against the model like any other failure
+                raise MalformedResponseError(f"Resposta malformada do modelo {model}: {e}") from e
         except Exception as e:
-            raise RuntimeError(f"Erro ao gerar completion com modelo {model}: {e}")
+            rate_limited = get_status_code(e) == 429
+            limiter.release(rate_limited=rate_limited)
+            model_router.record_call(model, time.monotonic() - start, success=False)
+            if is_retryable_error(e):
+                breaker.record_failure(parse_retry_after(e))
+            else:
+                breaker.release_probe()
+            raise
+        
+        latency = time.monotonic() - start
+        limiter.release(latency=latency)
+        breaker.record_success()
+        model_router.record_call(model, latency, success=True)
+        
+        return LLMResponse(
+            content=content,
+            model=model,
+            tokens_used=getattr(usage, "total_tokens", None),
+            prompt_tokens=getattr(usage, "prompt_tokens", None),
+            completion_tokens=getattr(usage, "completion_tokens", None),
+            latency_seconds=latency
+        )
+    
+    def get_resilience_status(self) -> Dict[str, Any]:
+        """Limiter and breaker state per model"""
+        return {
+            name: {
+                "concurrency": self.limiters[name].snapshot(),
+                "circuit_breaker": self.breakers[name].snapshot(),
+            }
+            for name in LLM_MODELS
+        }
 
 
 # Global instances for easy import
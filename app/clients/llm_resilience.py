@@ -0,0 +1,216 @@
+"""
+Resilience primitives for LLM calls
+Adaptive (AIMD) concurrency limiting, circuit breaking and Retry-After parsing
+"""
+import time
+import random
+import logging
+import threading
+from email.utils import parsedate_to_datetime
+from typing import Optional, Dict, Any
+from app.config.exceptions import AIServiceError
+from app.config.config import (
+    LLM_INITIAL_CONCURRENCY,
+    LLM_MAX_CONCURRENCY,
+    LLM_LATENCY_TARGET_SECONDS,
+    LLM_BREAKER_FAILURE_THRESHOLD,
+    LLM_BREAKER_COOLDOWN_SECONDS,
+    LLM_RETRY_BASE_DELAY_SECONDS,
+    LLM_RETRY_MAX_DELAY_SECONDS,
+)
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS_CODES = {408, 409, 425, 429, 500, 502, 503, 504}
+
+
+class ConcurrencySlotTimeout(AIServiceError):
+    """Raised when no concurrency slot frees up for a model in time"""
+    pass
+
+
+class MalformedResponseError(AIServiceError):
+    """Raised when a completion has no choices or message; retried and falls back like a 5xx"""
+    pass
+
+
+class AdaptiveConcurrencyLimiter:
+    """Per-model concurrency limit adjusted with AIMD on 429s and latency"""
+
+    def __init__(
+        self,
+        name: str,
+        initial_limit: float = LLM_INITIAL_CONCURRENCY,
+        max_limit: float = LLM_MAX_CONCURRENCY,
+        latency_target: float = LLM_LATENCY_TARGET_SECONDS,
+        min_limit: float = 1.0,
+    ):
+        self.name = name
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = float(max_limit)
+        self.latency_target = latency_target
+        self.in_flight = 0
+        self._condition = threading.Condition()
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """Wait for a free slot; returns False on timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+            self.in_flight += 1
+            return True
+
+    def release(self, latency: Optional[float] = None, rate_limited: bool = False) -> None:
+        """Release a slot and adapt the limit to the observed outcome"""
+        with self._condition:
+            self.in_flight = max(0, self.in_flight - 1)
+
+            if rate_limited:
+                self.limit = max(self.min_limit, self.limit / 2)
+                logger.warning(f"Limite de concorrência de {self.name} reduzido para {self.limit:.2f} (429)")
+            elif latency is not None and latency > self.latency_target:
+                self.limit = max(self.min_limit, self.limit * 0.9)
+            elif latency is not None:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+            self._condition.notify_all()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Current limiter state"""
+        with self._condition:
+            return {"limit": round(self.limit, 2), "in_flight": self.in_flight}
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker with half-open probing"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = LLM_BREAKER_FAILURE_THRESHOLD,
+        cooldown_seconds: float = LLM_BREAKER_COOLDOWN_SECONDS,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.state = self.CLOSED
+        self.failures = 0
+        self.open_until = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow_request(self) -> bool:
+        """Check whether a request may be sent to this model now"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() >= self.open_until:
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self.state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        """Close the breaker after a successful call"""
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info(f"Circuit breaker de {self.name} fechado")
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probe_in_flight = False
+
+    def release_probe(self) -> None:
+        """Give back a half-open probe whose outcome says nothing about health"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_failure(self, retry_after: Optional[float] = None) -> None:
+        """Count a failure, tripping the breaker when the threshold is reached"""
+        with self._lock:
+            self.failures += 1
+            self._probe_in_flight = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                cooldown = max(self.cooldown_seconds, retry_after or 0)
+                self.state = self.OPEN
+                self.open_until = time.monotonic() + cooldown
+                logger.warning(f"Circuit breaker de {self.name} aberto por {cooldown:.1f}s")
+
+    def seconds_until_retry(self) -> float:
+        """Seconds until an open breaker lets a probe through"""
+        with self._lock:
+            if self.state != self.OPEN:
+                return 0.0
+            return max(0.0, self.open_until - time.monotonic())
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Current breaker state"""
+        with self._lock:
+            return {"state": self.state, "failures": self.failures}
+
+
+def get_status_code(error: Exception) -> Optional[int]:
+    """Extract HTTP status code from an OpenAI client error"""
+    status = getattr(error, "status_code", None)
+    if status is None:
+        response = getattr(error, "response", None)
+        status = getattr(response, "status_code", None)
+    return status
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """Check whether an error is transient (rate limit, 5xx, timeout, connection)"""
+    if isinstance(error, (ConcurrencySlotTimeout, MalformedResponseError)):
+        return True
+    status = get_status_code(error)
+    if status is not None:
+        return status in RETRYABLE_STATUS_CODES
+    # Timeouts and connection errors carry no status code
+    return type(error).__name__ in ("APITimeoutError", "APIConnectionError", "TimeoutException")
+
+
+def parse_retry_after(error: Exception) -> Optional[float]:
+    """Read the provider's Retry-After hint (seconds) from an error response"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+
+    try:
+        retry_after_ms = headers.get("retry-after-ms")
+        if retry_after_ms:
+            return max(0.0, float(retry_after_ms) / 1000)
+
+        retry_after = headers.get("retry-after")
+        if retry_after:
+            try:
+                return max(0.0, float(retry_after))
+            except ValueError:
+                return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+
+        # OpenRouter reports the rate limit window reset as epoch milliseconds
+        reset = headers.get("x-ratelimit-reset")
+        if reset and get_status_code(error) == 429:
+            return max(0.0, float(reset) / 1000 - time.time())
+    except (TypeError, ValueError):
+        return None
+
+    return None
+
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    """Delay before the next attempt, honoring Retry-After when present"""
+    if retry_after is not None:
+        return min(retry_after, LLM_RETRY_MAX_DELAY_SECONDS)
+    delay = LLM_RETRY_BASE_DELAY_SECONDS * (2 ** attempt)
+    return min(LLM_RETRY_MAX_DELAY_SECONDS, delay) * random.uniform(0.5, 1.0)
@@ -2,8 +2,15 @@
 AWS S3 Client configuration and factory
 """
 import boto3
+from botocore.config import Config
 from typing import Optional
-from app.config.config import AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY, AWS_REGION
+from app.config.config import (
+    AWS_ACCESS_KEY_ID,
+    AWS_SECRET_ACCESS_KEY,
+    AWS_REGION,
+    S3_MAX_POOL_CONNECTIONS,
+    S3_READ_TIMEOUT_SECONDS,
+)
 
 
 class S3Client:
@@ -19,7 +26,13 @@ class S3Client:
                 's3',
                 region_name=AWS_REGION,
                 aws_access_key_id=AWS_ACCESS_KEY_ID,
-                aws_secret_access_key=AWS_SECRET_ACCESS_KEY
+                aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
+                # Ranged downloads share this client across threads; a stalled
+                # socket fails after the read timeout so deadlines can be enforced
+                config=Config(
+                    max_pool_connections=S3_MAX_POOL_CONNECTIONS,
+                    read_timeout=S3_READ_TIMEOUT_SECONDS
+                )
             )
         return cls._instance
     
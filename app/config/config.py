@@ -13,6 +13,28 @@ AWS_ACCESS_KEY_ID = os.getenv("AWS_ACCESS_KEY")
 AWS_SECRET_ACCESS_KEY = os.getenv("AWS_SECRET_KEY")
 AWS_REGION = os.getenv("AWS_REGION", "us-east-1")
 SQS_QUEUE_URL = os.getenv("SQS_QUEUE_URL")
+# Priority lanes, one queue each: "interactive=https://sqs.../urgent,bulk=https://sqs.../backfill"
+# Empty means a single "default" lane reading SQS_QUEUE_URL
+SQS_LANE_QUEUES = {
+    name.strip(): url.strip()
+    for name, url in (
+        item.split("=", 1) for item in os.getenv("SQS_LANE_QUEUES", "").split(",") if "=" in item
+    )
+} or {"default": SQS_QUEUE_URL}
+# Share of free worker slots per lane when several have messages: "interactive=8,bulk=1" (default 1)
+SQS_LANE_WEIGHTS = {
+    name.strip(): int(weight)
+    for name, weight in (
+        item.split("=") for item in os.getenv("SQS_LANE_WEIGHTS", "").split(",") if "=" in item
+    )
+}
+# Worker slots a lane may hold at once, keeping the rest for other lanes: "bulk=3"
+SQS_LANE_MAX_IN_FLIGHT = {
+    name.strip(): int(limit)
+    for name, limit in (
+        item.split("=") for item in os.getenv("SQS_LANE_MAX_IN_FLIGHT", "").split(",") if "=" in item
+    )
+}
 AWS_S3_BUCKET = os.getenv("AWS_S3_BUCKET")
 
 # AI Configuration
@@ -22,6 +44,30 @@ OPENROUTER_BASE_URL = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/ap
 # Bidding API Configuration
 BIDDING_API_BASE_URL = os.getenv("BIDDING_API_BASE_URL", "http://localhost:8080")
 BIDDING_API_TIMEOUT = int(os.getenv("BIDDING_API_TIMEOUT", "30"))
+# Updates for an idle bidding are sent at once; later ones wait for the request in flight and
+# at least the window after it, and are coalesced. Unchanged checklists are not re-sent
+BIDDING_UPDATE_COALESCING_ENABLED = os.getenv("BIDDING_UPDATE_COALESCING_ENABLED", "true").lower() == "true"
+BIDDING_UPDATE_WINDOW_SECONDS = float(os.getenv("BIDDING_UPDATE_WINDOW_SECONDS", "2"))
+BIDDING_UPDATE_WORKERS = int(os.getenv("BIDDING_UPDATE_WORKERS", "4"))
+
+# Traffic recording for replay load tests (empty disables)
+TRAFFIC_RECORD_PATH = os.getenv("TRAFFIC_RECORD_PATH", "")
+
+# Result Store Configuration
+RESULT_STORE_ENABLED = os.getenv("RESULT_STORE_ENABLED", "true").lower() == "true"
+RESULT_STORE_PATH = os.getenv("RESULT_STORE_PATH", "checklists.db")
+
+# Near-duplicate reuse (SimHash index of processed editais); opt-in
+SIMILARITY_REUSE_ENABLED = os.getenv("SIMILARITY_REUSE_ENABLED", "false").lower() == "true"
+# Share of equal fingerprint bits (0-1) needed to reuse a stored checklist
+SIMILARITY_THRESHOLD = float(os.getenv("SIMILARITY_THRESHOLD", "0.95"))
+# Send only the changed requirement passages to the LLM instead of reprocessing everything
+SIMILARITY_VERIFY_CHANGES = os.getenv("SIMILARITY_VERIFY_CHANGES", "true").lower() == "true"
+SIMILARITY_INDEX_PATH = os.getenv("SIMILARITY_INDEX_PATH", RESULT_STORE_PATH)
+
+# Corpus of extracted page text for re-running prompts offline (directory)
+CORPUS_STORE_ENABLED = os.getenv("CORPUS_STORE_ENABLED", "false").lower() == "true"
+CORPUS_STORE_PATH = os.getenv("CORPUS_STORE_PATH", "corpus")
 
 # Available LLM Models
 LLM_MODELS = {
@@ -30,13 +76,167 @@ LLM_MODELS = {
     "dolphin": "cognitivecomputations/dolphin3.0-r1-mistral-24b:free"
 }
 
+# Cost per million tokens (USD); the :free variants cost nothing
+LLM_MODEL_COSTS = {
+    "gemma": 0.0,
+    "deepseek": 0.0,
+    "dolphin": 0.0
+}
+
+# Context window per model (tokens, prompt + completion) from the provider's model pages
+# Override with "gemma=8192,deepseek=163840,dolphin=32768"
+LLM_MODEL_CONTEXT_TOKENS = {
+    "gemma": 8192,
+    "deepseek": 163840,
+    "dolphin": 32768,
+    **{
+        name.strip(): int(tokens)
+        for name, tokens in (
+            item.split("=") for item in os.getenv("LLM_MODEL_CONTEXT_TOKENS", "").split(",") if "=" in item
+        )
+    }
+}
+
 # Default model
 DEFAULT_LLM_MODEL = "dolphin"
 
+# Completion tokens reserved for the checklist JSON
+LLM_MAX_OUTPUT_TOKENS = int(os.getenv("LLM_MAX_OUTPUT_TOKENS", "4000"))
+
+# Micro-batching: small documents from concurrent workers share one LLM call
+LLM_BATCH_ENABLED = os.getenv("LLM_BATCH_ENABLED", "false").lower() == "true"
+LLM_BATCH_WINDOW_SECONDS = float(os.getenv("LLM_BATCH_WINDOW_SECONDS", "2"))
+LLM_BATCH_MAX_DOCUMENTS = int(os.getenv("LLM_BATCH_MAX_DOCUMENTS", "5"))
+# Documents above this size are always sent alone
+LLM_BATCH_MAX_DOCUMENT_TOKENS = int(os.getenv("LLM_BATCH_MAX_DOCUMENT_TOKENS", "2000"))
+# Document tokens per batched call, and completion tokens reserved per document
+LLM_BATCH_TOKEN_BUDGET = int(os.getenv("LLM_BATCH_TOKEN_BUDGET", "8000"))
+LLM_BATCH_OUTPUT_TOKENS_PER_DOCUMENT = int(os.getenv("LLM_BATCH_OUTPUT_TOKENS_PER_DOCUMENT", "1500"))
+
+# Token preflight (picks single-shot, filtered or chunked processing and the model)
+PREFLIGHT_ENABLED = os.getenv("PREFLIGHT_ENABLED", "true").lower() == "true"
+# Share of the context window kept free for estimation error
+PREFLIGHT_CONTEXT_MARGIN = float(os.getenv("PREFLIGHT_CONTEXT_MARGIN", "0.1"))
+
+# Models that accept response_format json_schema (comma-separated keys of LLM_MODELS)
+LLM_STRUCTURED_OUTPUT_MODELS = [
+    name.strip() for name in os.getenv("LLM_STRUCTURED_OUTPUT_MODELS", "").split(",") if name.strip()
+]
+
+# Model Routing Configuration
+# Policies: static (always DEFAULT_LLM_MODEL), fastest, cheapest_slo, weighted
+MODEL_ROUTING_POLICY = os.getenv("MODEL_ROUTING_POLICY", "static")
+MODEL_ROUTER_WINDOW = int(os.getenv("MODEL_ROUTER_WINDOW", "50"))
+MODEL_ROUTER_MIN_SAMPLES = int(os.getenv("MODEL_ROUTER_MIN_SAMPLES", "5"))
+MODEL_ROUTER_MAX_ERROR_RATE = float(os.getenv("MODEL_ROUTER_MAX_ERROR_RATE", "0.5"))
+MODEL_ROUTER_MIN_JSON_RATE = float(os.getenv("MODEL_ROUTER_MIN_JSON_RATE", "0.7"))
+MODEL_ROUTER_SLO_P95_SECONDS = float(os.getenv("MODEL_ROUTER_SLO_P95_SECONDS", "90"))
+MODEL_ROUTER_EXPLORE_RATE = float(os.getenv("MODEL_ROUTER_EXPLORE_RATE", "0.05"))
+# Format: "gemma=1,deepseek=1,dolphin=2"
+MODEL_ROUTER_WEIGHTS = {
+    name.strip(): float(weight)
+    for name, weight in (
+        item.split("=") for item in os.getenv("MODEL_ROUTER_WEIGHTS", "").split(",") if "=" in item
+    )
+}
+
+# Admission control for the HTTP API: concurrent requests per path prefix (longest prefix wins)
+ADMISSION_CONTROL_ENABLED = os.getenv("ADMISSION_CONTROL_ENABLED", "true").lower() == "true"
+ADMISSION_ROUTE_LIMITS = {
+    prefix.strip(): int(limit)
+    for prefix, limit in (
+        item.split("=") for item in os.getenv(
+            "ADMISSION_ROUTE_LIMITS", "/api/v1/test-llm=4,/api/v1/checklists=8"
+        ).split(",") if "=" in item
+    )
+}
+# Requests allowed to wait for a slot per route (beyond it: 429), and for how long (beyond it: 503)
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "8"))
+ADMISSION_ROUTE_QUEUE_SIZES = {
+    prefix.strip(): int(size)
+    for prefix, size in (
+        item.split("=") for item in os.getenv("ADMISSION_ROUTE_QUEUE_SIZES", "").split(",") if "=" in item
+    )
+}
+ADMISSION_QUEUE_TIMEOUT_SECONDS = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_SECONDS", "5"))
+# Paths never limited (exact match)
+ADMISSION_EXEMPT_PATHS = [
+    path.strip() for path in os.getenv("ADMISSION_EXEMPT_PATHS", "/health").split(",") if path.strip()
+]
+
+# LLM Resilience Configuration
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_FALLBACK_ENABLED = os.getenv("LLM_FALLBACK_ENABLED", "true").lower() == "true"
+LLM_INITIAL_CONCURRENCY = float(os.getenv("LLM_INITIAL_CONCURRENCY", "2"))
+LLM_MAX_CONCURRENCY = float(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_LATENCY_TARGET_SECONDS = float(os.getenv("LLM_LATENCY_TARGET_SECONDS", "60"))
+LLM_SLOT_WAIT_SECONDS = float(os.getenv("LLM_SLOT_WAIT_SECONDS", "120"))
+# Per-request HTTP timeout; also capped by the message deadline
+LLM_REQUEST_TIMEOUT_SECONDS = float(os.getenv("LLM_REQUEST_TIMEOUT_SECONDS", "120"))
+LLM_BREAKER_FAILURE_THRESHOLD = int(os.getenv("LLM_BREAKER_FAILURE_THRESHOLD", "3"))
+LLM_BREAKER_COOLDOWN_SECONDS = float(os.getenv("LLM_BREAKER_COOLDOWN_SECONDS", "30"))
+LLM_RETRY_BASE_DELAY_SECONDS = float(os.getenv("LLM_RETRY_BASE_DELAY_SECONDS", "2"))
+LLM_RETRY_MAX_DELAY_SECONDS = float(os.getenv("LLM_RETRY_MAX_DELAY_SECONDS", "60"))
+
 # Application Configuration
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
 MAX_MESSAGES_PER_POLL = int(os.getenv("MAX_MESSAGES_PER_POLL", "1"))
 POLL_WAIT_TIME = int(os.getenv("POLL_WAIT_TIME", "10"))
+QUEUE_STATS_TTL_SECONDS = float(os.getenv("QUEUE_STATS_TTL_SECONDS", "30"))
+CONSUMER_MAX_WORKERS = int(os.getenv("CONSUMER_MAX_WORKERS", "1"))
+# Files of a multi-file message downloaded and processed in parallel
+MESSAGE_FILE_CONCURRENCY = int(os.getenv("MESSAGE_FILE_CONCURRENCY", "4"))
+SHUTDOWN_DRAIN_TIMEOUT_SECONDS = float(os.getenv("SHUTDOWN_DRAIN_TIMEOUT_SECONDS", "120"))
+# Per-source token bucket ("source" message attribute or body field); 0 disables.
+# Messages over the rate are held locally (up to SOURCE_DEFER_HOLD_MAX per lane) or
+# made invisible again until the source has tokens
+SOURCE_RATE_PER_MINUTE = float(os.getenv("SOURCE_RATE_PER_MINUTE", "30"))
+SOURCE_BURST = int(os.getenv("SOURCE_BURST", "10"))
+SOURCE_DEFER_MAX_SECONDS = int(os.getenv("SOURCE_DEFER_MAX_SECONDS", "300"))
+SOURCE_DEFER_HOLD_MAX = int(os.getenv("SOURCE_DEFER_HOLD_MAX", "50"))
+# Visibility timeout kept alive for buffered and held messages (0 reads it from the queue)
+SQS_VISIBILITY_TIMEOUT_SECONDS = int(os.getenv("SQS_VISIBILITY_TIMEOUT_SECONDS", "0"))
+# End-to-end budget per message (download, extraction, LLM and PATCH); keep it
+# below the queue's visibility timeout. A message may override it with "deadline_seconds"
+MESSAGE_DEADLINE_SECONDS = float(os.getenv("MESSAGE_DEADLINE_SECONDS", "600"))
+
+# Document pre-classifier (skips the LLM for scanned or non-edital documents)
+CLASSIFIER_ENABLED = os.getenv("CLASSIFIER_ENABLED", "true").lower() == "true"
+CLASSIFIER_MIN_CHARS_PER_PAGE = int(os.getenv("CLASSIFIER_MIN_CHARS_PER_PAGE", "100"))
+CLASSIFIER_MIN_SCORE = int(os.getenv("CLASSIFIER_MIN_SCORE", "6"))
+
+# Rule-based detection of standard habilitação documents; the LLM only looks for the rest
+RULE_FAST_PATH_ENABLED = os.getenv("RULE_FAST_PATH_ENABLED", "true").lower() == "true"
+
+# PDF text extraction backend: pypdf2 | pymupdf | pypdfium2 | pdfplumber
+PDF_EXTRACTION_BACKEND = os.getenv("PDF_EXTRACTION_BACKEND", "pypdf2")
+
+# Memory Configuration
+# Objects above this size are spooled to disk and memory-mapped
+JOB_MEMORY_CEILING_MB = int(os.getenv("JOB_MEMORY_CEILING_MB", "32"))
+# Extracted text kept per PDF, in characters; pages past it are dropped with a warning
+EXTRACTED_TEXT_MAX_CHARS = int(os.getenv("EXTRACTED_TEXT_MAX_CHARS", "8000000"))
+S3_DOWNLOAD_CHUNK_SIZE_KB = int(os.getenv("S3_DOWNLOAD_CHUNK_SIZE_KB", "1024"))
+
+# Memory accounting per job and stage (reported under "memory" in /consumer/status)
+MEMORY_PROFILING_ENABLED = os.getenv("MEMORY_PROFILING_ENABLED", "false").lower() == "true"
+MEMORY_SAMPLE_INTERVAL_SECONDS = float(os.getenv("MEMORY_SAMPLE_INTERVAL_SECONDS", "0.5"))
+# Diff tracemalloc snapshots every N finished jobs (0 disables; tracing slows allocations)
+MEMORY_TRACEMALLOC_EVERY_JOBS = int(os.getenv("MEMORY_TRACEMALLOC_EVERY_JOBS", "0"))
+MEMORY_TRACEMALLOC_TOP = int(os.getenv("MEMORY_TRACEMALLOC_TOP", "10"))
+
+# Parallel ranged S3 downloads
+S3_RANGED_GET_ENABLED = os.getenv("S3_RANGED_GET_ENABLED", "false").lower() == "true"
+S3_RANGED_GET_THRESHOLD_MB = int(os.getenv("S3_RANGED_GET_THRESHOLD_MB", "16"))
+S3_RANGED_GET_PART_SIZE_MB = int(os.getenv("S3_RANGED_GET_PART_SIZE_MB", "8"))
+S3_RANGED_GET_CONCURRENCY = int(os.getenv("S3_RANGED_GET_CONCURRENCY", "8"))
+S3_MAX_POOL_CONNECTIONS = int(os.getenv("S3_MAX_POOL_CONNECTIONS", "32"))
+S3_READ_TIMEOUT_SECONDS = float(os.getenv("S3_READ_TIMEOUT_SECONDS", "30"))
+
+# Text Normalization Configuration
+TEXT_NORMALIZATION_ENABLED = os.getenv("TEXT_NORMALIZATION_ENABLED", "true").lower() == "true"
+BOILERPLATE_MIN_PAGES = int(os.getenv("BOILERPLATE_MIN_PAGES", "3"))
+BOILERPLATE_PAGE_RATIO = float(os.getenv("BOILERPLATE_PAGE_RATIO", "0.5"))
 
 # Validation
 def validate_config():
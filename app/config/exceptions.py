@@ -31,3 +31,16 @@ class PDFProcessingError(AppException):
 class AIServiceError(AppException):
     """Raised when there's an AI service error"""
     pass
+
+
+class RedeliverMessage(AppException):
+    """Raised when a message must stay on the queue to be delivered again"""
+    pass
+
+
+class DeadlineExceeded(AppException):
+    """Raised when a message runs out of its processing budget"""
+    
+    def __init__(self, stage: str, message: str = ""):
+        self.stage = stage
+        super().__init__(message or f"Prazo de processamento esgotado na etapa '{stage}'")
@@ -1,14 +1,29 @@
 """
 Message Processor - Handle message processing logic
 """
+import time
+import hashlib
 import logging
-import asyncio
-from typing import Dict, Any, Optional
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional, List, Tuple
 from app.services.s3_service import S3Service
 from app.services.pdf_service import PDFProcessingService
 from app.services.bidding_service import BiddingService
+from app.services.checklist_dispatcher_service import checklist_dispatcher
+from app.services.metrics_service import consumer_metrics
+from app.services.result_store_service import checklist_store
+from app.services.model_router_service import model_router
+from app.services.traffic_recorder import traffic_recorder
+from app.services.deadline import Deadline
+from app.config.exceptions import DeadlineExceeded, RedeliverMessage
 from app.models.llm_models import DocumentChecklistResponse
-from app.config.config import DEFAULT_LLM_MODEL
+from app.config.config import (
+    MESSAGE_FILE_CONCURRENCY,
+    MESSAGE_DEADLINE_SECONDS,
+    BIDDING_API_TIMEOUT,
+    BIDDING_UPDATE_WINDOW_SECONDS,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -20,60 +35,184 @@ class MessageProcessor:
         self.s3_service = S3Service()
         self.pdf_service = PDFProcessingService()
         self.bidding_service = BiddingService()
+        self.update_dispatcher = checklist_dispatcher
+        self.result_store = checklist_store
     
     def process_message(self, message_content: Dict[str, Any]) -> bool:
         """Process a single message"""
         try:
             logger.info(f"Processando mensagem: {message_content}")
             
+            # Budget shared by every stage; an expired budget abandons the message for redelivery
+            deadline = Deadline(float(message_content.get("deadline_seconds") or MESSAGE_DEADLINE_SECONDS))
+            
             # Extract bidding ID from message
             bidding_id = message_content.get("id", "")
             if not bidding_id:
                 logger.warning("ID do bidding não encontrado na mensagem")
                 return False
             
-            # Extract filename/URL from message
-            url = message_content.get("filename", "")
-            if not url:
+            # Extract file URLs from message ("filename" may be a single URL or a list; "files" is a list)
+            urls = self._get_file_urls(message_content)
+            if not urls:
                 logger.warning("URL de arquivo não encontrada na mensagem")
                 return False
             
             
-            # Extract model preference from message (optional)
-            model = message_content.get("model", DEFAULT_LLM_MODEL)
+            # Extract model preference from message (optional); otherwise let the router pick
+            model = message_content.get("model") or model_router.choose_model()
             logger.info(f"Usando modelo: {model}")
             
-            # Download file from S3
-            file_content = self.s3_service.process_file_from_url(url)
-            if not file_content:
-                logger.warning("Falha ao baixar arquivo do S3")
-                return False
-            
-            # Process PDF with AI
-            result = self.pdf_service.process_pdf(file_content, model)
-            if not result:
-                logger.warning("Falha ao processar PDF")
+            # Download and process every file, in parallel when the edital comes with annexes
+            if len(urls) == 1:
+                outcome = self._process_file(urls[0], model, deadline, bidding_id)
+            else:
+                outcome = self._process_files(urls, model, deadline, bidding_id)
+            if not outcome:
                 return False
+            result, content_hash = outcome
             
             # Log processing results
             self._log_processing_results(result)
             
-            # Send checklist to bidding API
-            success = asyncio.run(self.bidding_service.update_bidding_checklist(bidding_id, result))
+            # Send checklist to bidding API (coalesced per bidding, skipped when unchanged).
+            # Skipped and needs_ocr results have no items; sending them would wipe the bidding's checklist
+            success = True
+            try:
+                if result.status == "processed":
+                    consumer_metrics.set_stage("update")
+                    start = time.monotonic()
+                    try:
+                        success = self.update_dispatcher.update(
+                            bidding_id,
+                            result,
+                            timeout=BIDDING_UPDATE_WINDOW_SECONDS + 2 * BIDDING_API_TIMEOUT,
+                            deadline=deadline
+                        )
+                    except DeadlineExceeded as e:
+                        # The PATCH is already queued and the result is saved below; redelivering
+                        # would run the LLM again and PATCH twice, so the message counts as processed
+                        logger.warning(f"Prazo esgotado aguardando o PATCH do bidding {bidding_id}, que segue na fila: {e}")
+                        consumer_metrics.record_deadline_exceeded(e.stage)
+                        consumer_metrics.record_error(e, stage=e.stage)
+                    finally:
+                        result.timings["update"] = round(time.monotonic() - start, 3)
+                else:
+                    logger.info(f"Checklist do bidding {bidding_id} não enviado para a API (status {result.status})")
+            finally:
+                # Keep the result so it can be queried or re-pushed without the LLM
+                self.result_store.save(bidding_id, content_hash, result)
+            
             if not success:
                 logger.warning(f"Falha ao enviar checklist para API para bidding {bidding_id}")
+                consumer_metrics.record_error(f"Falha ao enviar checklist do bidding {bidding_id}")
                 # Don't return False here - PDF was processed successfully
                 # Just log the warning and continue
             
             logger.info("Mensagem processada com sucesso")
             return True
             
+        except RedeliverMessage as e:
+            logger.warning(f"Mensagem mantida na fila para nova tentativa: {e}")
+            consumer_metrics.record_error(e)
+            raise
+        except DeadlineExceeded as e:
+            logger.warning(f"Mensagem abandonada: {e}")
+            consumer_metrics.record_deadline_exceeded(e.stage)
+            consumer_metrics.record_error(e, stage=e.stage)
+            raise RedeliverMessage(str(e)) from e
         except Exception as e:
             logger.error(f"Erro ao processar mensagem: {e}")
+            consumer_metrics.record_error(e)
             return False
     
+    def _get_file_urls(self, message_content: Dict[str, Any]) -> List[str]:
+        """File URLs of a message, without duplicates"""
+        files = message_content.get("files") or message_content.get("filename") or []
+        if isinstance(files, str):
+            files = [files]
+        return list(dict.fromkeys(url for url in files if url))
+    
+    def _process_file(
+        self,
+        url: str,
+        model: str,
+        deadline: Optional[Deadline] = None,
+        bidding_id: Optional[str] = None
+    ) -> Optional[Tuple[DocumentChecklistResponse, str]]:
+        """Download and process one file; returns the checklist and the file's content hash"""
+        consumer_metrics.set_stage("download")
+        start = time.monotonic()
+        with self.s3_service.open_file_from_url(url, deadline=deadline) as downloaded:
+            download_seconds = time.monotonic() - start
+            if not downloaded:
+                logger.warning("Falha ao baixar arquivo do S3")
+                consumer_metrics.record_error(f"Falha ao baixar arquivo: {url}")
+                return None
+            
+            # Process PDF with AI (large files are read from a memory-mapped temp file)
+            content_hash = downloaded.content_hash
+            traffic_recorder.record_download(downloaded.size, content_hash)
+            result = self.pdf_service.process_pdf(
+                downloaded.stream, model, deadline=deadline, content_hash=content_hash, bidding_id=bidding_id
+            )
+        
+        if not result:
+            logger.warning(f"Falha ao processar PDF: {url}")
+            consumer_metrics.record_error(f"Falha ao processar PDF: {url}")
+            return None
+        
+        result.timings["download"] = round(download_seconds, 3)
+        return result, content_hash
+    
+    def _process_files(
+        self,
+        urls: List[str],
+        model: str,
+        deadline: Optional[Deadline] = None,
+        bidding_id: Optional[str] = None
+    ) -> Tuple[DocumentChecklistResponse, str]:
+        """Process an edital and its annexes concurrently and merge them into one checklist"""
+        logger.info(f"Processando {len(urls)} arquivos em paralelo")
+        job_id = consumer_metrics.current_job_id()
+        message_id = traffic_recorder.current_message_id()
+        
+        def process(url: str) -> Optional[Tuple[DocumentChecklistResponse, str]]:
+            # Helper threads report into the message's job and recording
+            consumer_metrics.bind_job(job_id)
+            traffic_recorder.bind_message(message_id)
+            try:
+                return self._process_file(url, model, deadline, bidding_id)
+            except DeadlineExceeded:
+                raise
+            except Exception as e:
+                logger.error(f"Erro ao processar arquivo {url}: {e}")
+                return None
+            finally:
+                consumer_metrics.bind_job(None)
+                traffic_recorder.bind_message(None)
+        
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=min(len(urls), MESSAGE_FILE_CONCURRENCY)) as executor:
+            # Each helper also runs in a copy of this thread's context variables
+            futures = [executor.submit(contextvars.copy_context().run, process, url) for url in urls]
+            outcomes = [future.result() for future in futures]
+        
+        # A missing annex would silently drop requirements, so the message stays on the queue instead
+        failed = [url for url, outcome in zip(urls, outcomes) if not outcome]
+        if failed:
+            raise RedeliverMessage(f"Falha em {len(failed)} de {len(urls)} arquivos: {failed}")
+        
+        result = DocumentChecklistResponse.merge([checklist for checklist, _ in outcomes])
+        result.timings["files_wall"] = round(time.monotonic() - start, 3)
+        content_hash = hashlib.sha256("".join(file_hash for _, file_hash in outcomes).encode()).hexdigest()
+        logger.info(f"Checklists de {len(urls)} arquivos combinados em {result.total_documents} documentos")
+        return result, content_hash
+    
     def _log_processing_results(self, result: DocumentChecklistResponse) -> None:
         """Log the results of PDF processing"""
+        if result.skip_reason:
+            logger.info(f"Documento não enviado ao LLM ({result.status}): {result.skip_reason}")
         logger.info(f"Documentos encontrados: {result.total_documents}")
         logger.info(f"Obrigatórios: {result.mandatory_count}")
         logger.info(f"Opcionais: {result.optional_count}")
@@ -1,6 +1,7 @@
 """
 FastAPI main application
 """
+import asyncio
 import logging
 from contextlib import asynccontextmanager
 from threading import Thread
@@ -8,8 +9,10 @@ from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from app.config.logging_config import setup_logging
-from app.sqs_consumer import poll_messages
+from app.sqs_consumer import poll_messages, drain_consumer, lane_status
 from app.api.routes import router as api_router
+from app.api.admission import AdmissionControlMiddleware
+from app.services.metrics_service import consumer_metrics
 
 
 setup_logging()
@@ -38,6 +41,8 @@ async def lifespan(app: FastAPI):
     
     
     logger.info("Finalizando aplicação...")
+    # Stop polling and let in-flight jobs finish before the process exits
+    await asyncio.to_thread(drain_consumer)
 
 
 
@@ -48,6 +53,9 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# Per-route concurrency limits with fast 429/503 (added first so CORS headers wrap rejections)
+app.add_middleware(AdmissionControlMiddleware)
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -73,11 +81,14 @@ async def global_exception_handler(request, exc):
 
 @app.get("/health")
 async def health_check():
-    """Health check endpoint"""
+    """Health check endpoint; only in-memory data so it answers even when SQS is slow"""
     return {
         "status": "healthy",
         "service": "api-process-edict",
-        "consumer_running": consumer_thread and consumer_thread.is_alive() if consumer_thread else False
+        "consumer_running": consumer_thread and consumer_thread.is_alive() if consumer_thread else False,
+        "in_flight": consumer_metrics.get_in_flight_count(),
+        "messages_per_minute": consumer_metrics.get_throughput(),
+        "queue": consumer_metrics.peek_queue_stats()
     }
 
 
@@ -97,8 +108,24 @@ async def consumer_status():
     if not consumer_thread:
         raise HTTPException(status_code=503, detail="Consumer não foi iniciado")
     
+    from app.clients.llm_client import llm_service
+    from app.services.document_classifier_service import document_classifier
+    from app.services.checklist_dispatcher_service import checklist_dispatcher
+    from app.services.preflight_service import preflight_planner
+    from app.services.llm_batch_service import llm_batch_service
+    from app.services.similarity_index_service import similarity_index
+    
+    metrics = await asyncio.to_thread(consumer_metrics.snapshot)
     return {
         "consumer_running": consumer_thread.is_alive(),
         "thread_name": consumer_thread.name,
-        "is_daemon": consumer_thread.daemon
+        "is_daemon": consumer_thread.daemon,
+        **metrics,
+        "lanes": lane_status(),
+        "classifier": document_classifier.snapshot(),
+        "preflight": preflight_planner.snapshot(),
+        "llm_batching": llm_batch_service.snapshot(),
+        "similarity": similarity_index.snapshot(),
+        "bidding_updates": checklist_dispatcher.snapshot(),
+        "llm_models": llm_service.get_resilience_status()
     }
@@ -1,10 +1,14 @@
 """
 LLM Models and Data Classes
 """
-from dataclasses import dataclass
+import re
+import unicodedata
+from dataclasses import dataclass, field
 from typing import List, Optional, Dict, Any
 from enum import Enum
 
+_NON_ALNUM_RE = re.compile(r"[^a-z0-9]+")
+
 
 class DocumentStatus(Enum):
     """Document requirement status"""
@@ -30,6 +34,114 @@ class DocumentChecklistResponse:
     optional_count: int
     processing_error: bool = False
     error_message: Optional[str] = None
+    model_used: Optional[str] = None
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    timings: Dict[str, float] = field(default_factory=dict)
+    status: str = "processed"  # processed, skipped or needs_ocr
+    skip_reason: Optional[str] = None
+    strategy: Optional[str] = None  # preflight decision: single, filtered or chunked
+    
+    @classmethod
+    def from_documents(cls, documents: List[Any], **kwargs) -> "DocumentChecklistResponse":
+        """Create from a list of documents, computing the counts"""
+        mandatory_count = sum(
+            1 for doc in documents if cls.document_field(doc, "exigenceStatus") == DocumentStatus.OBRIGATORIO.value
+        )
+        return cls(
+            documents=documents,
+            total_documents=len(documents),
+            mandatory_count=mandatory_count,
+            optional_count=len(documents) - mandatory_count,
+            **kwargs
+        )
+    
+    @classmethod
+    def merge(cls, responses: List["DocumentChecklistResponse"]) -> "DocumentChecklistResponse":
+        """Combine several checklists into one, deduplicating documents by name"""
+        documents = cls.merge_documents([doc for response in responses for doc in response.documents])
+        models = [response.model_used for response in responses if response.model_used]
+        strategies = [response.strategy for response in responses if response.strategy]
+        
+        timings: Dict[str, float] = {}
+        for response in responses:
+            for stage, seconds in response.timings.items():
+                timings[stage] = round(timings.get(stage, 0.0) + seconds, 3)
+        
+        # Only a checklist where no document reached the LLM keeps a skipped status
+        statuses = {response.status for response in responses}
+        status = "processed"
+        if statuses and "processed" not in statuses:
+            status = statuses.pop() if len(statuses) == 1 else "skipped"
+        
+        return cls.from_documents(
+            documents,
+            status=status,
+            skip_reason="; ".join(r.skip_reason for r in responses if r.skip_reason) or None,
+            processing_error=any(response.processing_error for response in responses),
+            error_message="; ".join(r.error_message for r in responses if r.error_message) or None,
+            model_used=",".join(dict.fromkeys(models)) or None,
+            strategy=",".join(dict.fromkeys(strategies)) or None,
+            prompt_tokens=cls._sum_optional(response.prompt_tokens for response in responses),
+            completion_tokens=cls._sum_optional(response.completion_tokens for response in responses),
+            timings=timings
+        )
+    
+    @classmethod
+    def merge_documents(cls, documents: List[Any]) -> List[Dict[str, Any]]:
+        """Deduplicate documents by normalized name; OBRIGATORIO wins and the longest additionalInfo is kept"""
+        merged: Dict[str, Dict[str, Any]] = {}
+        for doc in documents:
+            item = {
+                "name": cls.document_field(doc, "name", ""),
+                "exigenceStatus": cls.document_field(doc, "exigenceStatus", DocumentStatus.OPCIONAL.value),
+                "additionalInfo": cls.document_field(doc, "additionalInfo", "") or "",
+                "possibleToAttach": cls.document_field(doc, "possibleToAttach", True),
+            }
+            key = cls.document_key(item["name"])
+            if not key:
+                continue
+            existing = merged.get(key)
+            if existing is None:
+                merged[key] = item
+                continue
+            if item["exigenceStatus"] == DocumentStatus.OBRIGATORIO.value:
+                existing["exigenceStatus"] = DocumentStatus.OBRIGATORIO.value
+            if len(item["additionalInfo"]) > len(existing["additionalInfo"]):
+                existing["additionalInfo"] = item["additionalInfo"]
+        return list(merged.values())
+    
+    @staticmethod
+    def document_field(doc: Any, name: str, default: Any = None) -> Any:
+        """Read a field from a DocumentRequirement or a plain dict"""
+        if isinstance(doc, dict):
+            return doc.get(name, default)
+        return getattr(doc, name, default)
+    
+    @staticmethod
+    def document_key(name: str) -> str:
+        """Accent-, case- and punctuation-insensitive key for a document name"""
+        decomposed = unicodedata.normalize("NFKD", (name or "").lower())
+        folded = "".join(char for char in decomposed if not unicodedata.combining(char))
+        return _NON_ALNUM_RE.sub(" ", folded).strip()
+    
+    @staticmethod
+    def _sum_optional(values) -> Optional[int]:
+        """Sum ignoring None; None if every value is None"""
+        present = [value for value in values if value is not None]
+        return sum(present) if present else None
+    
+    @classmethod
+    def skipped(cls, status: str, reason: str) -> "DocumentChecklistResponse":
+        """Empty checklist for a document that was not sent to the LLM"""
+        return cls(
+            documents=[],
+            total_documents=0,
+            mandatory_count=0,
+            optional_count=0,
+            status=status,
+            skip_reason=reason
+        )
     
     def to_dict(self) -> dict:
         """Convert to dictionary"""
@@ -39,8 +151,36 @@ class DocumentChecklistResponse:
             "mandatory_count": self.mandatory_count,
             "optional_count": self.optional_count,
             "processing_error": self.processing_error,
-            "error_message": self.error_message
+            "error_message": self.error_message,
+            "model_used": self.model_used,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "timings": self.timings,
+            "status": self.status,
+            "skip_reason": self.skip_reason,
+            "strategy": self.strategy
         }
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "DocumentChecklistResponse":
+        """Create from dictionary produced by to_dict"""
+        documents = data.get("documents", [])
+        mandatory_count = sum(1 for doc in documents if doc.get("exigenceStatus") == "OBRIGATORIO")
+        return cls(
+            documents=documents,
+            total_documents=len(documents),
+            mandatory_count=mandatory_count,
+            optional_count=len(documents) - mandatory_count,
+            processing_error=data.get("processing_error", False),
+            error_message=data.get("error_message"),
+            model_used=data.get("model_used"),
+            prompt_tokens=data.get("prompt_tokens"),
+            completion_tokens=data.get("completion_tokens"),
+            timings=data.get("timings") or {},
+            status=data.get("status", "processed"),
+            skip_reason=data.get("skip_reason"),
+            strategy=data.get("strategy")
+        )
 
 
 class LLMPromptTemplate:
@@ -78,6 +218,106 @@ Edital para análise:
 {document_content}
 
 Responda APENAS com o JSON válido:"""
+    
+    @staticmethod
+    def get_residual_extraction_prompt() -> str:
+        """Get a shorter prompt that asks only for documents not already identified"""
+        return """Os trechos abaixo foram extraídos de um edital de licitação brasileiro. Os seguintes documentos de habilitação JÁ foram identificados e NÃO devem ser repetidos:
+
+{known_documents}
+
+Liste APENAS os demais documentos exigidos para participar da licitação.
+
+Responda APENAS com um JSON válido, sem texto adicional:
+{{"checklistItems": [{{"name": "Nome do documento", "exigenceStatus": "OBRIGATORIO ou OPCIONAL", "additionalInfo": "Informações adicionais", "possibleToAttach": true}}]}}
+
+Se não houver outros documentos, retorne {{"checklistItems": []}}.
+
+Trechos do edital:
+
+{document_content}"""
+    
+    @staticmethod
+    def get_multi_document_extraction_prompt() -> str:
+        """Get a prompt that extracts one checklist per edital from several short editais"""
+        return """Abaixo estão vários editais de licitação brasileiros curtos, cada um identificado por um ID. Para CADA edital, extraia separadamente os documentos necessários para participar da licitação.
+
+Quando um edital indicar documentos JÁ identificados, NÃO os repita e liste apenas os demais.
+
+Responda APENAS com um JSON válido, sem texto adicional, com um resultado para cada ID:
+{{"results": [{{"documentId": "ID do edital", "checklistItems": [{{"name": "Nome do documento", "exigenceStatus": "OBRIGATORIO ou OPCIONAL", "additionalInfo": "Informações adicionais", "possibleToAttach": true}}]}}]}}
+
+Regras:
+1. exigenceStatus deve ser exatamente "OBRIGATORIO" ou "OPCIONAL"
+2. Nunca misture documentos de editais diferentes
+3. Se um edital não exigir documentos, retorne "checklistItems": [] para o seu ID
+
+{documents}"""
+    
+    @staticmethod
+    def get_multi_document_section() -> str:
+        """One edital inside the multi-document prompt"""
+        return """=== EDITAL {document_id} ===
+{known_documents}{document_content}
+=== FIM DO EDITAL {document_id} ===
+"""
+    
+    @staticmethod
+    def get_checklist_json_schema() -> Dict[str, Any]:
+        """JSON schema of the checklist response, for structured output"""
+        return {
+            "name": "document_checklist",
+            "strict": True,
+            "schema": {
+                "type": "object",
+                "properties": {
+                    "checklistItems": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "name": {"type": "string"},
+                                "exigenceStatus": {"type": "string", "enum": ["OBRIGATORIO", "OPCIONAL"]},
+                                "additionalInfo": {"type": "string"},
+                                "possibleToAttach": {"type": "boolean"}
+                            },
+                            "required": ["name", "exigenceStatus", "additionalInfo", "possibleToAttach"],
+                            "additionalProperties": False
+                        }
+                    }
+                },
+                "required": ["checklistItems"],
+                "additionalProperties": False
+            }
+        }
+    
+    @classmethod
+    def get_multi_document_json_schema(cls) -> Dict[str, Any]:
+        """JSON schema of the multi-document response, for structured output"""
+        checklist = cls.get_checklist_json_schema()["schema"]
+        return {
+            "name": "document_checklists",
+            "strict": True,
+            "schema": {
+                "type": "object",
+                "properties": {
+                    "results": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "documentId": {"type": "string"},
+                                "checklistItems": checklist["properties"]["checklistItems"]
+                            },
+                            "required": ["documentId", "checklistItems"],
+                            "additionalProperties": False
+                        }
+                    }
+                },
+                "required": ["results"],
+                "additionalProperties": False
+            }
+        }
 
 
 @dataclass
@@ -96,4 +336,7 @@ class LLMResponse:
     model: str
     tokens_used: Optional[int] = None
     success: bool = True
-    error_message: Optional[str] = None
\ No newline at end of file
+    error_message: Optional[str] = None
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    latency_seconds: Optional[float] = None
\ No newline at end of file
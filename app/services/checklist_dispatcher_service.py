@@ -0,0 +1,230 @@
+"""
+Checklist Dispatcher Service - Coalesced, deduplicated PATCHes to the bidding API
+
+An update for an idle bidding ID is sent at once. Updates that arrive while a
+request for the same bidding is in flight, or less than
+BIDDING_UPDATE_WINDOW_SECONDS after the last one was sent, wait and are
+coalesced (last writer wins). A PATCH whose payload hash matches the last one
+acknowledged for that bidding is skipped. Callers receive a Future that
+resolves to whether the checklist they submitted, or the one that superseded
+it, was acknowledged.
+"""
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FuturesTimeout
+from typing import Optional, Dict, Any, List
+from app.models.llm_models import DocumentChecklistResponse
+from app.services.bidding_service import BiddingService
+from app.services.deadline import Deadline
+from app.config.exceptions import DeadlineExceeded
+from app.config.config import (
+    BIDDING_UPDATE_COALESCING_ENABLED,
+    BIDDING_UPDATE_WINDOW_SECONDS,
+    BIDDING_UPDATE_WORKERS,
+)
+
+logger = logging.getLogger(__name__)
+
+# Acknowledged hashes and dispatch times remembered per bidding ID
+_MAX_ACKED_HASHES = 10000
+
+
+@dataclass
+class PendingUpdate:
+    """Latest checklist waiting to be sent for one bidding ID"""
+    checklist: DocumentChecklistResponse
+    payload_hash: str
+    due_at: float
+    futures: List[Future] = field(default_factory=list)
+
+
+class ChecklistUpdateDispatcher:
+    """Per-bidding coalescing and deduplication of checklist updates"""
+
+    def __init__(
+        self,
+        bidding_service: Optional[BiddingService] = None,
+        window_seconds: float = BIDDING_UPDATE_WINDOW_SECONDS,
+        workers: int = BIDDING_UPDATE_WORKERS,
+        enabled: bool = BIDDING_UPDATE_COALESCING_ENABLED
+    ):
+        self.bidding_service = bidding_service or BiddingService()
+        self.window_seconds = window_seconds
+        self.workers = workers
+        self.enabled = enabled
+
+        self._condition = threading.Condition()
+        self._pending: Dict[str, PendingUpdate] = {}
+        self._in_flight: set = set()
+        self._acked: "OrderedDict[str, str]" = OrderedDict()
+        self._last_dispatch: "OrderedDict[str, float]" = OrderedDict()
+        self._flushing = False
+        self._thread: Optional[threading.Thread] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self.stats = {"submitted": 0, "sent": 0, "coalesced": 0, "skipped_unchanged": 0, "failed": 0}
+
+    def submit(self, bidding_id: str, checklist: DocumentChecklistResponse) -> Future:
+        """Queue a checklist update; the Future resolves to True once acknowledged"""
+        future: Future = Future()
+        if not self.enabled:
+            future.set_result(self._send(bidding_id, checklist))
+            return future
+
+        payload_hash = self.payload_hash(checklist)
+        with self._condition:
+            self._ensure_started()
+            self.stats["submitted"] += 1
+            pending = self._pending.get(bidding_id)
+            if pending:
+                # Last writer wins; earlier callers are answered by the newer checklist's PATCH
+                pending.checklist = checklist
+                pending.payload_hash = payload_hash
+                pending.futures.append(future)
+                self.stats["coalesced"] += 1
+            else:
+                # Idle biddings go out now; a burst is held behind the request in flight and the window
+                now = time.monotonic()
+                due_at = now
+                if not self._flushing and bidding_id in self._last_dispatch:
+                    due_at = max(now, self._last_dispatch[bidding_id] + self.window_seconds)
+                self._pending[bidding_id] = PendingUpdate(checklist, payload_hash, due_at, [future])
+            self._condition.notify_all()
+        return future
+
+    def update(
+        self,
+        bidding_id: str,
+        checklist: DocumentChecklistResponse,
+        timeout: Optional[float] = None,
+        deadline: Optional[Deadline] = None
+    ) -> bool:
+        """Submit and wait for the outcome, at most until the deadline"""
+        deadline = deadline or Deadline.unbounded()
+        try:
+            wait = deadline.timeout("update", cap=timeout)
+            return self.submit(bidding_id, checklist).result(timeout=wait)
+        except DeadlineExceeded:
+            raise
+        except FuturesTimeout:
+            if deadline.expired():
+                raise DeadlineExceeded("update")
+            logger.error(f"Tempo esgotado aguardando atualização do checklist do bidding {bidding_id}")
+            return False
+        except Exception as e:
+            logger.error(f"Erro aguardando atualização do checklist do bidding {bidding_id}: {e}")
+            return False
+
+    def flush(self, timeout: float) -> bool:
+        """Send everything pending without waiting for the window; returns True if nothing is left"""
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            self._flushing = True
+            now = time.monotonic()
+            for pending in self._pending.values():
+                pending.due_at = min(pending.due_at, now)
+            self._condition.notify_all()
+
+            while self._pending or self._in_flight:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    logger.warning(
+                        f"{len(self._pending)} atualização(ões) de checklist pendente(s) após o prazo de flush"
+                    )
+                    return False
+                self._condition.wait(remaining)
+        return True
+
+    def payload_hash(self, checklist: DocumentChecklistResponse) -> str:
+        """Hash of the payload that would be sent to the bidding API"""
+        payload = self.bidding_service.convert_checklist_to_api_format(checklist)
+        encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")
+        return hashlib.sha256(encoded).hexdigest()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Counters and queue state"""
+        with self._condition:
+            return {
+                "enabled": self.enabled,
+                "window_seconds": self.window_seconds,
+                "pending": len(self._pending),
+                "in_flight": len(self._in_flight),
+                **self.stats,
+            }
+
+    def _ensure_started(self) -> None:
+        """Start the scheduler thread on first use (condition must be held)"""
+        if self._thread is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bidding-update")
+            self._thread = threading.Thread(target=self._run, name="bidding-update-dispatcher", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        """Hand due updates to the workers, one in flight per bidding ID"""
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                ready = [
+                    bidding_id for bidding_id, pending in self._pending.items()
+                    if pending.due_at <= now and bidding_id not in self._in_flight
+                ]
+                for bidding_id in ready:
+                    pending = self._pending.pop(bidding_id)
+                    self._in_flight.add(bidding_id)
+                    self._last_dispatch[bidding_id] = now
+                    self._last_dispatch.move_to_end(bidding_id)
+                    while len(self._last_dispatch) > _MAX_ACKED_HASHES:
+                        self._last_dispatch.popitem(last=False)
+                    self._executor.submit(self._dispatch, bidding_id, pending)
+
+                waiting = [
+                    pending.due_at for bidding_id, pending in self._pending.items()
+                    if bidding_id not in self._in_flight
+                ]
+                self._condition.wait(max(0.0, min(waiting) - now) if waiting else None)
+
+    def _dispatch(self, bidding_id: str, pending: PendingUpdate) -> None:
+        """Send one coalesced update unless it matches the last acknowledged payload"""
+        success = False
+        unchanged = False
+        try:
+            with self._condition:
+                unchanged = self._acked.get(bidding_id) == pending.payload_hash
+
+            if unchanged:
+                logger.info(f"Checklist do bidding {bidding_id} inalterado, PATCH ignorado")
+                success = True
+            else:
+                success = self._send(bidding_id, pending.checklist)
+        except Exception as e:
+            logger.error(f"Erro ao despachar checklist do bidding {bidding_id}: {e}")
+        finally:
+            with self._condition:
+                if unchanged:
+                    self.stats["skipped_unchanged"] += 1
+                elif success:
+                    self.stats["sent"] += 1
+                    self._acked[bidding_id] = pending.payload_hash
+                    self._acked.move_to_end(bidding_id)
+                    while len(self._acked) > _MAX_ACKED_HASHES:
+                        self._acked.popitem(last=False)
+                else:
+                    self.stats["failed"] += 1
+                self._in_flight.discard(bidding_id)
+                self._condition.notify_all()
+
+            for future in pending.futures:
+                future.set_result(success)
+
+    def _send(self, bidding_id: str, checklist: DocumentChecklistResponse) -> bool:
+        """PATCH the checklist"""
+        return asyncio.run(self.bidding_service.update_bidding_checklist(bidding_id, checklist))
+
+
+# Global instance for easy import
+checklist_dispatcher = ChecklistUpdateDispatcher()
@@ -0,0 +1,179 @@
+"""
+Corpus Store Service - Extracted page text of processed PDFs for offline evaluation
+
+Evaluating a new prompt or model used to mean downloading and parsing every
+historical PDF again. The consumer now keeps the extracted pages of each PDF
+once per content hash in an append-only file of zlib-compressed records, with
+a JSONL index of (content hash, bidding ID, offset, length). Records are read
+through a memory map, so random access costs one slice and one decompress.
+Re-run prompts over the corpus with `python -m app.cli.evaluate`.
+"""
+import os
+import json
+import mmap
+import time
+import zlib
+import logging
+import threading
+from pathlib import Path
+from dataclasses import dataclass, asdict
+from typing import Optional, Dict, Any, List, Iterator
+from app.config.config import CORPUS_STORE_ENABLED, CORPUS_STORE_PATH
+
+logger = logging.getLogger(__name__)
+
+_DATA_FILE = "corpus.dat"
+_INDEX_FILE = "corpus.idx"
+# Pages are joined with a form feed, which extraction never leaves in page text
+_PAGE_SEPARATOR = "\f"
+
+
+@dataclass
+class CorpusEntry:
+    """Location of one document's pages in the data file"""
+    content_hash: str
+    bidding_id: str
+    offset: int
+    length: int
+    pages: int
+    chars: int
+    created_at: float
+
+
+class CorpusStore:
+    """Append-only compressed page text keyed by content hash and bidding ID"""
+
+    def __init__(self, path: str = CORPUS_STORE_PATH, enabled: bool = CORPUS_STORE_ENABLED):
+        self.path = Path(path)
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._entries: Dict[str, CorpusEntry] = {}
+        self._by_bidding: Dict[str, List[str]] = {}
+        self._mmap: Optional[mmap.mmap] = None
+
+    def add(self, content_hash: str, bidding_id: Optional[str], pages: List[str]) -> bool:
+        """Store the pages of a document; a content hash already stored only gains the bidding ID"""
+        if not self.enabled or not content_hash:
+            return False
+        bidding_id = bidding_id or ""
+
+        try:
+            with self._lock:
+                self._load()
+                existing = self._entries.get(content_hash)
+                if existing is not None:
+                    if bidding_id and content_hash not in self._by_bidding.get(bidding_id, []):
+                        self._append_index(CorpusEntry(**{**asdict(existing), "bidding_id": bidding_id}))
+                    return True
+
+                text = _PAGE_SEPARATOR.join(page.replace(_PAGE_SEPARATOR, " ") for page in pages)
+                record = zlib.compress(text.encode("utf-8"))
+                with open(self.path / _DATA_FILE, "ab") as data:
+                    offset = data.tell()
+                    data.write(record)
+                    data.flush()
+                    os.fsync(data.fileno())
+                self._append_index(CorpusEntry(
+                    content_hash, bidding_id, offset, len(record), len(pages), len(text), time.time()
+                ))
+            return True
+
+        except Exception as e:
+            logger.error(f"Erro ao armazenar texto do documento {content_hash[:12]} no corpus: {e}")
+            return False
+
+    def get_pages(self, content_hash: str) -> Optional[List[str]]:
+        """Pages of a stored document"""
+        if not self.enabled:
+            return None
+
+        try:
+            with self._lock:
+                self._load()
+                entry = self._entries.get(content_hash)
+                if entry is None:
+                    return None
+                record = self._read(entry)
+            return zlib.decompress(record).decode("utf-8").split(_PAGE_SEPARATOR)
+
+        except Exception as e:
+            logger.error(f"Erro ao ler documento {content_hash[:12]} do corpus: {e}")
+            return None
+
+    def hashes_for_bidding(self, bidding_id: str) -> List[str]:
+        """Content hashes stored for a bidding ID"""
+        with self._lock:
+            self._load()
+            return list(self._by_bidding.get(bidding_id, []))
+
+    def entries(self, bidding_ids: Optional[List[str]] = None) -> Iterator[CorpusEntry]:
+        """Stored documents, optionally only those of some biddings, oldest first"""
+        with self._lock:
+            self._load()
+            if bidding_ids is None:
+                selected = list(self._entries.values())
+            else:
+                hashes = dict.fromkeys(h for bidding_id in bidding_ids for h in self._by_bidding.get(bidding_id, []))
+                selected = [self._entries[content_hash] for content_hash in hashes]
+        yield from sorted(selected, key=lambda entry: entry.offset)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Corpus size"""
+        if not self.enabled:
+            return {"enabled": False}
+        with self._lock:
+            self._load()
+            data_file = self.path / _DATA_FILE
+            return {
+                "enabled": True,
+                "documents": len(self._entries),
+                "biddings": len(self._by_bidding),
+                "compressed_mb": round(data_file.stat().st_size / (1024 * 1024), 1) if data_file.exists() else 0.0,
+                "text_mb": round(sum(entry.chars for entry in self._entries.values()) / (1024 * 1024), 1),
+            }
+
+    def _load(self) -> None:
+        """Read the index on first use (lock must be held)"""
+        if self._loaded:
+            return
+        self.path.mkdir(parents=True, exist_ok=True)
+        index_file = self.path / _INDEX_FILE
+        if index_file.exists():
+            with open(index_file, encoding="utf-8") as index:
+                for line in index:
+                    try:
+                        self._remember(CorpusEntry(**json.loads(line)))
+                    except (ValueError, TypeError):
+                        # A torn last line from a crash; the record it pointed to is simply unindexed
+                        logger.warning("Linha inválida ignorada no índice do corpus")
+        self._loaded = True
+        logger.info(f"Corpus carregado com {len(self._entries)} documentos")
+
+    def _append_index(self, entry: CorpusEntry) -> None:
+        """Persist and remember an index entry (lock must be held)"""
+        with open(self.path / _INDEX_FILE, "a", encoding="utf-8") as index:
+            index.write(json.dumps(asdict(entry)) + "\n")
+        self._remember(entry)
+
+    def _remember(self, entry: CorpusEntry) -> None:
+        """Add an index entry to the in-memory maps (lock must be held)"""
+        self._entries.setdefault(entry.content_hash, entry)
+        if entry.bidding_id:
+            hashes = self._by_bidding.setdefault(entry.bidding_id, [])
+            if entry.content_hash not in hashes:
+                hashes.append(entry.content_hash)
+
+    def _read(self, entry: CorpusEntry) -> bytes:
+        """Bytes of a record, remapping the data file when it has grown past the map (lock must be held)"""
+        end = entry.offset + entry.length
+        if self._mmap is None or len(self._mmap) < end:
+            if self._mmap is not None:
+                self._mmap.close()
+            with open(self.path / _DATA_FILE, "rb") as data:
+                self._mmap = mmap.mmap(data.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._mmap[entry.offset:end]
+
+
+# Global instance for easy import
+corpus_store = CorpusStore()
@@ -0,0 +1,42 @@
+"""
+Deadline - Per-message processing budget shared by every pipeline stage
+"""
+import time
+from typing import Optional
+from app.config.exceptions import DeadlineExceeded
+
+
+class Deadline:
+    """Absolute deadline on the monotonic clock; None seconds means unbounded"""
+
+    def __init__(self, seconds: Optional[float] = None):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds if seconds is not None else None
+
+    @classmethod
+    def unbounded(cls) -> "Deadline":
+        """Deadline that never expires"""
+        return cls(None)
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left (never negative), or None when unbounded"""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        """Whether the budget is used up"""
+        return self.expires_at is not None and time.monotonic() >= self.expires_at
+
+    def check(self, stage: str) -> None:
+        """Raise DeadlineExceeded for the stage if the budget is used up"""
+        if self.expired():
+            raise DeadlineExceeded(stage)
+
+    def timeout(self, stage: str, cap: Optional[float] = None) -> Optional[float]:
+        """Timeout for a blocking call: the remaining budget, at most cap"""
+        self.check(stage)
+        remaining = self.remaining()
+        if remaining is None:
+            return cap
+        return remaining if cap is None else min(cap, remaining)
@@ -0,0 +1,161 @@
+"""
+Document Classifier Service - Decide locally whether a document needs the LLM
+
+Scores the extracted text with keywords and structure signals typical of
+editais. Documents without a text layer are reported as needing OCR and
+documents without habilitação content are skipped, so neither costs an
+LLM call.
+"""
+import re
+import logging
+import threading
+import unicodedata
+from dataclasses import dataclass, field
+from typing import List, Dict, Any
+from app.config.config import (
+    CLASSIFIER_ENABLED,
+    CLASSIFIER_MIN_CHARS_PER_PAGE,
+    CLASSIFIER_MIN_SCORE,
+)
+
+logger = logging.getLogger(__name__)
+
+DECISION_PROCESS = "process"
+DECISION_SKIP = "skipped"
+DECISION_NEEDS_OCR = "needs_ocr"
+
+# Accent-free, lowercase keywords and their weights
+_KEYWORDS = {
+    "habilitacao": 3,
+    "regularidade fiscal": 3,
+    "qualificacao tecnica": 3,
+    "qualificacao economico": 3,
+    "documentos de habilitacao": 3,
+    "edital": 2,
+    "licitacao": 2,
+    "pregao": 2,
+    "concorrencia": 2,
+    "tomada de precos": 2,
+    "14.133": 2,
+    "8.666": 2,
+    "certidao": 1,
+    "atestado": 1,
+    "balanco patrimonial": 1,
+    "licitante": 1,
+    "proposta": 1,
+}
+_KEYWORD_RE = re.compile("|".join(re.escape(keyword) for keyword in sorted(_KEYWORDS, key=len, reverse=True)))
+_MAX_HITS_PER_KEYWORD = 3
+
+# Numbered clauses such as "8.1.2 A licitante deverá..."
+_CLAUSE_RE = re.compile(r"^\s*\d{1,2}(?:\.\d{1,2})+\.?\s+[a-z]", re.MULTILINE)
+_MIN_CLAUSES = 5
+_TOKEN_RE = re.compile(r"\S+")
+_NUMERIC_TOKEN_RE = re.compile(r"^(?=.*\d)[\d.,%r$()/-]+$")
+# Price spreadsheets are mostly numbers
+_MAX_NUMERIC_RATIO = 0.5
+
+
+@dataclass
+class ClassificationResult:
+    """Outcome of the pre-classification of one document"""
+    decision: str
+    score: int
+    chars_per_page: float
+    reason: str = ""
+    signals: Dict[str, int] = field(default_factory=dict)
+
+    @property
+    def needs_llm(self) -> bool:
+        """Whether the document should be sent to the LLM"""
+        return self.decision == DECISION_PROCESS
+
+
+class DocumentClassifierService:
+    """Keyword and structure scoring of extracted text"""
+
+    def __init__(
+        self,
+        enabled: bool = CLASSIFIER_ENABLED,
+        min_chars_per_page: int = CLASSIFIER_MIN_CHARS_PER_PAGE,
+        min_score: int = CLASSIFIER_MIN_SCORE
+    ):
+        self.enabled = enabled
+        self.min_chars_per_page = min_chars_per_page
+        self.min_score = min_score
+        self._lock = threading.Lock()
+        self.counts = {DECISION_PROCESS: 0, DECISION_SKIP: 0, DECISION_NEEDS_OCR: 0}
+
+    def classify(self, pages: List[str]) -> ClassificationResult:
+        """Classify a document from its extracted pages"""
+        chars_per_page = sum(len(page.strip()) for page in pages) / len(pages) if pages else 0.0
+        if not self.enabled:
+            return ClassificationResult(DECISION_PROCESS, 0, chars_per_page, "classificador desabilitado")
+
+        if chars_per_page < self.min_chars_per_page:
+            result = ClassificationResult(
+                DECISION_NEEDS_OCR,
+                0,
+                chars_per_page,
+                f"{chars_per_page:.0f} caracteres por página; documento provavelmente digitalizado sem camada de texto"
+            )
+            return self._count(result)
+
+        text = self._fold("\n".join(pages))
+        signals: Dict[str, int] = {}
+        for match in _KEYWORD_RE.finditer(text):
+            signals[match.group(0)] = signals.get(match.group(0), 0) + 1
+        score = sum(_KEYWORDS[keyword] * min(hits, _MAX_HITS_PER_KEYWORD) for keyword, hits in signals.items())
+
+        clauses = len(_CLAUSE_RE.findall(text))
+        if clauses >= _MIN_CLAUSES:
+            signals["clausulas_numeradas"] = clauses
+            score += 2
+
+        tokens = _TOKEN_RE.findall(text)
+        numeric_ratio = sum(1 for token in tokens if _NUMERIC_TOKEN_RE.match(token)) / len(tokens) if tokens else 0.0
+        if numeric_ratio > _MAX_NUMERIC_RATIO:
+            signals["tokens_numericos_pct"] = round(numeric_ratio * 100)
+            score -= 5
+
+        if score >= self.min_score:
+            result = ClassificationResult(DECISION_PROCESS, score, chars_per_page, signals=signals)
+        else:
+            result = ClassificationResult(
+                DECISION_SKIP,
+                score,
+                chars_per_page,
+                f"sem conteúdo de habilitação (pontuação {score} < {self.min_score})",
+                signals
+            )
+        return self._count(result)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Decision counts and skip rate"""
+        with self._lock:
+            counts = dict(self.counts)
+        total = sum(counts.values())
+        skipped = counts[DECISION_SKIP] + counts[DECISION_NEEDS_OCR]
+        return {
+            "enabled": self.enabled,
+            "classified": total,
+            **counts,
+            "skip_rate": round(skipped / total, 3) if total else 0.0,
+        }
+
+    def _count(self, result: ClassificationResult) -> ClassificationResult:
+        """Record the decision"""
+        with self._lock:
+            self.counts[result.decision] += 1
+        if not result.needs_llm:
+            logger.info(f"Documento classificado como {result.decision}: {result.reason}")
+        return result
+
+    def _fold(self, text: str) -> str:
+        """Lowercase and strip accents"""
+        decomposed = unicodedata.normalize("NFKD", text.lower())
+        return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+
+# Global instance for easy import
+document_classifier = DocumentClassifierService()
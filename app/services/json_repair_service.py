@@ -0,0 +1,218 @@
+"""
+JSON Repair Service - Recover checklist JSON from imperfect LLM output
+"""
+import re
+import json
+import logging
+import threading
+from typing import Optional, Dict, Any, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Only fences wrapping the whole response; ``` inside string values is content
+_FENCE_RE = re.compile(r"^\s*```(?:json|JSON)?|```\s*$")
+_LIST_KEYS = ("checklistItems", "documents")
+# Typographic quotes used as JSON delimiters; inside a "..." string they are text ("Certidão “negativa”")
+_SMART_DOUBLE_QUOTES = "“”"
+_SMART_SINGLE_QUOTES = {"‘": "'", "’": "'"}
+_LITERALS = {"True": "true", "False": "false", "None": "null"}
+
+
+class JSONRepairService:
+    """Parse LLM responses, repairing common syntax errors and truncation locally"""
+
+    def __init__(self):
+        self.stats = {"parsed": 0, "repaired": 0, "salvaged": 0, "failed": 0}
+        self._lock = threading.Lock()
+
+    def parse_checklist(self, response: str, keys: Tuple[str, ...] = _LIST_KEYS) -> Optional[Dict[str, Any]]:
+        """Parse a checklist response holding a list under one of keys; returns None if nothing can be recovered"""
+        text = _FENCE_RE.sub("", response).strip()
+
+        parsed = self._loads_response(text, keys)
+        if parsed is not None:
+            self._count("parsed")
+            return parsed
+
+        # Drop prose around the outermost value and fix common syntax errors
+        candidate, complete = self._extract_outermost_value(text)
+        if candidate and complete:
+            parsed = self._loads_response(self._fix_syntax(candidate), keys)
+            if parsed is not None:
+                self._count("repaired")
+                logger.info("JSON da resposta LLM reparado localmente")
+                return parsed
+
+        # Truncated output: keep every complete checklist item
+        items = self._salvage_items(candidate or text, keys)
+        if items:
+            self._count("salvaged")
+            logger.warning(f"Resposta LLM truncada: {len(items)} itens completos recuperados")
+            return {keys[0]: items}
+
+        self._count("failed")
+        return None
+
+    def snapshot(self) -> Dict[str, int]:
+        """Parse outcome counters"""
+        with self._lock:
+            return dict(self.stats)
+
+    def _count(self, outcome: str) -> None:
+        """Increment an outcome counter"""
+        with self._lock:
+            self.stats[outcome] += 1
+
+    def _loads(self, text: str) -> Optional[Dict[str, Any]]:
+        """json.loads returning None on failure or non-object results"""
+        try:
+            parsed = json.loads(text)
+        except (json.JSONDecodeError, TypeError):
+            return None
+        return parsed if isinstance(parsed, dict) else None
+
+    def _loads_response(self, text: str, keys: Tuple[str, ...]) -> Optional[Dict[str, Any]]:
+        """Parsed response if it has a list under one of keys; a bare top-level array is that list"""
+        try:
+            parsed = json.loads(text)
+        except (json.JSONDecodeError, TypeError):
+            return None
+        if isinstance(parsed, list):
+            parsed = {keys[0]: parsed}
+        if not isinstance(parsed, dict) or not any(isinstance(parsed.get(key), (list, dict)) for key in keys):
+            return None
+        return parsed
+
+    def _closes_string(self, opener: str, char: str) -> bool:
+        """Whether char ends a string opened by opener; a string opened by a smart quote may close with either kind"""
+        return char == '"' or (opener != '"' and char in _SMART_DOUBLE_QUOTES)
+
+    def _scan(self, text: str, start: int) -> Tuple[int, bool]:
+        """Find the end of the bracketed value starting at text[start], skipping strings"""
+        depth = 0
+        opener = None
+        escaped = False
+        for index in range(start, len(text)):
+            char = text[index]
+            if opener:
+                if escaped:
+                    escaped = False
+                elif char == "\\":
+                    escaped = True
+                elif self._closes_string(opener, char):
+                    opener = None
+                continue
+
+            if char == '"' or char in _SMART_DOUBLE_QUOTES:
+                opener = char
+            elif char in "{[":
+                depth += 1
+            elif char in "}]":
+                depth -= 1
+                if depth == 0:
+                    return index, True
+        return len(text) - 1, False
+
+    def _extract_outermost_value(self, text: str) -> Tuple[Optional[str], bool]:
+        """Outermost {...} in the text, or the whole [...] if the text starts with one, and whether it is complete"""
+        start = 0 if text.startswith("[") else text.find("{")
+        if start < 0:
+            return None, False
+        end, complete = self._scan(text, start)
+        return text[start:end + 1], complete
+
+    def _fix_syntax(self, text: str) -> str:
+        """Fix trailing commas, smart quotes, Python literals and comments outside strings"""
+        output: List[str] = []
+        opener = None
+        escaped = False
+        index = 0
+        length = len(text)
+
+        while index < length:
+            char = text[index]
+            if opener:
+                if escaped:
+                    escaped = False
+                elif char == "\\":
+                    escaped = True
+                elif self._closes_string(opener, char):
+                    opener = None
+                    char = '"'
+                output.append(char)
+                index += 1
+                continue
+
+            # String delimiters, including typographic ones the model used instead of "
+            if char == '"' or char in _SMART_DOUBLE_QUOTES:
+                opener = char
+                output.append('"')
+                index += 1
+                continue
+
+            if char in _SMART_SINGLE_QUOTES:
+                output.append(_SMART_SINGLE_QUOTES[char])
+                index += 1
+                continue
+
+            # Line comments
+            if text.startswith("//", index):
+                newline = text.find("\n", index)
+                index = length if newline < 0 else newline
+                continue
+
+            # Trailing comma before a closing bracket
+            if char == ",":
+                lookahead = index + 1
+                while lookahead < length and text[lookahead].isspace():
+                    lookahead += 1
+                if lookahead < length and text[lookahead] in "}]":
+                    index += 1
+                    continue
+
+            # Python literals
+            if char in "TFN":
+                for literal, replacement in _LITERALS.items():
+                    if text.startswith(literal, index):
+                        output.append(replacement)
+                        index += len(literal)
+                        break
+                else:
+                    output.append(char)
+                    index += 1
+                continue
+
+            output.append(char)
+            index += 1
+
+        return "".join(output)
+
+    def _salvage_items(self, text: str, keys: Tuple[str, ...]) -> List[Dict[str, Any]]:
+        """Complete item objects from the checklist array of a truncated response"""
+        array_start = 0 if text.startswith("[") else -1
+        for key in keys:
+            key_index = text.find(f'"{key}"')
+            if key_index >= 0:
+                array_start = text.find("[", key_index)
+                break
+        if array_start < 0:
+            return []
+
+        items = []
+        index = array_start + 1
+        while True:
+            start = text.find("{", index)
+            if start < 0:
+                break
+            end, complete = self._scan(text, start)
+            if not complete:
+                break
+            item = self._loads(self._fix_syntax(text[start:end + 1]))
+            if item and item.get("name"):
+                items.append(item)
+            index = end + 1
+        return items
+
+
+# Global instance for easy import
+json_repair_service = JSONRepairService()
@@ -0,0 +1,374 @@
+"""
+Lane Scheduler Service - Priority lanes and per-source fairness for the consumer
+
+Each lane is its own SQS queue, long-polled by its own thread into a small
+buffer, so an urgent message is picked up while a backfill is being drained.
+Free worker slots are handed out by smooth weighted round robin across the
+lanes that have messages, optionally capped per lane. A token bucket per
+source (the producer, e.g. an agency's backfill) defers messages over its
+rate instead of letting them hold a slot: up to SOURCE_DEFER_HOLD_MAX per lane
+are held locally, past that they are made invisible again on the queue, which
+counts as one more receive towards the redrive policy's maxReceiveCount.
+
+A keeper thread extends the visibility timeout of messages waiting in a
+buffer or held, so they are not redelivered to another consumer meanwhile.
+"""
+import json
+import math
+import time
+import heapq
+import logging
+import itertools
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Optional, Dict, Any, List, Tuple, Deque
+from app.services.sqs_service import SQSService
+from app.services.metrics_service import percentile
+from app.config.config import (
+    SQS_LANE_QUEUES,
+    SQS_LANE_WEIGHTS,
+    SQS_LANE_MAX_IN_FLIGHT,
+    MAX_MESSAGES_PER_POLL,
+    POLL_WAIT_TIME,
+    SOURCE_RATE_PER_MINUTE,
+    SOURCE_BURST,
+    SOURCE_DEFER_MAX_SECONDS,
+    SOURCE_DEFER_HOLD_MAX,
+    SQS_VISIBILITY_TIMEOUT_SECONDS,
+)
+
+logger = logging.getLogger(__name__)
+
+# Wait times kept per lane for the percentiles
+_LATENCY_WINDOW = 500
+# A message that waited longer than this before starting gets a fresh visibility timeout
+_VISIBILITY_REFRESH_AFTER_SECONDS = 5
+
+
+class TokenBucket:
+    """Token bucket with reservations; rate in tokens per second
+
+    Tokens may go negative: each deferred message reserves a future token, so
+    a burst of deferred messages comes back spread out instead of all at once.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+
+    def reserve(self) -> float:
+        """Claim a token; returns 0 if it is available now, else the seconds until it is"""
+        self._refill()
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def cancel(self) -> None:
+        """Give back a reservation that will not be used"""
+        self.tokens = min(self.burst, self.tokens + 1)
+
+    def _refill(self) -> None:
+        """Add the tokens earned since the last update"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+
+@dataclass
+class Lane:
+    """One priority lane and its counters"""
+    name: str
+    sqs_service: SQSService
+    weight: int = 1
+    max_in_flight: Optional[int] = None
+    buffer: Deque[Tuple[dict, float]] = field(default_factory=deque)
+    # Deferred messages kept locally: heap of (ready at, sequence, message, received at, token reserved)
+    held: List[Tuple[float, int, dict, float, bool]] = field(default_factory=list)
+    in_flight: int = 0
+    current_weight: int = 0
+    received: int = 0
+    started: int = 0
+    deferred: int = 0
+    queue_wait: Deque[float] = field(default_factory=lambda: deque(maxlen=_LATENCY_WINDOW))
+    end_to_end: Deque[float] = field(default_factory=lambda: deque(maxlen=_LATENCY_WINDOW))
+
+    def has_capacity(self) -> bool:
+        """Whether the lane may start another message"""
+        return self.max_in_flight is None or self.in_flight < self.max_in_flight
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Lane counters with wait percentiles (lock must be held)"""
+        queue_wait = list(self.queue_wait)
+        end_to_end = list(self.end_to_end)
+        return {
+            "weight": self.weight,
+            "max_in_flight": self.max_in_flight,
+            "buffered": len(self.buffer),
+            "held": len(self.held),
+            "in_flight": self.in_flight,
+            "received": self.received,
+            "started": self.started,
+            "deferred": self.deferred,
+            "wait_p50_seconds": round(percentile(queue_wait, 50), 3),
+            "wait_p95_seconds": round(percentile(queue_wait, 95), 3),
+            "latency_p50_seconds": round(percentile(end_to_end, 50), 3),
+            "latency_p95_seconds": round(percentile(end_to_end, 95), 3),
+        }
+
+
+class LaneScheduler:
+    """Weighted, per-source fair hand-out of messages from several queues"""
+
+    def __init__(
+        self,
+        queues: Optional[Dict[str, str]] = None,
+        weights: Optional[Dict[str, int]] = None,
+        max_in_flight: Optional[Dict[str, int]] = None,
+        prefetch: int = MAX_MESSAGES_PER_POLL,
+        source_rate_per_minute: float = SOURCE_RATE_PER_MINUTE,
+        source_burst: int = SOURCE_BURST,
+        hold_max: int = SOURCE_DEFER_HOLD_MAX,
+        visibility_timeout: int = SQS_VISIBILITY_TIMEOUT_SECONDS
+    ):
+        queues = queues or SQS_LANE_QUEUES
+        weights = SQS_LANE_WEIGHTS if weights is None else weights
+        max_in_flight = SQS_LANE_MAX_IN_FLIGHT if max_in_flight is None else max_in_flight
+        self.lanes: List[Lane] = [
+            Lane(name, SQSService(url), max(1, weights.get(name, 1)), max_in_flight.get(name))
+            for name, url in queues.items()
+        ]
+        self.prefetch = max(1, prefetch)
+        self.source_rate = source_rate_per_minute / 60
+        self.source_burst = max(1, source_burst)
+        self.hold_max = max(0, hold_max)
+        self.visibility_timeout = max(0, visibility_timeout)
+
+        self._condition = threading.Condition()
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._deferred_by_source: Dict[str, int] = {}
+        self._visible_until: Dict[str, float] = {}
+        self._sequence = itertools.count()
+        self._pollers: List[threading.Thread] = []
+
+    def start(self, stop_event: threading.Event) -> None:
+        """Start one long-polling thread per lane and the visibility keeper"""
+        if not self.visibility_timeout:
+            # The shortest timeout of the lanes' queues is safe for all of them
+            timeouts = [timeout for timeout in (lane.sqs_service.get_visibility_timeout() for lane in self.lanes) if timeout]
+            self.visibility_timeout = min(timeouts) if timeouts else 0
+        if self.visibility_timeout:
+            keeper = threading.Thread(target=self._keep_visible, args=(stop_event,), name="sqs-visibility", daemon=True)
+            keeper.start()
+            self._pollers.append(keeper)
+        else:
+            logger.warning("Visibility timeout da fila desconhecido; mensagens em buffer não terão a visibilidade estendida")
+
+        for lane in self.lanes:
+            thread = threading.Thread(
+                target=self._poll_lane, args=(lane, stop_event), name=f"sqs-poll-{lane.name}", daemon=True
+            )
+            thread.start()
+            self._pollers.append(thread)
+
+    def next_message(self, stop_event: threading.Event) -> Optional[Tuple[Lane, dict]]:
+        """Block until a lane may start a message; None once stopping"""
+        with self._condition:
+            while True:
+                if stop_event.is_set():
+                    return None
+                self._release_held()
+                eligible = [lane for lane in self.lanes if lane.buffer and lane.has_capacity()]
+                if eligible:
+                    break
+                self._condition.wait(1)
+
+            lane = self._pick(eligible)
+            message, received_at = lane.buffer.popleft()
+            self._visible_until.pop(message.get("ReceiptHandle"), None)
+            lane.in_flight += 1
+            lane.started += 1
+            now = time.time()
+            lane.queue_wait.append(now - received_at)
+            sent_at = message.get("Attributes", {}).get("SentTimestamp")
+            if sent_at:
+                lane.end_to_end.append(now - int(sent_at) / 1000)
+            self._condition.notify_all()
+
+        # Processing gets the whole timeout, however long the message sat in the buffer
+        if self.visibility_timeout and now - received_at > _VISIBILITY_REFRESH_AFTER_SECONDS:
+            lane.sqs_service.change_message_visibility(message.get("ReceiptHandle"), self.visibility_timeout)
+        return lane, message
+
+    def finish(self, lane: Lane) -> None:
+        """A message of the lane finished (successfully or not)"""
+        with self._condition:
+            lane.in_flight -= 1
+            self._condition.notify_all()
+
+    def stop(self, timeout: float) -> List[Tuple[Lane, dict]]:
+        """Wait for the pollers to return and hand back the messages never started"""
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            self._condition.notify_all()
+        for thread in self._pollers:
+            thread.join(max(0.0, deadline - time.monotonic()))
+        with self._condition:
+            buffered = [(lane, message) for lane in self.lanes for message in self._waiting(lane)]
+            for lane in self.lanes:
+                lane.buffer.clear()
+                lane.held.clear()
+            self._visible_until.clear()
+        return buffered
+
+    def queue_attributes(self) -> Dict[str, Any]:
+        """Queue depth summed over the lanes, with the per-lane breakdown"""
+        lanes = {lane.name: lane.sqs_service.get_queue_attributes() for lane in self.lanes}
+        totals = {
+            key: sum(attributes[key] for attributes in lanes.values())
+            for key in ("visible", "not_visible", "delayed")
+        }
+        return {**totals, "lanes": lanes} if len(lanes) > 1 else totals
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Per-lane counters and deferrals per source"""
+        with self._condition:
+            return {
+                "lanes": {lane.name: lane.to_dict() for lane in self.lanes},
+                "source_rate_per_minute": round(self.source_rate * 60, 2),
+                "visibility_timeout_seconds": self.visibility_timeout,
+                "deferred_by_source": dict(self._deferred_by_source),
+            }
+
+    def _pick(self, eligible: List[Lane]) -> Lane:
+        """Smooth weighted round robin (condition must be held)"""
+        total = 0
+        for lane in eligible:
+            lane.current_weight += lane.weight
+            total += lane.weight
+        chosen = max(eligible, key=lambda lane: lane.current_weight)
+        chosen.current_weight -= total
+        return chosen
+
+    def _poll_lane(self, lane: Lane, stop_event: threading.Event) -> None:
+        """Keep the lane's buffer filled with messages its sources may run now"""
+        while not stop_event.is_set():
+            with self._condition:
+                while len(lane.buffer) >= self.prefetch and not stop_event.is_set():
+                    self._condition.wait(1)
+                room = self.prefetch - len(lane.buffer)
+            if stop_event.is_set():
+                break
+
+            # Visibility runs from the moment SQS hands a message out, at the latest once the poll returns
+            requested_at = time.monotonic()
+            try:
+                messages = lane.sqs_service.receive_messages(max_messages=min(room, 10), wait_time=POLL_WAIT_TIME)
+            except Exception as e:
+                logger.error(f"Erro ao consumir fila da faixa {lane.name}: {e}")
+                stop_event.wait(5)
+                continue
+
+            now = time.time()
+            deferred = []
+            with self._condition:
+                for message in messages:
+                    lane.received += 1
+                    receipt_handle = message.get("ReceiptHandle")
+                    if receipt_handle and self.visibility_timeout:
+                        self._visible_until[receipt_handle] = requested_at + self.visibility_timeout
+                    delay, reserved = self._admit_message(message)
+                    if not delay:
+                        lane.buffer.append((message, now))
+                        continue
+                    lane.deferred += 1
+                    if self.visibility_timeout and len(lane.held) < self.hold_max:
+                        # Held here with its visibility kept alive: no extra receive on the queue
+                        heapq.heappush(
+                            lane.held, (time.monotonic() + delay, next(self._sequence), message, now, reserved)
+                        )
+                    else:
+                        self._visible_until.pop(receipt_handle, None)
+                        deferred.append((message, delay))
+                self._condition.notify_all()
+            for message, delay in deferred:
+                self._defer(lane, message, delay)
+
+    def _release_held(self) -> None:
+        """Move held messages that are due into their lane's buffer (condition must be held)"""
+        now = time.monotonic()
+        for lane in self.lanes:
+            while lane.held and lane.held[0][0] <= now:
+                _, _, message, received_at, reserved = heapq.heappop(lane.held)
+                # A message deferred without a reservation asks its source's bucket again
+                delay, reserved = (0, True) if reserved else self._admit_message(message)
+                if delay:
+                    heapq.heappush(lane.held, (now + delay, next(self._sequence), message, received_at, reserved))
+                else:
+                    lane.buffer.append((message, received_at))
+
+    def _waiting(self, lane: Lane) -> List[dict]:
+        """Messages of a lane received but not started (condition must be held)"""
+        return [message for message, _ in lane.buffer] + [held[2] for held in lane.held]
+
+    def _keep_visible(self, stop_event: threading.Event) -> None:
+        """Extend the visibility of buffered and held messages before half of it has run out"""
+        while not stop_event.wait(max(1.0, self.visibility_timeout / 4)):
+            now = time.monotonic()
+            with self._condition:
+                expiring = [
+                    (lane, message["ReceiptHandle"])
+                    for lane in self.lanes
+                    for message in self._waiting(lane)
+                    if message.get("ReceiptHandle")
+                    and self._visible_until.get(message["ReceiptHandle"], now) - now < self.visibility_timeout / 2
+                ]
+            for lane, receipt_handle in expiring:
+                if lane.sqs_service.change_message_visibility(receipt_handle, self.visibility_timeout):
+                    with self._condition:
+                        if receipt_handle in self._visible_until:
+                            self._visible_until[receipt_handle] = now + self.visibility_timeout
+
+    def _admit_message(self, message: dict) -> Tuple[int, bool]:
+        """_admit for the message's source; a message that cannot be admitted runs without rate limiting"""
+        try:
+            return self._admit(self._source(message))
+        except Exception as e:
+            logger.error(f"Erro ao aplicar limite por origem à mensagem {message.get('MessageId')}: {e}")
+            return 0, False
+
+    def _admit(self, source: Optional[str]) -> Tuple[int, bool]:
+        """Seconds to defer a message of the source (0 to run it) and whether a token is reserved for it (condition must be held)"""
+        if not source or self.source_rate <= 0:
+            return 0, False
+        bucket = self._buckets.get(source)
+        if bucket is None:
+            bucket = self._buckets[source] = TokenBucket(self.source_rate, self.source_burst)
+        wait = bucket.reserve()
+        if not wait:
+            return 0, True
+        self._deferred_by_source[source] = self._deferred_by_source.get(source, 0) + 1
+        if wait > SOURCE_DEFER_MAX_SECONDS:
+            # Too far ahead to hold a reservation; the message asks again when it comes back
+            bucket.cancel()
+            return SOURCE_DEFER_MAX_SECONDS, False
+        return max(1, math.ceil(wait)), True
+
+    def _defer(self, lane: Lane, message: dict, delay: int) -> None:
+        """Make the message visible again after delay seconds; its next receive counts towards maxReceiveCount"""
+        receipt_handle = message.get("ReceiptHandle")
+        if receipt_handle and lane.sqs_service.change_message_visibility(receipt_handle, delay):
+            logger.info(f"Mensagem {message.get('MessageId')} adiada por {delay}s (limite por origem)")
+
+    def _source(self, message: dict) -> Optional[str]:
+        """Producer of a message: "source" message attribute, or "source" in the JSON body; only non-empty strings count"""
+        attribute = message.get("MessageAttributes", {}).get("source", {}).get("StringValue")
+        if attribute and isinstance(attribute, str):
+            return attribute
+        try:
+            body = json.loads(message.get("Body") or "{}")
+        except json.JSONDecodeError:
+            return None
+        source = body.get("source") if isinstance(body, dict) else None
+        return source if source and isinstance(source, str) else None
@@ -0,0 +1,313 @@
+"""
+LLM Batch Service - Pack several small documents into one LLM call
+
+Short editais are dominated by the fixed instruction block and per-request
+overhead. Documents submitted by concurrent workers for the same model within
+LLM_BATCH_WINDOW_SECONDS are sent together, up to a token budget, with a
+multi-document prompt that returns one checklist per document ID. Documents
+the response does not answer (parse failure, missing ID) fall back to a
+single call made by the submitting worker. The traffic recording gets each
+answered document's share of the call under its own message, so batched
+messages can be replayed one at a time.
+"""
+import json
+import time
+import logging
+import threading
+from dataclasses import dataclass, field
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FuturesTimeout
+from typing import Optional, Dict, Any, List, Callable
+from app.clients.llm_client import llm_service
+from app.models.llm_models import DocumentChecklistResponse, LLMPromptTemplate
+from app.services.token_estimator import token_estimator
+from app.services.json_repair_service import json_repair_service
+from app.services.model_router_service import model_router
+from app.services.traffic_recorder import traffic_recorder
+from app.services.deadline import Deadline
+from app.config.exceptions import DeadlineExceeded
+from app.config.config import (
+    LLM_MODEL_CONTEXT_TOKENS,
+    PREFLIGHT_CONTEXT_MARGIN,
+    LLM_BATCH_ENABLED,
+    LLM_BATCH_WINDOW_SECONDS,
+    LLM_BATCH_MAX_DOCUMENTS,
+    LLM_BATCH_MAX_DOCUMENT_TOKENS,
+    LLM_BATCH_TOKEN_BUDGET,
+    LLM_BATCH_OUTPUT_TOKENS_PER_DOCUMENT,
+)
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class BatchEntry:
+    """One document waiting for a batched call"""
+    text: str
+    known_documents: Optional[List[str]]
+    tokens: int
+    deadline: Deadline
+    message_id: Optional[str] = None
+    future: Future = field(default_factory=Future)
+
+
+@dataclass
+class PendingBatch:
+    """Documents for one model collected within the window"""
+    model: str
+    due_at: float
+    entries: List[BatchEntry] = field(default_factory=list)
+    tokens: int = 0
+
+
+class LLMBatchService:
+    """Micro-batching of small documents into multi-document LLM calls"""
+
+    def __init__(
+        self,
+        enabled: bool = LLM_BATCH_ENABLED,
+        window_seconds: float = LLM_BATCH_WINDOW_SECONDS,
+        max_documents: int = LLM_BATCH_MAX_DOCUMENTS,
+        max_document_tokens: int = LLM_BATCH_MAX_DOCUMENT_TOKENS,
+        token_budget: int = LLM_BATCH_TOKEN_BUDGET,
+        output_tokens_per_document: int = LLM_BATCH_OUTPUT_TOKENS_PER_DOCUMENT
+    ):
+        self.enabled = enabled
+        self.window_seconds = window_seconds
+        self.max_documents = max(1, max_documents)
+        self.max_document_tokens = max_document_tokens
+        self.token_budget = token_budget
+        self.output_tokens_per_document = output_tokens_per_document
+        self.llm_service = llm_service
+        self.prompt_template = LLMPromptTemplate()
+
+        self._condition = threading.Condition()
+        self._pending: Dict[str, PendingBatch] = {}
+        self._ready: List[PendingBatch] = []
+        self._thread: Optional[threading.Thread] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self.stats = {"submitted": 0, "calls": 0, "batched_documents": 0, "alone": 0, "fallbacks": 0}
+
+    def eligible(self, text: str, model: str) -> bool:
+        """Whether a document is small enough to share a call"""
+        return self.enabled and token_estimator.estimate(text, model) <= self.max_document_tokens
+
+    def process(
+        self,
+        text: str,
+        model: str,
+        known_documents: Optional[List[str]],
+        deadline: Optional[Deadline],
+        single_call: Callable[[], Optional[DocumentChecklistResponse]]
+    ) -> Optional[DocumentChecklistResponse]:
+        """Checklist of one document from a batched call, or from single_call if the batch did not answer it"""
+        deadline = deadline or Deadline.unbounded()
+        entry = self._submit(text, model, known_documents, deadline)
+        try:
+            result = entry.future.result(timeout=deadline.timeout("llm"))
+        except FuturesTimeout:
+            raise DeadlineExceeded("llm")
+        if result is not None:
+            return result
+        return single_call()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Counters and documents per call"""
+        with self._condition:
+            stats = dict(self.stats)
+            pending = sum(len(batch.entries) for batch in self._pending.values())
+        return {
+            "enabled": self.enabled,
+            "window_seconds": self.window_seconds,
+            "pending": pending,
+            **stats,
+            "documents_per_call": round(stats["batched_documents"] / stats["calls"], 2) if stats["calls"] else 0.0,
+        }
+
+    def _submit(self, text: str, model: str, known_documents: Optional[List[str]], deadline: Deadline) -> BatchEntry:
+        """Add a document to the model's pending batch, closing the batch when it is full"""
+        tokens = token_estimator.estimate(text + "\n".join(known_documents or []), model)
+        entry = BatchEntry(text, known_documents, tokens, deadline, traffic_recorder.current_message_id())
+        with self._condition:
+            self._ensure_started()
+            self.stats["submitted"] += 1
+            batch = self._pending.get(model)
+            if batch and not self._fits(batch, entry):
+                self._ready.append(self._pending.pop(model))
+                batch = None
+            if batch is None:
+                batch = self._pending[model] = PendingBatch(model, time.monotonic() + self.window_seconds)
+            batch.entries.append(entry)
+            batch.tokens += entry.tokens
+            if len(batch.entries) >= self.max_documents:
+                self._ready.append(self._pending.pop(model))
+            self._condition.notify_all()
+        return entry
+
+    def _fits(self, batch: PendingBatch, entry: BatchEntry) -> bool:
+        """Whether the entry can join the batch within the token budget and the model's window"""
+        documents = len(batch.entries) + 1
+        tokens = batch.tokens + entry.tokens
+        window = int(LLM_MODEL_CONTEXT_TOKENS.get(batch.model, 0) * (1 - PREFLIGHT_CONTEXT_MARGIN))
+        return (
+            tokens <= self.token_budget
+            and self._overhead_tokens(batch.model, documents) + tokens
+            + documents * self.output_tokens_per_document <= window
+        )
+
+    def _overhead_tokens(self, model: str, documents: int) -> int:
+        """Prompt tokens of the instructions and document separators"""
+        instructions = self.prompt_template.get_multi_document_extraction_prompt().format(documents="")
+        section = self.prompt_template.get_multi_document_section().format(
+            document_id="D00", known_documents="", document_content=""
+        )
+        return token_estimator.estimate(instructions, model) + documents * token_estimator.estimate(section, model)
+
+    def _ensure_started(self) -> None:
+        """Start the scheduler thread on first use (condition must be held)"""
+        if self._thread is None:
+            self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="llm-batch")
+            self._thread = threading.Thread(target=self._run, name="llm-batch-scheduler", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        """Send batches that are full or whose window has elapsed"""
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                for model in [model for model, batch in self._pending.items() if batch.due_at <= now]:
+                    self._ready.append(self._pending.pop(model))
+                for batch in self._ready:
+                    self._executor.submit(self._dispatch, batch)
+                self._ready.clear()
+
+                waiting = [batch.due_at for batch in self._pending.values()]
+                self._condition.wait(max(0.0, min(waiting) - now) if waiting else None)
+
+    def _dispatch(self, batch: PendingBatch) -> None:
+        """One multi-document call; unanswered documents resolve to None"""
+        results: List[Optional[DocumentChecklistResponse]] = [None] * len(batch.entries)
+        try:
+            if len(batch.entries) > 1:
+                results = self._call(batch)
+            else:
+                # A lone document gains nothing from the multi-document prompt
+                with self._condition:
+                    self.stats["alone"] += 1
+        except Exception as e:
+            if isinstance(e, DeadlineExceeded):
+                logger.warning("Prazo esgotado na chamada em lote; documentos serão processados individualmente")
+            else:
+                logger.error(f"Erro na chamada em lote com {len(batch.entries)} documentos: {e}")
+            with self._condition:
+                self.stats["fallbacks"] += len(batch.entries)
+        finally:
+            for entry, result in zip(batch.entries, results):
+                entry.future.set_result(result)
+
+    def _call(self, batch: PendingBatch) -> List[Optional[DocumentChecklistResponse]]:
+        """Send the batch and split the response back per document"""
+        document_ids = [f"D{index + 1}" for index in range(len(batch.entries))]
+        sections = []
+        for document_id, entry in zip(document_ids, batch.entries):
+            known = ""
+            if entry.known_documents:
+                known = "Documentos já identificados (não repetir):\n" + "\n".join(
+                    f"- {name}" for name in entry.known_documents
+                ) + "\n\n"
+            sections.append(self.prompt_template.get_multi_document_section().format(
+                document_id=document_id, known_documents=known, document_content=entry.text
+            ))
+        prompt = self.prompt_template.get_multi_document_extraction_prompt().format(documents="\n".join(sections))
+
+        # The call may take as long as the tightest deadline among the documents allows
+        deadline = min(
+            (entry.deadline for entry in batch.entries),
+            key=lambda item: item.remaining() if item.remaining() is not None else float("inf")
+        )
+        logger.info(f"Enviando {len(batch.entries)} documentos em uma chamada ao modelo {batch.model}")
+        response = self.llm_service.generate(
+            prompt=prompt,
+            model=batch.model,
+            max_tokens=len(batch.entries) * self.output_tokens_per_document,
+            temperature=0.1,
+            json_schema=self.prompt_template.get_multi_document_json_schema(),
+            deadline=deadline
+        )
+
+        checklists = self._checklists_by_id(response.content or "")
+        model_router.record_parse(response.model, checklists is not None)
+        checklists = checklists or {}
+
+        results: List[Optional[DocumentChecklistResponse]] = []
+        for document_id, entry in zip(document_ids, batch.entries):
+            items = checklists.get(document_id)
+            if items is None:
+                results.append(None)
+                continue
+            # Token usage is split in proportion to each document's share of the prompt
+            share = entry.tokens / batch.tokens if batch.tokens else 1 / len(batch.entries)
+            prompt_tokens = round(response.prompt_tokens * share) if response.prompt_tokens else None
+            completion_tokens = round(response.completion_tokens * share) if response.completion_tokens else None
+            results.append(DocumentChecklistResponse.from_documents(
+                items,
+                model_used=response.model,
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens
+            ))
+            self._record_share(entry, response, items, prompt_tokens, completion_tokens)
+
+        answered = sum(1 for result in results if result is not None)
+        with self._condition:
+            self.stats["calls"] += 1
+            self.stats["batched_documents"] += answered
+            self.stats["fallbacks"] += len(results) - answered
+        if answered < len(results):
+            logger.warning(f"Resposta em lote sem checklist para {len(results) - answered} de {len(results)} documentos")
+        return results
+
+    def _record_share(
+        self,
+        entry: BatchEntry,
+        response,
+        items: List[Any],
+        prompt_tokens: Optional[int],
+        completion_tokens: Optional[int]
+    ) -> None:
+        """Record a document's part of the call for its message, as if it had been a single call"""
+        if entry.message_id is None:
+            return
+        traffic_recorder.bind_message(entry.message_id)
+        try:
+            traffic_recorder.record_llm(
+                response.model,
+                response.latency_seconds,
+                len(entry.text),
+                json.dumps({"checklistItems": items}, ensure_ascii=False),
+                prompt_tokens,
+                completion_tokens
+            )
+        finally:
+            traffic_recorder.bind_message(None)
+
+    def _checklists_by_id(self, content: str) -> Optional[Dict[str, List[Any]]]:
+        """Checklist items per document ID; accepts a results list or an object keyed by ID"""
+        parsed = json_repair_service.parse_checklist(content, keys=("results",))
+        if not parsed:
+            return None
+
+        results = parsed["results"]
+        checklists: Dict[str, List[Any]] = {}
+        if isinstance(results, dict):
+            for document_id, value in results.items():
+                items = value.get("checklistItems") if isinstance(value, dict) else value
+                if isinstance(items, list):
+                    checklists[str(document_id).strip()] = items
+        elif isinstance(results, list):
+            for value in results:
+                if isinstance(value, dict) and isinstance(value.get("checklistItems"), list):
+                    checklists[str(value.get("documentId", "")).strip()] = value["checklistItems"]
+        return checklists
+
+
+# Global instance for easy import
+llm_batch_service = LLMBatchService()
@@ -0,0 +1,314 @@
+"""
+Memory Profiler Service - RSS per job and stage, and allocation diffs between jobs
+
+The consumer is long-lived, so slow growth (PDF buffers, reader objects, large
+prompt strings kept alive) only shows after days. When enabled, RSS is read at
+every stage transition and by a sampler thread, which gives each job and stage
+an RSS delta and the peak reached while it ran. With concurrent workers RSS is
+process-wide, so a job's peak includes what other jobs held at the same time.
+
+With MEMORY_TRACEMALLOC_EVERY_JOBS > 0, tracemalloc is started and every N
+finished jobs a snapshot is compared with the previous one; the allocation
+sites that grew the most are kept for the status endpoint and logged.
+"""
+import os
+import sys
+import time
+import logging
+import resource
+import threading
+import tracemalloc
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Optional, Dict, Any, Deque
+from app.config.config import (
+    MEMORY_PROFILING_ENABLED,
+    MEMORY_SAMPLE_INTERVAL_SECONDS,
+    MEMORY_TRACEMALLOC_EVERY_JOBS,
+    MEMORY_TRACEMALLOC_TOP,
+)
+
+logger = logging.getLogger(__name__)
+
+_MB = 1024 * 1024
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+# Finished jobs kept for the status endpoint and the growth trend
+_RECENT_JOBS = 50
+_TREND_WINDOW = 200
+_TRACEMALLOC_FRAMES = 5
+
+
+def peak_rss_bytes() -> int:
+    """Highest resident set size of the process so far"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS and KB on Linux
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def rss_bytes() -> int:
+    """Current resident set size; falls back to the peak where /proc is not available"""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return peak_rss_bytes()
+
+
+def _mb(value: float) -> float:
+    """Bytes as MB rounded for reports"""
+    return round(value / _MB, 1)
+
+
+@dataclass
+class _Span:
+    """RSS at the start of a job or stage and the peak seen while it ran"""
+    name: str
+    start_rss: int
+    peak_rss: int = 0
+
+    def __post_init__(self):
+        self.peak_rss = max(self.peak_rss, self.start_rss)
+
+
+@dataclass
+class _JobMemory:
+    """Memory of one job while it runs"""
+    job_id: str
+    message_id: Optional[str]
+    span: _Span
+    stages: Dict[str, Dict[str, float]] = field(default_factory=dict)
+
+
+@dataclass
+class _StageTotals:
+    """Aggregated memory of a stage over all jobs"""
+    count: int = 0
+    delta_total: int = 0
+    delta_max: int = 0
+    peak_growth_max: int = 0
+
+    def add(self, delta: int, peak_growth: int) -> None:
+        """Account one finished stage"""
+        self.count += 1
+        self.delta_total += delta
+        self.delta_max = max(self.delta_max, delta)
+        self.peak_growth_max = max(self.peak_growth_max, peak_growth)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Averages and maxima in MB"""
+        return {
+            "count": self.count,
+            "rss_delta_avg_mb": _mb(self.delta_total / self.count) if self.count else 0.0,
+            "rss_delta_max_mb": _mb(self.delta_max),
+            "peak_growth_max_mb": _mb(self.peak_growth_max),
+        }
+
+
+class MemoryProfiler:
+    """Per-job and per-stage RSS accounting with optional tracemalloc diffs"""
+
+    def __init__(
+        self,
+        enabled: bool = MEMORY_PROFILING_ENABLED,
+        sample_interval: float = MEMORY_SAMPLE_INTERVAL_SECONDS,
+        tracemalloc_every_jobs: int = MEMORY_TRACEMALLOC_EVERY_JOBS,
+        tracemalloc_top: int = MEMORY_TRACEMALLOC_TOP
+    ):
+        self.enabled = enabled
+        self.sample_interval = sample_interval
+        self.tracemalloc_every_jobs = max(0, tracemalloc_every_jobs)
+        self.tracemalloc_top = tracemalloc_top
+
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, _JobMemory] = {}
+        # Stage currently open on each thread (helper threads of a job have their own)
+        self._stages: Dict[int, tuple] = {}
+        self._stage_totals: Dict[str, _StageTotals] = {}
+        self._recent: Deque[Dict[str, Any]] = deque(maxlen=_RECENT_JOBS)
+        self._rss_after_job: Deque[int] = deque(maxlen=_TREND_WINDOW)
+        self._baseline_rss = rss_bytes() if enabled else 0
+        self._finished = 0
+        self._started = False
+
+        self._last_snapshot: Optional[tracemalloc.Snapshot] = None
+        self._last_report: Optional[Dict[str, Any]] = None
+
+    def job_started(self, job_id: str, message_id: Optional[str]) -> None:
+        """Open a job on the current thread"""
+        if not self.enabled:
+            return
+        rss = rss_bytes()
+        with self._lock:
+            self._ensure_started()
+            self._jobs[job_id] = _JobMemory(job_id, message_id, _Span(job_id, rss))
+            self._open_stage(job_id, "received", rss)
+
+    def stage_changed(self, job_id: Optional[str], stage: str) -> None:
+        """Close the current thread's stage and open the next one"""
+        if not self.enabled or not job_id:
+            return
+        rss = rss_bytes()
+        with self._lock:
+            self._close_stage(rss)
+            self._open_stage(job_id, stage, rss)
+
+    def thread_released(self) -> None:
+        """A helper thread stopped working on a job"""
+        if not self.enabled:
+            return
+        rss = rss_bytes()
+        with self._lock:
+            self._close_stage(rss)
+
+    def job_finished(self, job_id: Optional[str], success: bool) -> None:
+        """Close the job, record its memory and take a tracemalloc diff every N jobs"""
+        if not self.enabled or not job_id:
+            return
+        rss = rss_bytes()
+        with self._lock:
+            self._close_stage(rss)
+            job = self._jobs.pop(job_id, None)
+            if job is None:
+                return
+            job.span.peak_rss = max(job.span.peak_rss, rss)
+            self._recent.append({
+                "job_id": job.job_id,
+                "message_id": job.message_id,
+                "success": success,
+                "rss_start_mb": _mb(job.span.start_rss),
+                "rss_end_mb": _mb(rss),
+                "rss_delta_mb": _mb(rss - job.span.start_rss),
+                "rss_peak_mb": _mb(job.span.peak_rss),
+                "stages": job.stages,
+            })
+            self._rss_after_job.append(rss)
+            self._finished += 1
+            take_snapshot = self.tracemalloc_every_jobs and self._finished % self.tracemalloc_every_jobs == 0
+
+        if take_snapshot:
+            self._diff_allocations()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """RSS, per-stage totals, recent jobs, growth trend and the last allocation diff"""
+        if not self.enabled:
+            return {"enabled": False}
+        rss = rss_bytes()
+        with self._lock:
+            return {
+                "enabled": True,
+                "rss_mb": _mb(rss),
+                "baseline_rss_mb": _mb(self._baseline_rss),
+                "peak_rss_mb": _mb(peak_rss_bytes()),
+                "jobs_finished": self._finished,
+                "growth_mb_per_100_jobs": self._growth_per_100_jobs(),
+                "stages": {stage: totals.to_dict() for stage, totals in self._stage_totals.items()},
+                "recent_jobs": list(self._recent)[-10:],
+                "tracemalloc": self._last_report,
+            }
+
+    def _ensure_started(self) -> None:
+        """Start the sampler thread and tracemalloc on first use (lock must be held)"""
+        if self._started:
+            return
+        self._started = True
+        if self.tracemalloc_every_jobs and not tracemalloc.is_tracing():
+            tracemalloc.start(_TRACEMALLOC_FRAMES)
+            logger.info(f"tracemalloc ativado; comparação de alocações a cada {self.tracemalloc_every_jobs} jobs")
+        if self.sample_interval > 0:
+            threading.Thread(target=self._sample, name="memory-sampler", daemon=True).start()
+
+    def _sample(self) -> None:
+        """Raise the peak of every running job and stage"""
+        while True:
+            time.sleep(self.sample_interval)
+            rss = rss_bytes()
+            with self._lock:
+                self._raise_peaks(rss)
+
+    def _raise_peaks(self, rss: int) -> None:
+        """Apply an RSS reading to the open jobs and stages (lock must be held)"""
+        for job in self._jobs.values():
+            job.span.peak_rss = max(job.span.peak_rss, rss)
+        for _, span in self._stages.values():
+            span.peak_rss = max(span.peak_rss, rss)
+
+    def _open_stage(self, job_id: str, stage: str, rss: int) -> None:
+        """Start timing memory of a stage on the current thread (lock must be held)"""
+        self._stages[threading.get_ident()] = (job_id, _Span(stage, rss))
+
+    def _close_stage(self, rss: int) -> None:
+        """Account the current thread's open stage (lock must be held)"""
+        current = self._stages.pop(threading.get_ident(), None)
+        if current is None:
+            return
+        job_id, span = current
+        self._raise_peaks(rss)
+        span.peak_rss = max(span.peak_rss, rss)
+        delta = rss - span.start_rss
+        peak_growth = span.peak_rss - span.start_rss
+        self._stage_totals.setdefault(span.name, _StageTotals()).add(delta, peak_growth)
+
+        job = self._jobs.get(job_id)
+        if job is not None:
+            stage = job.stages.setdefault(span.name, {"rss_delta_mb": 0.0, "peak_growth_mb": 0.0})
+            stage["rss_delta_mb"] = round(stage["rss_delta_mb"] + _mb(delta), 1)
+            stage["peak_growth_mb"] = max(stage["peak_growth_mb"], _mb(peak_growth))
+
+    def _growth_per_100_jobs(self) -> Optional[float]:
+        """Least-squares slope of RSS after each job; a steady positive value suggests a leak (lock must be held)"""
+        points = list(self._rss_after_job)
+        if len(points) < 10:
+            return None
+        count = len(points)
+        mean_x = (count - 1) / 2
+        mean_y = sum(points) / count
+        covariance = sum((index - mean_x) * (value - mean_y) for index, value in enumerate(points))
+        variance = sum((index - mean_x) ** 2 for index in range(count))
+        return _mb(covariance / variance * 100)
+
+    def _diff_allocations(self) -> None:
+        """Compare allocations with the previous snapshot and keep the largest growths"""
+        if not tracemalloc.is_tracing():
+            return
+        try:
+            current = tracemalloc.take_snapshot().filter_traces((
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            ))
+            traced, traced_peak = tracemalloc.get_traced_memory()
+            previous = self._last_snapshot
+            self._last_snapshot = current
+            if previous is None:
+                return
+
+            top = [
+                {
+                    "location": str(stat.traceback[0]),
+                    "size_diff_kb": round(stat.size_diff / 1024, 1),
+                    "size_kb": round(stat.size / 1024, 1),
+                    "count_diff": stat.count_diff,
+                }
+                for stat in current.compare_to(previous, "lineno")[:self.tracemalloc_top]
+            ]
+            report = {
+                "jobs_between": self.tracemalloc_every_jobs,
+                "at": time.time(),
+                "traced_mb": _mb(traced),
+                "traced_peak_mb": _mb(traced_peak),
+                "top_growth": top,
+            }
+            with self._lock:
+                self._last_report = report
+
+            if top:
+                logger.info(
+                    f"Maiores crescimentos de memória nos últimos {self.tracemalloc_every_jobs} jobs: "
+                    + "; ".join(f"{item['location']} {item['size_diff_kb']:+.1f} KB" for item in top[:3])
+                )
+
+        except Exception as e:
+            logger.error(f"Erro ao comparar snapshots do tracemalloc: {e}")
+
+
+# Global instance for easy import
+memory_profiler = MemoryProfiler()
@@ -0,0 +1,230 @@
+"""
+Metrics Service - Track what the consumer is doing in real time
+"""
+import time
+import uuid
+import logging
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Optional, Dict, Any, List, Callable, Deque, Tuple
+from app.services.memory_profiler_service import memory_profiler, MemoryProfiler
+from app.config.config import QUEUE_STATS_TTL_SECONDS
+
+logger = logging.getLogger(__name__)
+
+THROUGHPUT_WINDOWS_MINUTES = (1, 5, 15)
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of a list of values"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+@dataclass
+class JobState:
+    """A message currently being processed"""
+    job_id: str
+    message_id: Optional[str]
+    stage: str = "received"
+    started_at: float = field(default_factory=time.time)
+    stage_started_at: float = field(default_factory=time.time)
+
+    def to_dict(self, now: float) -> Dict[str, Any]:
+        """Convert to dictionary with ages relative to now"""
+        return {
+            "job_id": self.job_id,
+            "message_id": self.message_id,
+            "stage": self.stage,
+            "age_seconds": round(now - self.started_at, 1),
+            "stage_age_seconds": round(now - self.stage_started_at, 1),
+        }
+
+
+class ConsumerMetrics:
+    """In-memory consumer metrics: in-flight jobs, throughput, errors and queue depth"""
+
+    def __init__(self, queue_stats_ttl: float = QUEUE_STATS_TTL_SECONDS, memory: MemoryProfiler = memory_profiler):
+        self.memory = memory
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._jobs: Dict[str, JobState] = {}
+        self._completions: Deque[Tuple[float, bool]] = deque()
+        self._last_errors: Dict[str, Dict[str, Any]] = {}
+        self._totals = {"succeeded": 0, "failed": 0}
+        self._deadline_overruns: Dict[str, int] = {}
+
+        self._queue_stats_ttl = queue_stats_ttl
+        self._queue_stats_provider: Optional[Callable[[], Dict[str, Any]]] = None
+        self._queue_stats: Optional[Dict[str, Any]] = None
+        self._queue_stats_fetched_at = 0.0
+        self._queue_stats_lock = threading.Lock()
+        self._queue_stats_refreshing = False
+
+    def start_job(self, message_id: Optional[str] = None) -> str:
+        """Register a job for the current thread"""
+        job = JobState(job_id=uuid.uuid4().hex[:12], message_id=message_id)
+        with self._lock:
+            self._jobs[job.job_id] = job
+        self._local.job_id = job.job_id
+        self.memory.job_started(job.job_id, message_id)
+        return job.job_id
+
+    def current_job_id(self) -> Optional[str]:
+        """Job bound to the current thread"""
+        return getattr(self._local, "job_id", None)
+
+    def bind_job(self, job_id: Optional[str]) -> None:
+        """Bind an existing job to the current thread (for helper threads working on it)"""
+        if job_id is None:
+            self.memory.thread_released()
+        self._local.job_id = job_id
+
+    def set_stage(self, stage: str) -> None:
+        """Move the current thread's job to a new stage (no-op outside a job)"""
+        job_id = getattr(self._local, "job_id", None)
+        if not job_id:
+            return
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job:
+                job.stage = stage
+                job.stage_started_at = time.time()
+        self.memory.stage_changed(job_id, stage)
+
+    def current_stage(self) -> Optional[str]:
+        """Stage of the current thread's job"""
+        job_id = getattr(self._local, "job_id", None)
+        with self._lock:
+            job = self._jobs.get(job_id) if job_id else None
+            return job.stage if job else None
+
+    def record_error(self, error: str, stage: Optional[str] = None) -> None:
+        """Record the last error seen for a stage (defaults to the current stage)"""
+        stage = stage or self.current_stage() or "consumer"
+        with self._lock:
+            self._last_errors[stage] = {"error": str(error), "at": time.time()}
+
+    def record_deadline_exceeded(self, stage: str) -> None:
+        """Count a message that ran out of its deadline in a stage"""
+        with self._lock:
+            self._deadline_overruns[stage] = self._deadline_overruns.get(stage, 0) + 1
+
+    def finish_job(self, success: bool) -> None:
+        """Complete the current thread's job"""
+        job_id = getattr(self._local, "job_id", None)
+        self._local.job_id = None
+        now = time.time()
+        with self._lock:
+            self._jobs.pop(job_id, None)
+            self._completions.append((now, success))
+            self._totals["succeeded" if success else "failed"] += 1
+            self._trim_completions(now)
+        self.memory.job_finished(job_id, success)
+
+    def get_in_flight_count(self) -> int:
+        """Number of jobs currently being processed"""
+        with self._lock:
+            return len(self._jobs)
+
+    def set_queue_stats_provider(self, provider: Callable[[], Dict[str, Any]]) -> None:
+        """Register the function used to fetch queue depth"""
+        self._queue_stats_provider = provider
+
+    def get_queue_stats(self) -> Optional[Dict[str, Any]]:
+        """Queue depth, refreshed at most once per TTL"""
+        if not self._queue_stats_provider:
+            return None
+
+        with self._queue_stats_lock:
+            now = time.time()
+            if self._queue_stats is None or now - self._queue_stats_fetched_at >= self._queue_stats_ttl:
+                try:
+                    self._queue_stats = self._queue_stats_provider()
+                except Exception as e:
+                    logger.error(f"Erro ao obter atributos da fila: {e}")
+                self._queue_stats_fetched_at = now
+
+            if self._queue_stats is None:
+                return None
+            return {**self._queue_stats, "age_seconds": round(now - self._queue_stats_fetched_at, 1)}
+
+    def peek_queue_stats(self) -> Optional[Dict[str, Any]]:
+        """Last fetched queue depth without blocking; a stale value is refreshed in the background"""
+        if not self._queue_stats_provider:
+            return None
+
+        now = time.time()
+        stats, fetched_at = self._queue_stats, self._queue_stats_fetched_at
+        if stats is None or now - fetched_at >= self._queue_stats_ttl:
+            self._refresh_queue_stats_async()
+        if stats is None:
+            return None
+        return {**stats, "age_seconds": round(now - fetched_at, 1)}
+
+    def _refresh_queue_stats_async(self) -> None:
+        """Fetch queue depth on a helper thread, at most one at a time"""
+        with self._lock:
+            if self._queue_stats_refreshing:
+                return
+            self._queue_stats_refreshing = True
+
+        def refresh() -> None:
+            try:
+                self.get_queue_stats()
+            finally:
+                with self._lock:
+                    self._queue_stats_refreshing = False
+
+        threading.Thread(target=refresh, name="queue-stats-refresh", daemon=True).start()
+
+    def get_throughput(self) -> Dict[str, float]:
+        """Completed messages per minute over sliding windows"""
+        now = time.time()
+        with self._lock:
+            self._trim_completions(now)
+            timestamps = [ts for ts, _ in self._completions]
+
+        throughput = {}
+        for minutes in THROUGHPUT_WINDOWS_MINUTES:
+            since = now - minutes * 60
+            count = sum(1 for ts in timestamps if ts >= since)
+            throughput[f"{minutes}m"] = round(count / minutes, 2)
+        return throughput
+
+    def snapshot(self, include_queue: bool = True) -> Dict[str, Any]:
+        """Full metrics snapshot"""
+        now = time.time()
+        with self._lock:
+            jobs = [job.to_dict(now) for job in self._jobs.values()]
+            last_errors = {
+                stage: {"error": info["error"], "age_seconds": round(now - info["at"], 1)}
+                for stage, info in self._last_errors.items()
+            }
+            totals = dict(self._totals)
+            deadline_overruns = dict(self._deadline_overruns)
+
+        return {
+            "in_flight": len(jobs),
+            "jobs": sorted(jobs, key=lambda job: -job["age_seconds"]),
+            "messages_per_minute": self.get_throughput(),
+            "totals": totals,
+            "last_errors": last_errors,
+            "deadline_overruns": deadline_overruns,
+            "memory": self.memory.snapshot(),
+            "queue": self.get_queue_stats() if include_queue else None,
+        }
+
+    def _trim_completions(self, now: float) -> None:
+        """Drop completions older than the largest window (lock must be held)"""
+        horizon = now - max(THROUGHPUT_WINDOWS_MINUTES) * 60
+        while self._completions and self._completions[0][0] < horizon:
+            self._completions.popleft()
+
+
+# Global instance for easy import
+consumer_metrics = ConsumerMetrics()
@@ -0,0 +1,167 @@
+"""
+Model Router Service - Choose an LLM model per request from observed latency and quality
+"""
+import random
+import logging
+import threading
+from collections import deque
+from typing import Optional, Dict, Any, List, Deque, Tuple
+from app.services.metrics_service import percentile
+from app.config.config import (
+    LLM_MODELS,
+    LLM_MODEL_COSTS,
+    DEFAULT_LLM_MODEL,
+    MODEL_ROUTING_POLICY,
+    MODEL_ROUTER_WINDOW,
+    MODEL_ROUTER_MIN_SAMPLES,
+    MODEL_ROUTER_MAX_ERROR_RATE,
+    MODEL_ROUTER_MIN_JSON_RATE,
+    MODEL_ROUTER_SLO_P95_SECONDS,
+    MODEL_ROUTER_EXPLORE_RATE,
+    MODEL_ROUTER_WEIGHTS,
+)
+
+logger = logging.getLogger(__name__)
+
+ROUTING_POLICIES = ("static", "fastest", "cheapest_slo", "weighted")
+
+
+class ModelStats:
+    """Rolling window of call outcomes for one model"""
+
+    def __init__(self, window: int = MODEL_ROUTER_WINDOW):
+        self.calls: Deque[Tuple[float, bool]] = deque(maxlen=window)
+        self.parses: Deque[bool] = deque(maxlen=window)
+
+    @property
+    def samples(self) -> int:
+        """Number of calls in the window"""
+        return len(self.calls)
+
+    def latencies(self) -> List[float]:
+        """Latencies of successful calls"""
+        return [latency for latency, success in self.calls if success]
+
+    def error_rate(self) -> float:
+        """Fraction of failed calls"""
+        if not self.calls:
+            return 0.0
+        return sum(1 for _, success in self.calls if not success) / len(self.calls)
+
+    def json_rate(self) -> float:
+        """Fraction of responses that parsed as a valid checklist"""
+        if not self.parses:
+            return 1.0
+        return sum(1 for ok in self.parses if ok) / len(self.parses)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Convert to dictionary"""
+        latencies = self.latencies()
+        return {
+            "samples": self.samples,
+            "latency_p50_seconds": round(percentile(latencies, 50), 2),
+            "latency_p95_seconds": round(percentile(latencies, 95), 2),
+            "error_rate": round(self.error_rate(), 3),
+            "json_success_rate": round(self.json_rate(), 3),
+        }
+
+
+class ModelRouter:
+    """Pick a model from LLM_MODELS according to a routing policy"""
+
+    def __init__(self, policy: str = MODEL_ROUTING_POLICY):
+        if policy not in ROUTING_POLICIES:
+            logger.warning(f"Política de roteamento desconhecida '{policy}', usando 'static'")
+            policy = "static"
+        self.policy = policy
+        self.stats: Dict[str, ModelStats] = {model: ModelStats() for model in LLM_MODELS}
+        self._lock = threading.Lock()
+
+    def record_call(self, model: str, latency: Optional[float], success: bool) -> None:
+        """Record the outcome of a provider call"""
+        if model not in self.stats:
+            return
+        with self._lock:
+            self.stats[model].calls.append((latency or 0.0, success))
+
+    def record_parse(self, model: Optional[str], success: bool) -> None:
+        """Record whether a model's response parsed as a valid checklist"""
+        if model not in self.stats:
+            return
+        with self._lock:
+            self.stats[model].parses.append(success)
+
+    def choose_model(self, policy: Optional[str] = None) -> str:
+        """Model to use for the next request"""
+        policy = policy or self.policy
+        if policy == "static":
+            return DEFAULT_LLM_MODEL
+
+        with self._lock:
+            healthy = self._healthy_models()
+            if not healthy:
+                return DEFAULT_LLM_MODEL
+
+            # Keep estimates fresh for models with too few samples
+            unexplored = [m for m in healthy if self.stats[m].samples < MODEL_ROUTER_MIN_SAMPLES]
+            if unexplored:
+                return random.choice(unexplored)
+            # Occasionally probe every model so an unhealthy one can recover
+            if random.random() < MODEL_ROUTER_EXPLORE_RATE:
+                return random.choice(list(self.stats))
+
+            if policy == "fastest":
+                return self._fastest(healthy)
+            if policy == "cheapest_slo":
+                return self._cheapest_within_slo(healthy)
+            return self._weighted(healthy)
+
+    def _healthy_models(self) -> List[str]:
+        """Models within the error and JSON success thresholds (lock must be held)"""
+        healthy = []
+        for model, stats in self.stats.items():
+            if stats.samples >= MODEL_ROUTER_MIN_SAMPLES and stats.error_rate() > MODEL_ROUTER_MAX_ERROR_RATE:
+                continue
+            if len(stats.parses) >= MODEL_ROUTER_MIN_SAMPLES and stats.json_rate() < MODEL_ROUTER_MIN_JSON_RATE:
+                continue
+            healthy.append(model)
+        return healthy
+
+    def _p50(self, model: str) -> float:
+        """Median latency, infinite when unknown"""
+        latencies = self.stats[model].latencies()
+        return percentile(latencies, 50) if latencies else float("inf")
+
+    def _fastest(self, models: List[str]) -> str:
+        """Lowest median latency"""
+        return min(models, key=self._p50)
+
+    def _cheapest_within_slo(self, models: List[str]) -> str:
+        """Cheapest model whose p95 meets the SLO, falling back to the fastest"""
+        within_slo = [
+            model for model in models
+            if self.stats[model].latencies()
+            and percentile(self.stats[model].latencies(), 95) <= MODEL_ROUTER_SLO_P95_SECONDS
+        ]
+        if not within_slo:
+            return self._fastest(models)
+        return min(within_slo, key=lambda model: (LLM_MODEL_COSTS.get(model, 0.0), self._p50(model)))
+
+    def _weighted(self, models: List[str]) -> str:
+        """Random split following MODEL_ROUTER_WEIGHTS"""
+        weights = [MODEL_ROUTER_WEIGHTS.get(model, 1.0) for model in models]
+        if not any(weights):
+            return self._fastest(models)
+        return random.choices(models, weights=weights, k=1)[0]
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Router policy and per-model statistics"""
+        with self._lock:
+            return {
+                "policy": self.policy,
+                "models": {model: stats.to_dict() for model, stats in self.stats.items()},
+            }
+
+
+# Global instance for easy import
+model_router = ModelRouter()
@@ -0,0 +1,190 @@
+"""
+PDF Extraction Backends - Interchangeable page text extractors
+
+PyPDF2 is the default and always installed. PyMuPDF, pypdfium2 and
+pdfplumber are used when installed and selected with PDF_EXTRACTION_BACKEND.
+"""
+import io
+import mmap
+import logging
+import importlib
+import importlib.util
+from abc import ABC, abstractmethod
+from typing import Optional, List, Iterator, Dict, Type, Union, BinaryIO
+from app.config.config import PDF_EXTRACTION_BACKEND
+
+logger = logging.getLogger(__name__)
+
+PDFSource = Union[bytes, BinaryIO]
+
+
+class BufferReader(io.RawIOBase):
+    """Read-only seekable stream over an in-memory buffer; io.BytesIO would copy a bytearray"""
+
+    def __init__(self, buffer: Union[bytes, bytearray, memoryview]):
+        super().__init__()
+        self._view = memoryview(buffer).toreadonly()
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, target) -> int:
+        chunk = self._view[self._position:self._position + len(target)]
+        target[:len(chunk)] = chunk
+        self._position += len(chunk)
+        return len(chunk)
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._position, io.SEEK_END: len(self._view)}[whence]
+        self._position = max(0, base + offset)
+        return self._position
+
+    def tell(self) -> int:
+        return self._position
+
+    def getbuffer(self) -> memoryview:
+        """The underlying buffer, as io.BytesIO.getbuffer"""
+        return self._view
+
+
+class PDFExtractionBackend(ABC):
+    """Base class: yield the text of each page of a PDF"""
+
+    name = ""
+    module = ""
+
+    def __init__(self):
+        # Imported once per backend instead of on every extraction
+        self.lib = importlib.import_module(self.module)
+
+    @classmethod
+    def is_available(cls) -> bool:
+        """Whether the backend's library is installed"""
+        return importlib.util.find_spec(cls.module) is not None
+
+    @abstractmethod
+    def iter_pages(self, source: PDFSource) -> Iterator[str]:
+        """Yield the text of each page"""
+
+    def _as_stream(self, source: PDFSource) -> BinaryIO:
+        """Seekable stream positioned at the start"""
+        if isinstance(source, bytearray):
+            return BufferReader(source)
+        if isinstance(source, bytes):
+            # BytesIO shares an immutable bytes object instead of copying it
+            return io.BytesIO(source)
+        source.seek(0)
+        return source
+
+    def _as_buffer(self, source: PDFSource) -> Union[bytes, bytearray, memoryview]:
+        """Contiguous buffer, without copying bytes, bytearray or mmap sources"""
+        if isinstance(source, (bytes, bytearray)):
+            return source
+        if isinstance(source, mmap.mmap):
+            return memoryview(source)
+        if hasattr(source, "getbuffer"):
+            return source.getbuffer()
+        source.seek(0)
+        return source.read()
+
+
+class PyPDF2Backend(PDFExtractionBackend):
+    """Pure-Python extraction with PyPDF2"""
+
+    name = "pypdf2"
+    module = "PyPDF2"
+
+    def iter_pages(self, source: PDFSource) -> Iterator[str]:
+        reader = self.lib.PdfReader(self._as_stream(source))
+        for page in reader.pages:
+            yield page.extract_text() or ""
+
+
+class PyMuPDFBackend(PDFExtractionBackend):
+    """MuPDF extraction (pip install pymupdf)"""
+
+    name = "pymupdf"
+    module = "fitz"
+
+    def iter_pages(self, source: PDFSource) -> Iterator[str]:
+        buffer = self._as_buffer(source)
+        # PyMuPDF reads bytes and memoryview in place but copies a bytearray
+        if isinstance(buffer, bytearray):
+            buffer = memoryview(buffer)
+        document = self.lib.open(stream=buffer, filetype="pdf")
+        try:
+            for page in document:
+                yield page.get_text() or ""
+        finally:
+            document.close()
+
+
+class PdfiumBackend(PDFExtractionBackend):
+    """PDFium extraction (pip install pypdfium2)"""
+
+    name = "pypdfium2"
+    module = "pypdfium2"
+
+    def iter_pages(self, source: PDFSource) -> Iterator[str]:
+        stream = self._as_stream(source)
+        if not hasattr(stream, "readinto"):
+            # PDFium reads through readinto, which mmap does not provide
+            stream = io.BytesIO(self._as_buffer(source))
+        document = self.lib.PdfDocument(stream)
+        try:
+            for index in range(len(document)):
+                page = document[index]
+                textpage = page.get_textpage()
+                try:
+                    yield textpage.get_text_range() or ""
+                finally:
+                    textpage.close()
+                    page.close()
+        finally:
+            document.close()
+
+
+class PdfplumberBackend(PDFExtractionBackend):
+    """pdfminer-based extraction with layout awareness (pip install pdfplumber)"""
+
+    name = "pdfplumber"
+    module = "pdfplumber"
+
+    def iter_pages(self, source: PDFSource) -> Iterator[str]:
+        with self.lib.open(self._as_stream(source)) as document:
+            for page in document.pages:
+                yield page.extract_text() or ""
+                # Release the parsed layout of pages already yielded
+                page.flush_cache()
+
+
+BACKENDS: Dict[str, Type[PDFExtractionBackend]] = {
+    backend.name: backend
+    for backend in (PyPDF2Backend, PyMuPDFBackend, PdfiumBackend, PdfplumberBackend)
+}
+
+DEFAULT_BACKEND = PyPDF2Backend.name
+
+
+def available_backends() -> List[str]:
+    """Names of the backends whose library is installed"""
+    return [name for name, backend in BACKENDS.items() if backend.is_available()]
+
+
+def get_backend(name: Optional[str] = None) -> PDFExtractionBackend:
+    """Instantiate a backend by name, falling back to PyPDF2 when it is unknown or not installed"""
+    name = (name or PDF_EXTRACTION_BACKEND).lower()
+    backend = BACKENDS.get(name)
+    if backend is None:
+        logger.warning(f"Backend de extração desconhecido '{name}', usando {DEFAULT_BACKEND}")
+        backend = BACKENDS[DEFAULT_BACKEND]
+    elif not backend.is_available():
+        logger.warning(f"Backend de extração '{name}' não instalado, usando {DEFAULT_BACKEND}")
+        backend = BACKENDS[DEFAULT_BACKEND]
+
+    logger.info(f"Backend de extração de PDF: {backend.name}")
+    return backend()
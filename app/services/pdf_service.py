@@ -1,12 +1,32 @@
 """
 PDF Processing Service - Handle PDF processing with AI
 """
-import json
+import time
 import logging
-from typing import Optional
+from typing import Optional, List, Iterator
 from app.clients.llm_client import llm_service, LLMModel
 from app.models.llm_models import DocumentChecklistResponse, LLMPromptTemplate
-from app.config.config import DEFAULT_LLM_MODEL
+from app.services.text_normalization_service import TextNormalizationService
+from app.services.pdf_extraction_backends import get_backend, PDFSource
+from app.services.document_classifier_service import document_classifier
+from app.services.requirement_rules_service import requirement_rules
+from app.services.metrics_service import consumer_metrics
+from app.services.model_router_service import model_router
+from app.services.traffic_recorder import traffic_recorder
+from app.services.json_repair_service import json_repair_service
+from app.services.preflight_service import preflight_planner, PreflightPlan, STRATEGY_SINGLE
+from app.services.llm_batch_service import llm_batch_service
+from app.services.similarity_index_service import similarity_index
+from app.services.corpus_store_service import corpus_store
+from app.services.deadline import Deadline
+from app.config.exceptions import DeadlineExceeded
+from app.config.config import (
+    DEFAULT_LLM_MODEL,
+    EXTRACTED_TEXT_MAX_CHARS,
+    RULE_FAST_PATH_ENABLED,
+    LLM_MAX_OUTPUT_TOKENS,
+    SIMILARITY_VERIFY_CHANGES,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -17,147 +37,381 @@ class PDFProcessingService:
     def __init__(self):
         self.llm_service = llm_service
         self.prompt_template = LLMPromptTemplate()
+        self.normalization_service = TextNormalizationService()
+        self.extraction_backend = get_backend()
+        self.classifier = document_classifier
+        self.rules_service = requirement_rules
+        self.preflight = preflight_planner
+        self.batcher = llm_batch_service
+        self.similarity_index = similarity_index
+        self.corpus_store = corpus_store
     
-    def extract_text_from_pdf(self, file_content: bytes) -> Optional[str]:
-        """Extract text from PDF content"""
+    def iter_pages(self, file_content: PDFSource) -> Iterator[str]:
+        """Yield the text of each page; accepts bytes or a seekable stream (e.g. mmap)"""
+        return self.extraction_backend.iter_pages(file_content)
+    
+    def extract_pages_from_pdf(
+        self,
+        file_content: PDFSource,
+        deadline: Optional[Deadline] = None
+    ) -> Optional[List[str]]:
+        """Extract text from PDF content, one entry per page; pages may be blank for scanned PDFs
+
+        The pages are collected in a list because classification, rules and
+        chunking need the whole text; only the PDF itself is read lazily. Use
+        iter_pages to stream pages instead. The list is capped at
+        EXTRACTED_TEXT_MAX_CHARS characters.
+        """
+        deadline = deadline or Deadline.unbounded()
         try:
-            import PyPDF2
-            import io
-            
-            logger.info(f"Extraindo texto de PDF de {len(file_content)} bytes")
-            
-            # Create a PDF reader object
-            pdf_reader = PyPDF2.PdfReader(io.BytesIO(file_content))
+            logger.info(f"Extraindo texto de PDF de {self._source_size(file_content)} bytes")
             
-            # Extract text from all pages
-            extracted_text = ""
-            for page_num in range(len(pdf_reader.pages)):
-                page = pdf_reader.pages[page_num]
-                extracted_text += page.extract_text() + "\n"
+            pages = []
+            total_chars = 0
+            for page_text in self.iter_pages(file_content):
+                deadline.check("extract")
+                if total_chars + len(page_text) > EXTRACTED_TEXT_MAX_CHARS:
+                    logger.warning(
+                        f"Texto extraído truncado: limite de {EXTRACTED_TEXT_MAX_CHARS} caracteres "
+                        f"(EXTRACTED_TEXT_MAX_CHARS) atingido na página {len(pages) + 1}; "
+                        f"mantidas {len(pages)} páginas com {total_chars} caracteres"
+                    )
+                    break
+                total_chars += len(page_text)
+                pages.append(page_text)
             
-            if not extracted_text.strip():
+            if not any(page.strip() for page in pages):
                 logger.warning("Nenhum texto extraído do PDF")
-                return None
                 
-            logger.info(f"Texto extraído com sucesso: {len(extracted_text)} caracteres")
-            return extracted_text.strip()
+            logger.info(f"Texto extraído com sucesso: {sum(len(page) for page in pages)} caracteres em {len(pages)} páginas")
+            return pages
             
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             logger.error(f"Erro ao extrair texto do PDF: {e}")
             return None
     
+    def _source_size(self, file_content: PDFSource) -> int:
+        """Size in bytes of a PDF source"""
+        if hasattr(file_content, "__len__"):
+            return len(file_content)
+        if hasattr(file_content, "getbuffer"):
+            return file_content.getbuffer().nbytes
+        return 0
+    
+    def extract_text_from_pdf(self, file_content: PDFSource) -> Optional[str]:
+        """Extract text from PDF content"""
+        pages = self.extract_pages_from_pdf(file_content)
+        if pages is None:
+            return None
+        return "\n".join(pages).strip() or None
+    
     def process_pdf_with_llm(
         self, 
         pdf_text: str, 
-        model: str = DEFAULT_LLM_MODEL
+        model: str = DEFAULT_LLM_MODEL,
+        known_documents: Optional[List[str]] = None,
+        deadline: Optional[Deadline] = None,
+        max_tokens: int = LLM_MAX_OUTPUT_TOKENS
     ) -> Optional[DocumentChecklistResponse]:
-        """Process PDF text with LLM to extract document requirements"""
+        """Process PDF text with LLM to extract document requirements
+        
+        When known_documents is given, the shorter residual prompt asks only
+        for documents not in that list.
+        """
         try:
             logger.info(f"Processando PDF com modelo {model}")
             
             # Prepare prompt
-            prompt = self.prompt_template.get_document_extraction_prompt()
-            formatted_prompt = prompt.format(document_content=pdf_text)
+            formatted_prompt = self._build_prompt(pdf_text, known_documents)
             
             # Generate completion
-            response = self.llm_service.generate_completion(
+            llm_response = self.llm_service.generate(
                 prompt=formatted_prompt,
                 model=model,
-                max_tokens=4000,
-                temperature=0.1
+                max_tokens=max_tokens,
+                temperature=0.1,
+                json_schema=self.prompt_template.get_checklist_json_schema(),
+                deadline=deadline
             )
+            response = llm_response.content
             logger.info(f"Resposta do LLM: {response}")
             
             if not response:
                 logger.error("Resposta vazia do LLM")
                 return None
             
-            # Clean response - remove markdown code blocks
-            cleaned_response = self._clean_llm_response(response)
+            # Parse JSON response, repairing syntax errors and truncation locally
+            response_json = json_repair_service.parse_checklist(response)
+            if response_json is None:
+                model_router.record_parse(llm_response.model, False)
+                logger.error("Não foi possível recuperar JSON da resposta LLM")
+                return None
             
-            # Parse JSON response
-            try:
-                response_json = json.loads(cleaned_response)
-                
-                # Handle different response formats
-                documents = []
-                if "checklistItems" in response_json:
-                    documents = response_json["checklistItems"]
-                elif "documents" in response_json:
-                    documents = response_json["documents"]
-                else:
-                    logger.error("Formato de resposta desconhecido")
-                    return None
-                
-                # Calculate counts
-                mandatory_count = sum(1 for doc in documents if doc.get("exigenceStatus") == "OBRIGATORIO")
-                optional_count = len(documents) - mandatory_count
-                
-                # Create complete response
-                checklist_response = DocumentChecklistResponse(
-                    documents=documents,
-                    total_documents=len(documents),
-                    mandatory_count=mandatory_count,
-                    optional_count=optional_count
-                )
-                
-                logger.info(f"Checklist gerado com {len(documents)} documentos")
-                return checklist_response
-                
-            except json.JSONDecodeError as e:
-                logger.error(f"Erro ao fazer parse do JSON da resposta LLM: {e}")
-                logger.error(f"Resposta limpa recebida: {cleaned_response}")
+            # Handle different response formats
+            documents = []
+            if "checklistItems" in response_json:
+                documents = response_json["checklistItems"]
+            elif "documents" in response_json:
+                documents = response_json["documents"]
+            else:
+                logger.error("Formato de resposta desconhecido")
+                model_router.record_parse(llm_response.model, False)
                 return None
+            
+            # Create complete response
+            checklist_response = DocumentChecklistResponse.from_documents(
+                documents,
+                model_used=llm_response.model,
+                prompt_tokens=llm_response.prompt_tokens,
+                completion_tokens=llm_response.completion_tokens
+            )
+            
+            model_router.record_parse(llm_response.model, True)
+            logger.info(f"Checklist gerado com {len(documents)} documentos")
+            return checklist_response
                 
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             logger.error(f"Erro ao processar PDF com LLM: {e}")
             return None
     
-    def _clean_llm_response(self, response: str) -> str:
-        """Clean LLM response by removing markdown code blocks and extra whitespace"""
+    def _build_prompt(self, pdf_text: str, known_documents: Optional[List[str]] = None) -> str:
+        """Full extraction prompt, or the residual prompt when standard documents are known"""
+        if known_documents:
+            return self.prompt_template.get_residual_extraction_prompt().format(
+                known_documents="\n".join(f"- {name}" for name in known_documents),
+                document_content=pdf_text
+            )
+        return self.prompt_template.get_document_extraction_prompt().format(document_content=pdf_text)
+    
+    def process_with_plan(
+        self,
+        plan: PreflightPlan,
+        known_documents: Optional[List[str]] = None,
+        deadline: Optional[Deadline] = None
+    ) -> Optional[DocumentChecklistResponse]:
+        """Run the LLM calls chosen by the preflight; chunked results are merged"""
+        if plan.strategy == STRATEGY_SINGLE and self.batcher.eligible(plan.texts[0], plan.model):
+            # Small documents share a call with other workers' documents
+            result = self.batcher.process(
+                plan.texts[0],
+                plan.model,
+                known_documents,
+                deadline,
+                lambda: self.process_pdf_with_llm(plan.texts[0], plan.model, known_documents, deadline, plan.max_tokens)
+            )
+            if result:
+                result.strategy = plan.strategy
+            return result
+        
+        results = []
+        for index, text in enumerate(plan.texts):
+            if len(plan.texts) > 1:
+                logger.info(f"Processando parte {index + 1}/{len(plan.texts)}")
+            result = self.process_pdf_with_llm(text, plan.model, known_documents, deadline, plan.max_tokens)
+            if not result:
+                # A missing chunk would silently drop requirements
+                return None
+            results.append(result)
+        
+        result = results[0] if len(results) == 1 else DocumentChecklistResponse.merge(results)
+        result.strategy = plan.strategy
+        return result
+    
+    def reuse_similar(
+        self,
+        pdf_text: str,
+        model: str = DEFAULT_LLM_MODEL,
+        deadline: Optional[Deadline] = None
+    ) -> Optional[DocumentChecklistResponse]:
+        """Checklist of a near-duplicate edital already processed, re-verifying only the changed passages"""
+        match = self.similarity_index.find(pdf_text)
+        if not match:
+            return None
+        
+        added, removed = self.similarity_index.changed_lines(match.text, pdf_text)
+        if self.rules_service.residual_text(removed):
+            # A requirement may have been dropped; the stored checklist cannot be trusted
+            logger.info(f"Edital similar ({match.similarity:.2f}) com exigências removidas; processando completo")
+            self.similarity_index.record("rejected")
+            return None
+        
+        stored = match.checklist
+        stored.timings = {}
+        changed = self.rules_service.residual_text(added)
+        if not changed:
+            logger.info(f"Reutilizando checklist de edital similar ({match.similarity:.2f})")
+            stored.strategy = "reused"
+            stored.prompt_tokens = None
+            stored.completion_tokens = None
+            self.similarity_index.record("reused")
+            return stored
+        
+        if not SIMILARITY_VERIFY_CHANGES:
+            self.similarity_index.record("rejected")
+            return None
+        
+        logger.info(
+            f"Edital similar ({match.similarity:.2f}); verificando {len(changed)} caracteres alterados com o LLM"
+        )
+        known_documents = [DocumentChecklistResponse.document_field(doc, "name") for doc in stored.documents]
+        verified = self.process_pdf_with_llm(changed, model, known_documents, deadline)
+        if not verified:
+            self.similarity_index.record("rejected")
+            return None
+        
+        result = DocumentChecklistResponse.merge([stored, verified])
+        result.strategy = "verified"
+        result.model_used = verified.model_used
+        self.similarity_index.record("verified")
+        return result
+    
+    def process_pdf(
+        self, 
+        file_content: PDFSource, 
+        model: str = DEFAULT_LLM_MODEL,
+        deadline: Optional[Deadline] = None,
+        content_hash: Optional[str] = None,
+        bidding_id: Optional[str] = None
+    ) -> Optional[DocumentChecklistResponse]:
+        """Complete PDF processing pipeline; raises DeadlineExceeded when the budget runs out
+
+        With a content hash the extracted pages are kept in the corpus store for offline evaluation.
+        """
         try:
-            # Remove markdown code blocks
-            if response.startswith("```json"):
-                response = response[7:]  # Remove ```json
-            elif response.startswith("```"):
-                response = response[3:]   # Remove ```
+            logger.info(f"Iniciando processamento completo de PDF de {self._source_size(file_content)} bytes")
             
-            if response.endswith("```"):
-                response = response[:-3]  # Remove trailing ```
+            # Extract text from PDF
+            consumer_metrics.set_stage("extract")
+            start = time.monotonic()
+            pages = self.extract_pages_from_pdf(file_content, deadline)
+            extract_seconds = time.monotonic() - start
+            if pages is None:
+                logger.error("Falha na extração de texto do PDF")
+                return None
+            traffic_recorder.record_extraction(len(pages), sum(len(page) for page in pages), extract_seconds)
+            if content_hash:
+                self.corpus_store.add(content_hash, bidding_id, pages)
             
-            # Strip whitespace
-            return response.strip()
+            result = self.process_pages(pages, model, deadline)
+            if result:
+                result.timings["extract"] = round(extract_seconds, 3)
+            return result
             
+        except DeadlineExceeded:
+            raise
         except Exception as e:
-            logger.error(f"Erro ao limpar resposta do LLM: {e}")
-            return response
-        
-    def process_pdf(
+            logger.error(f"Erro no processamento completo do PDF: {e}")
+            return None
+    
+    def process_pages(
         self, 
-        file_content: bytes, 
-        model: str = DEFAULT_LLM_MODEL
+        pages: List[str], 
+        model: str = DEFAULT_LLM_MODEL,
+        deadline: Optional[Deadline] = None
     ) -> Optional[DocumentChecklistResponse]:
-        """Complete PDF processing pipeline"""
+        """Pipeline stages after text extraction"""
         try:
-            logger.info(f"Iniciando processamento completo de PDF de {len(file_content)} bytes")
+            # Skip the LLM for scanned or non-edital documents
+            consumer_metrics.set_stage("classify")
+            start = time.monotonic()
+            classification = self.classifier.classify(pages)
+            classify_seconds = time.monotonic() - start
+            if not classification.needs_llm:
+                result = DocumentChecklistResponse.skipped(classification.decision, classification.reason)
+                result.timings["classify"] = round(classify_seconds, 3)
+                return result
             
-            # Extract text from PDF
-            pdf_text = self.extract_text_from_pdf(file_content)
+            # Strip repeated headers/footers and normalize whitespace
+            consumer_metrics.set_stage("normalize")
+            start = time.monotonic()
+            pdf_text = self.normalization_service.normalize_pages(pages).text
+            normalize_seconds = time.monotonic() - start
             if not pdf_text:
-                logger.error("Falha na extração de texto do PDF")
+                logger.error("Texto vazio após normalização")
                 return None
             
+            # Reuse the checklist of an almost identical edital processed before
+            consumer_metrics.set_stage("dedupe")
+            start = time.monotonic()
+            reused = self.reuse_similar(pdf_text, model, deadline)
+            dedupe_seconds = time.monotonic() - start
+            if reused:
+                reused.timings["classify"] = round(classify_seconds, 3)
+                reused.timings["normalize"] = round(normalize_seconds, 3)
+                reused.timings["dedupe"] = round(dedupe_seconds, 3)
+                if reused.strategy == "verified":
+                    self.similarity_index.add(pdf_text, reused)
+                return reused
+            
+            # Detect standard documents locally so the LLM only looks for the rest
+            llm_text = pdf_text
+            rule_documents = []
+            known_documents = None
+            rules_seconds = 0.0
+            if RULE_FAST_PATH_ENABLED:
+                consumer_metrics.set_stage("rules")
+                start = time.monotonic()
+                rule_result = self.rules_service.match(pdf_text)
+                if rule_result.documents:
+                    rule_documents = rule_result.documents
+                    known_documents = rule_result.document_names
+                    llm_text = self.rules_service.residual_text(pdf_text, rule_result.unconfirmed_lines)
+                    logger.info(
+                        f"Texto residual para o LLM: {len(llm_text)} de {len(pdf_text)} caracteres"
+                    )
+                rules_seconds = time.monotonic() - start
+            
+            # Pick single-shot, filtered or chunked processing and a model whose window fits
+            plan = None
+            preflight_seconds = 0.0
+            if llm_text:
+                consumer_metrics.set_stage("preflight")
+                start = time.monotonic()
+                plan = self.preflight.plan(
+                    llm_text,
+                    model,
+                    overhead_tokens=self.preflight.estimator.estimate(self._build_prompt("", known_documents), model),
+                    filtered=known_documents is not None
+                )
+                preflight_seconds = time.monotonic() - start
+            
             # Process with LLM
-            result = self.process_pdf_with_llm(pdf_text, model)
+            consumer_metrics.set_stage("llm")
+            start = time.monotonic()
+            if plan:
+                result = self.process_with_plan(plan, known_documents, deadline)
+            else:
+                # Nothing beyond the standard documents mentions a requirement
+                result = DocumentChecklistResponse.from_documents([])
+            llm_seconds = time.monotonic() - start
             logger.info(f"Resultado do processamento com LLM: {result}")
            
             if not result:
                 logger.error("Falha no processamento com LLM")
                 return None
             
+            if rule_documents:
+                result = DocumentChecklistResponse.merge([DocumentChecklistResponse.from_documents(rule_documents), result])
+                result.timings["rules"] = round(rules_seconds, 3)
+            
+            result.timings["classify"] = round(classify_seconds, 3)
+            result.timings["normalize"] = round(normalize_seconds, 3)
+            result.timings["llm"] = round(llm_seconds, 3)
+            result.timings["dedupe"] = round(dedupe_seconds, 3)
+            if plan:
+                result.timings["preflight"] = round(preflight_seconds, 3)
+            
+            self.similarity_index.add(pdf_text, result)
+            
             logger.info("PDF processado com sucesso")
             return result
             
+        except DeadlineExceeded:
+            raise
         except Exception as e:
-            logger.error(f"Erro no processamento completo do PDF: {e}")
+            logger.error(f"Erro no processamento do texto do PDF: {e}")
             return None
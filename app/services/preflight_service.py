@@ -0,0 +1,228 @@
+"""
+Preflight Service - Choose how a document is sent to the LLM before calling it
+
+Estimates the prompt size and checks it against each model's context window
+(LLM_MODEL_CONTEXT_TOKENS) so that oversized prompts are not left to fail
+slowly at the provider. In order of preference the planner picks:
+
+- single: the whole text in one call, on the requested model if it fits,
+  otherwise on the cheapest model whose window fits it
+- filtered: only the passages that mention documents, in one call
+- chunked: the text split on line boundaries into several calls on the
+  model with the largest window, merged afterwards
+"""
+import logging
+import threading
+from dataclasses import dataclass
+from typing import List, Dict, Any, Optional
+from app.services.token_estimator import token_estimator, TokenEstimator
+from app.services.requirement_rules_service import requirement_rules
+from app.config.config import (
+    LLM_MODELS,
+    LLM_MODEL_COSTS,
+    LLM_MODEL_CONTEXT_TOKENS,
+    LLM_MAX_OUTPUT_TOKENS,
+    PREFLIGHT_ENABLED,
+    PREFLIGHT_CONTEXT_MARGIN,
+)
+
+logger = logging.getLogger(__name__)
+
+STRATEGY_SINGLE = "single"
+STRATEGY_FILTERED = "filtered"
+STRATEGY_CHUNKED = "chunked"
+
+# Lines repeated at the start of the next chunk so a clause is not cut in half
+_CHUNK_OVERLAP_LINES = 3
+
+
+@dataclass
+class PreflightPlan:
+    """How one document is sent to the LLM"""
+    strategy: str
+    model: str
+    texts: List[str]
+    prompt_tokens: int
+    context_tokens: int
+    max_tokens: int = LLM_MAX_OUTPUT_TOKENS
+    reason: str = ""
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Decision summary for logs and stored results"""
+        return {
+            "strategy": self.strategy,
+            "model": self.model,
+            "calls": len(self.texts),
+            "estimated_prompt_tokens": self.prompt_tokens,
+            "context_tokens": self.context_tokens,
+            "reason": self.reason,
+        }
+
+
+@dataclass
+class _Fit:
+    """Estimated prompt size of a text on one model"""
+    model: str
+    prompt_tokens: int
+    budget: int
+
+    @property
+    def fits(self) -> bool:
+        """Whether the prompt fits the model's budget"""
+        return self.prompt_tokens <= self.budget
+
+
+class PreflightPlanner:
+    """Token-count preflight over the per-model context and cost tables"""
+
+    def __init__(
+        self,
+        estimator: TokenEstimator = token_estimator,
+        enabled: bool = PREFLIGHT_ENABLED,
+        margin: float = PREFLIGHT_CONTEXT_MARGIN,
+        max_output_tokens: int = LLM_MAX_OUTPUT_TOKENS
+    ):
+        self.estimator = estimator
+        self.enabled = enabled
+        self.margin = margin
+        self.max_output_tokens = max_output_tokens
+        self._lock = threading.Lock()
+        self.counts: Dict[str, int] = {STRATEGY_SINGLE: 0, STRATEGY_FILTERED: 0, STRATEGY_CHUNKED: 0}
+        self.model_switches = 0
+
+    def plan(self, text: str, model: str, overhead_tokens: int = 0, filtered: bool = False) -> PreflightPlan:
+        """Choose strategy and model for a document
+
+        overhead_tokens is the size of the prompt template without the text.
+        filtered tells the planner the text is already reduced to requirement passages.
+        """
+        if not self.enabled:
+            return PreflightPlan(STRATEGY_SINGLE, model, [text], 0, self._context(model), self.max_output_tokens)
+
+        fit = self._fit(text, model, overhead_tokens)
+        if fit.fits:
+            return self._record(PreflightPlan(
+                STRATEGY_SINGLE, model, [text], fit.prompt_tokens, self._context(model), self.max_output_tokens
+            ), model)
+
+        alternative = self._cheapest_fit(text, overhead_tokens)
+        if alternative:
+            return self._record(PreflightPlan(
+                STRATEGY_SINGLE,
+                alternative.model,
+                [text],
+                alternative.prompt_tokens,
+                self._context(alternative.model),
+                self.max_output_tokens,
+                f"~{fit.prompt_tokens} tokens excedem a janela de {model}"
+            ), model)
+
+        if not filtered:
+            residual = requirement_rules.residual_text(text)
+            if residual and len(residual) < len(text):
+                for candidate in [model] + [name for name in self._by_cost() if name != model]:
+                    residual_fit = self._fit(residual, candidate, overhead_tokens)
+                    if residual_fit.fits:
+                        return self._record(PreflightPlan(
+                            STRATEGY_FILTERED,
+                            candidate,
+                            [residual],
+                            residual_fit.prompt_tokens,
+                            self._context(candidate),
+                            self.max_output_tokens,
+                            f"~{fit.prompt_tokens} tokens; enviados apenas trechos com exigências"
+                        ), model)
+
+        largest = max(self._models(), key=lambda name: (self._context(name), -LLM_MODEL_COSTS.get(name, 0.0)))
+        budget = self._budget(largest) - overhead_tokens
+        chunks = self._split(text, largest, budget)
+        return self._record(PreflightPlan(
+            STRATEGY_CHUNKED,
+            largest,
+            chunks,
+            max(self._fit(chunk, largest, overhead_tokens).prompt_tokens for chunk in chunks),
+            self._context(largest),
+            self.max_output_tokens,
+            f"~{fit.prompt_tokens} tokens divididos em {len(chunks)} partes"
+        ), model)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Strategy counts and estimator calibration"""
+        with self._lock:
+            counts = dict(self.counts)
+            switches = self.model_switches
+        return {
+            "enabled": self.enabled,
+            "strategies": counts,
+            "model_switches": switches,
+            "context_tokens": {name: self._context(name) for name in self._models()},
+            "estimator": self.estimator.snapshot(),
+        }
+
+    def _record(self, plan: PreflightPlan, requested_model: str) -> PreflightPlan:
+        """Count and log the decision"""
+        with self._lock:
+            self.counts[plan.strategy] += 1
+            if plan.model != requested_model:
+                self.model_switches += 1
+        if plan.reason:
+            logger.info(f"Preflight: estratégia {plan.strategy} com modelo {plan.model} ({plan.reason})")
+        return plan
+
+    def _models(self) -> List[str]:
+        """Models with a known context window"""
+        return [name for name in LLM_MODELS if name in LLM_MODEL_CONTEXT_TOKENS]
+
+    def _by_cost(self) -> List[str]:
+        """Models ordered by cost, then by smaller window (usually faster)"""
+        return sorted(self._models(), key=lambda name: (LLM_MODEL_COSTS.get(name, 0.0), self._context(name)))
+
+    def _context(self, model: str) -> int:
+        """Context window of a model (0 when unknown)"""
+        return LLM_MODEL_CONTEXT_TOKENS.get(model, 0)
+
+    def _budget(self, model: str) -> int:
+        """Prompt tokens that fit in the model's window after the margin and the completion"""
+        return int(self._context(model) * (1 - self.margin)) - self.max_output_tokens
+
+    def _fit(self, text: str, model: str, overhead_tokens: int) -> _Fit:
+        """Estimated prompt size of the text on a model"""
+        return _Fit(model, self.estimator.estimate(text, model) + overhead_tokens, self._budget(model))
+
+    def _cheapest_fit(self, text: str, overhead_tokens: int) -> Optional[_Fit]:
+        """Cheapest model whose window fits the whole text"""
+        for name in self._by_cost():
+            fit = self._fit(text, name, overhead_tokens)
+            if fit.fits:
+                return fit
+        return None
+
+    def _split(self, text: str, model: str, budget: int) -> List[str]:
+        """Split on line boundaries into chunks of at most budget tokens"""
+        total = max(1, self.estimator.estimate(text, model))
+        max_chars = max(1, int(len(text) * budget / total))
+        lines = [
+            line[start:start + max_chars]
+            for line in text.split("\n")
+            for start in range(0, max(len(line), 1), max_chars)
+        ]
+
+        chunks: List[str] = []
+        current: List[str] = []
+        size = 0
+        for line in lines:
+            if current and size + len(line) + 1 > max_chars:
+                chunks.append("\n".join(current))
+                current = current[-_CHUNK_OVERLAP_LINES:]
+                size = sum(len(kept) + 1 for kept in current)
+                if size + len(line) + 1 > max_chars:
+                    current, size = [], 0
+            current.append(line)
+            size += len(line) + 1
+        if current:
+            chunks.append("\n".join(current))
+        return chunks
+
+
+# Global instance for easy import
+preflight_planner = PreflightPlanner()
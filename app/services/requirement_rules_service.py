@@ -0,0 +1,272 @@
+"""
+Requirement Rules Service - Detect standard habilitação documents without the LLM
+
+A precompiled pattern index finds the documents that nearly every edital asks
+for (federal, FGTS and labour certificates, falência, balanço, atestado,
+contrato social...) in a single pass over the text. The LLM then only looks
+for the remaining, non-standard requirements in the passages that mention
+documents. Bare acronyms and generic phrases ("FGTS", "CREA", "registro
+comercial") also appear outside the requirements, so they count only inside
+the habilitação section or near a requirement verb; other mentions are left
+for the LLM to confirm.
+"""
+import re
+import bisect
+import logging
+import unicodedata
+from dataclasses import dataclass, field
+from typing import Iterable, List, Dict, Optional, Tuple
+from app.models.llm_models import DocumentRequirement, DocumentStatus
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class RequirementRule:
+    """A standard document and the accent-free, lowercase patterns that identify it
+
+    weak_patterns identify it only in a requirement context (see _requirement_context).
+    """
+    name: str
+    patterns: Tuple[str, ...]
+    possible_to_attach: bool = True
+    weak_patterns: Tuple[str, ...] = ()
+
+
+RULES: Tuple[RequirementRule, ...] = (
+    RequirementRule(
+        "Certidão Negativa de Débitos Relativos aos Tributos Federais e à Dívida Ativa da União",
+        (r"divida ativa da uniao", r"\bcnd federal\b"),
+        weak_patterns=(r"tributos federais",),
+    ),
+    RequirementRule(
+        "Certificado de Regularidade do FGTS (CRF)",
+        (r"certificado de regularidade do fgts",),
+        weak_patterns=(r"\bfgts\b", r"\bcrf\b"),
+    ),
+    RequirementRule(
+        "Certidão Negativa de Débitos Trabalhistas (CNDT)",
+        (r"\bcndt\b", r"debitos trabalhistas"),
+    ),
+    RequirementRule(
+        "Certidão de Regularidade Fiscal Estadual",
+        (r"fazenda estadual", r"tributos estaduais", r"regularidade fiscal (?:perante a|com a) fazenda (?:publica )?estadual"),
+    ),
+    RequirementRule(
+        "Certidão de Regularidade Fiscal Municipal",
+        (r"fazenda municipal", r"tributos municipais"),
+    ),
+    RequirementRule(
+        "Certidão Negativa de Falência e Recuperação Judicial",
+        (r"certidao negativa de falencia", r"falencia(?:,| e| ou) (?:de )?(?:recuperacao judicial|concordata)"),
+    ),
+    RequirementRule(
+        "Balanço Patrimonial e Demonstrações Contábeis do Último Exercício",
+        (r"balanco patrimonial", r"demonstracoes contabeis"),
+    ),
+    RequirementRule(
+        "Atestado de Capacidade Técnica",
+        (r"atestados? de capacidade tecnica", r"atestados? de capacidade tecnico"),
+    ),
+    RequirementRule(
+        "Ato Constitutivo, Estatuto ou Contrato Social",
+        (r"contrato social", r"ato constitutivo", r"estatuto social"),
+    ),
+    RequirementRule(
+        "Prova de Inscrição no CNPJ",
+        (r"inscricao no cadastro nacional (?:de|da) pessoas? juridicas?", r"inscricao no cnpj", r"cartao (?:do )?cnpj"),
+    ),
+    RequirementRule(
+        "Prova de Inscrição no Cadastro de Contribuintes Estadual ou Municipal",
+        (r"cadastro de contribuintes (?:estadual|municipal)",),
+    ),
+    RequirementRule(
+        "Registro no Conselho Profissional (CREA/CAU)",
+        (r"conselho regional de engenharia",),
+        weak_patterns=(r"\bcrea\b", r"\bcau\b"),
+    ),
+    RequirementRule(
+        "Declaração de Cumprimento do Art. 7º, XXXIII, da Constituição (Trabalho de Menores)",
+        (r"inciso xxxiii do art", r"xxxiii do artigo 7", r"trabalho noturno, perigoso ou insalubre"),
+    ),
+    RequirementRule(
+        "Registro Comercial (Empresário Individual)",
+        (),
+        weak_patterns=(r"registro comercial",),
+    ),
+)
+
+# Phrases near a match that mark the document as optional
+_OPTIONAL_RE = re.compile(r"facultativ|opcional|se houver|quando (?:for o caso|couber)|podera(?:o)? ser apresentad")
+# Lines that mention documents at all; used to build the residual LLM input
+_REQUIREMENT_CUE_RE = re.compile(
+    r"certidao|certificado|declaracao|atestado|comprovante|comprovacao|registro|inscricao|"
+    r"habilitacao|documento|apresentar|apresentacao|prova de|licenca|alvara|autorizacao"
+)
+# Clauses end at a full stop, semicolon or line break
+_CLAUSE_END_RE = re.compile(r"\.(?:\s|$)|[;\n]")
+_CLAUSE_BREAK_CHARS = ";\n"
+_CONTEXT_CHARS = 300
+_MAX_INFO_CHARS = 300
+_RESIDUAL_CONTEXT_LINES = 2
+# Weak patterns count within this many lines of a requirement verb
+_REQUIREMENT_VERB_RE = re.compile(r"\bapresenta|\bcomprova|\bprova de\b|\bexigid|\bjuntad|\banexad")
+_REQUIREMENT_VERB_LINES = 3
+# Top-level headings ("8. DA HABILITACAO", "CAPITULO V") start a section; "8.1." items do not
+_SECTION_HEADING_RE = re.compile(r"^\s*(?:(?:capitulo|clausula|secao|titulo|anexo)\b|\d{1,2}\s*[.)-]?\s+[a-z])")
+_HABILITACAO_RE = re.compile(r"habilitacao|documentacao")
+_MAX_HEADING_CHARS = 80
+
+
+def fold(text: str) -> str:
+    """Lowercase and strip accents, keeping one output character per input character"""
+    if text.isascii():
+        return text.lower()
+    folded = []
+    for char in text:
+        base = unicodedata.normalize("NFKD", char.lower())[:1] or char
+        folded.append(base)
+    return "".join(folded)
+
+
+@dataclass
+class RuleMatchResult:
+    """Standard documents found by the rule index"""
+    documents: List[DocumentRequirement] = field(default_factory=list)
+    matched_rules: Dict[str, int] = field(default_factory=dict)
+    # Lines with weak matches outside a requirement context, left for the LLM
+    unconfirmed_lines: List[int] = field(default_factory=list)
+
+    @property
+    def document_names(self) -> List[str]:
+        """Names of the documents found"""
+        return [doc.name for doc in self.documents]
+
+
+class RequirementRulesService:
+    """Single-pass detection of standard habilitação documents"""
+
+    def __init__(self, rules: Tuple[RequirementRule, ...] = RULES):
+        self.rules = rules
+        # One alternation with named groups per rule (r: pattern, w: weak pattern); match.lastgroup identifies the rule
+        groups = []
+        for index, rule in enumerate(rules):
+            if rule.patterns:
+                groups.append(f"(?P<r{index}>{'|'.join(rule.patterns)})")
+            if rule.weak_patterns:
+                groups.append(f"(?P<w{index}>{'|'.join(rule.weak_patterns)})")
+        self._index = re.compile("|".join(groups))
+
+    def match(self, text: str) -> RuleMatchResult:
+        """Find standard documents in the text"""
+        folded = fold(text)
+        first_match: Dict[int, int] = {}
+        counts: Dict[int, int] = {}
+        optional: Dict[int, bool] = {}
+        line_starts: List[int] = []
+        confirmed: Optional[List[bool]] = None
+        unconfirmed_lines = set()
+
+        for match in self._index.finditer(folded):
+            index = int(match.lastgroup[1:])
+            if match.lastgroup[0] == "w":
+                if confirmed is None:
+                    line_starts, confirmed = self._requirement_context(text, folded)
+                line = bisect.bisect_right(line_starts, match.start()) - 1
+                if not confirmed[line]:
+                    unconfirmed_lines.add(line)
+                    continue
+            counts[index] = counts.get(index, 0) + 1
+            first_match.setdefault(index, match.start())
+            # A single mandatory mention makes the document mandatory
+            context = folded[self._clause_start(folded, match.start()):self._clause_end(folded, match.end())]
+            optional[index] = optional.get(index, True) and bool(_OPTIONAL_RE.search(context))
+
+        result = RuleMatchResult()
+        for index in sorted(first_match, key=first_match.get):
+            rule = self.rules[index]
+            status = DocumentStatus.OPCIONAL if optional[index] else DocumentStatus.OBRIGATORIO
+            result.documents.append(DocumentRequirement(
+                name=rule.name,
+                exigenceStatus=status.value,
+                additionalInfo=self._sentence_at(text, first_match[index]),
+                possibleToAttach=rule.possible_to_attach
+            ))
+            result.matched_rules[rule.name] = counts[index]
+        result.unconfirmed_lines = sorted(unconfirmed_lines)
+
+        if result.documents:
+            logger.info(f"Regras identificaram {len(result.documents)} documentos padrão")
+        if unconfirmed_lines:
+            logger.info(f"{len(unconfirmed_lines)} menções fora do contexto de habilitação ficam para o LLM confirmar")
+        return result
+
+    def residual_text(self, text: str, keep_lines: Iterable[int] = ()) -> str:
+        """Only the lines that mention documents (plus keep_lines), with a little surrounding context"""
+        lines = text.split("\n")
+        folded_lines = fold(text).split("\n")
+        keep = [False] * len(lines)
+        extra = set(keep_lines)
+        for index, line in enumerate(folded_lines):
+            if index in extra or _REQUIREMENT_CUE_RE.search(line):
+                for neighbour in range(max(0, index - 1), min(len(lines), index + _RESIDUAL_CONTEXT_LINES + 1)):
+                    keep[neighbour] = True
+
+        output: List[str] = []
+        previous_kept = True
+        for line, kept in zip(lines, keep):
+            if kept:
+                if not previous_kept and output:
+                    output.append("[...]")
+                output.append(line)
+            previous_kept = kept
+        return "\n".join(output).strip()
+
+    def _requirement_context(self, text: str, folded: str) -> Tuple[List[int], List[bool]]:
+        """Line start offsets, and per line whether it is in the habilitação section or near a requirement verb"""
+        lines = text.split("\n")
+        folded_lines = folded.split("\n")
+        line_starts = []
+        offset = 0
+        for line in lines:
+            line_starts.append(offset)
+            offset += len(line) + 1
+
+        confirmed = [False] * len(lines)
+        in_section = False
+        for index, (line, folded_line) in enumerate(zip(lines, folded_lines)):
+            stripped = line.strip()
+            if stripped and len(stripped) <= _MAX_HEADING_CHARS:
+                numbered = bool(_SECTION_HEADING_RE.match(folded_line))
+                mentions = bool(_HABILITACAO_RE.search(folded_line))
+                if mentions and (numbered or stripped.isupper()):
+                    in_section = True
+                elif numbered:
+                    in_section = False
+            if in_section:
+                confirmed[index] = True
+            if _REQUIREMENT_VERB_RE.search(folded_line):
+                for neighbour in range(max(0, index - _REQUIREMENT_VERB_LINES), min(len(lines), index + _REQUIREMENT_VERB_LINES + 1)):
+                    confirmed[neighbour] = True
+        return line_starts, confirmed
+
+    def _clause_start(self, text: str, position: int) -> int:
+        """Start of the clause containing position, at most _CONTEXT_CHARS back"""
+        start = position
+        while start > 0 and text[start - 1] not in _CLAUSE_BREAK_CHARS and position - start < _CONTEXT_CHARS:
+            start -= 1
+        return start
+
+    def _clause_end(self, text: str, position: int) -> int:
+        """End of the clause containing position, at most _CONTEXT_CHARS ahead"""
+        ends = _CLAUSE_END_RE.search(text, position, position + _CONTEXT_CHARS)
+        return ends.end() if ends else min(len(text), position + _CONTEXT_CHARS)
+
+    def _sentence_at(self, text: str, position: int) -> str:
+        """Clause of the original text around a match, used as additionalInfo"""
+        sentence = text[self._clause_start(text, position):self._clause_end(text, position)]
+        return " ".join(sentence.split())[:_MAX_INFO_CHARS]
+
+
+# Global instance for easy import
+requirement_rules = RequirementRulesService()
@@ -0,0 +1,137 @@
+"""
+Result Store Service - Persist computed checklists locally (SQLite)
+"""
+import json
+import time
+import sqlite3
+import logging
+import threading
+from typing import Optional, Dict, Any, List
+from app.models.llm_models import DocumentChecklistResponse
+from app.config.config import RESULT_STORE_ENABLED, RESULT_STORE_PATH
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS checklist_results (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    bidding_id TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    model TEXT,
+    prompt_tokens INTEGER,
+    completion_tokens INTEGER,
+    timings TEXT NOT NULL,
+    result TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_checklist_results_bidding ON checklist_results (bidding_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_checklist_results_hash ON checklist_results (content_hash, created_at);
+"""
+
+
+class ChecklistResultStore:
+    """SQLite store of checklist results keyed by bidding ID and PDF content hash"""
+
+    def __init__(self, path: str = RESULT_STORE_PATH, enabled: bool = RESULT_STORE_ENABLED):
+        self.path = path
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+
+    def _get_connection(self) -> sqlite3.Connection:
+        """Open the database on first use (lock must be held)"""
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.row_factory = sqlite3.Row
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.executescript(_SCHEMA)
+        return self._connection
+
+    def save(
+        self,
+        bidding_id: str,
+        content_hash: str,
+        result: DocumentChecklistResponse
+    ) -> bool:
+        """Store a computed checklist"""
+        if not self.enabled:
+            return False
+
+        try:
+            with self._lock:
+                connection = self._get_connection()
+                connection.execute(
+                    """
+                    INSERT INTO checklist_results
+                        (bidding_id, content_hash, model, prompt_tokens, completion_tokens, timings, result, created_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    (
+                        bidding_id,
+                        content_hash,
+                        result.model_used,
+                        result.prompt_tokens,
+                        result.completion_tokens,
+                        json.dumps(result.timings),
+                        json.dumps(result.to_dict(), ensure_ascii=False),
+                        time.time(),
+                    )
+                )
+                connection.commit()
+            logger.info(f"Checklist do bidding {bidding_id} armazenado (hash {content_hash[:12]})")
+            return True
+
+        except Exception as e:
+            logger.error(f"Erro ao armazenar checklist do bidding {bidding_id}: {e}")
+            return False
+
+    def list_results(self, bidding_id: str, limit: int = 20) -> List[Dict[str, Any]]:
+        """Stored results for a bidding ID, newest first"""
+        return self._query(
+            "SELECT * FROM checklist_results WHERE bidding_id = ? ORDER BY created_at DESC LIMIT ?",
+            (bidding_id, limit)
+        )
+
+    def get_latest(self, bidding_id: str) -> Optional[Dict[str, Any]]:
+        """Most recent stored result for a bidding ID"""
+        results = self.list_results(bidding_id, limit=1)
+        return results[0] if results else None
+
+    def get_by_content_hash(self, content_hash: str) -> Optional[Dict[str, Any]]:
+        """Most recent stored result for a PDF content hash"""
+        results = self._query(
+            "SELECT * FROM checklist_results WHERE content_hash = ? ORDER BY created_at DESC LIMIT 1",
+            (content_hash,)
+        )
+        return results[0] if results else None
+
+    def _query(self, sql: str, params: tuple) -> List[Dict[str, Any]]:
+        """Run a query and decode stored rows"""
+        if not self.enabled:
+            return []
+
+        try:
+            with self._lock:
+                rows = self._get_connection().execute(sql, params).fetchall()
+            return [self._row_to_dict(row) for row in rows]
+
+        except Exception as e:
+            logger.error(f"Erro ao consultar resultados armazenados: {e}")
+            return []
+
+    def _row_to_dict(self, row: sqlite3.Row) -> Dict[str, Any]:
+        """Convert a database row to a response dictionary"""
+        return {
+            "bidding_id": row["bidding_id"],
+            "content_hash": row["content_hash"],
+            "model": row["model"],
+            "prompt_tokens": row["prompt_tokens"],
+            "completion_tokens": row["completion_tokens"],
+            "timings": json.loads(row["timings"]),
+            "result": json.loads(row["result"]),
+            "created_at": row["created_at"],
+        }
+
+
+# Global instance for easy import
+checklist_store = ChecklistResultStore()
@@ -1,21 +1,49 @@
 """
 S3 Service - Handle S3 operations
 """
+import os
+import mmap
+import hashlib
 import logging
-from typing import Optional, Dict, Any
+import tempfile
+from contextlib import contextmanager
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, Iterator, BinaryIO, Callable, Tuple, Union
 from urllib.parse import unquote, urlparse
 from app.clients.s3_client import s3
-from app.config.config import AWS_S3_BUCKET
+from app.config.exceptions import DeadlineExceeded
+from app.services.deadline import Deadline
+from app.services.pdf_extraction_backends import BufferReader
+from app.config.config import (
+    AWS_S3_BUCKET,
+    JOB_MEMORY_CEILING_MB,
+    S3_DOWNLOAD_CHUNK_SIZE_KB,
+    S3_RANGED_GET_ENABLED,
+    S3_RANGED_GET_THRESHOLD_MB,
+    S3_RANGED_GET_PART_SIZE_MB,
+    S3_RANGED_GET_CONCURRENCY,
+)
 
 logger = logging.getLogger(__name__)
 
 
+@dataclass
+class DownloadedFile:
+    """Downloaded object exposed as a seekable binary stream"""
+    key: str
+    stream: BinaryIO
+    size: int
+    content_hash: str
+    spooled: bool = False
+
+
 class S3Service:
     """Service to handle S3 operations"""
     
-    def __init__(self):
+    def __init__(self, bucket_name: Optional[str] = None):
         self.s3_client = s3
-        self.bucket_name = AWS_S3_BUCKET
+        self.bucket_name = bucket_name or AWS_S3_BUCKET
     
     def extract_key_from_url(self, url: str) -> Optional[str]:
         """Extract S3 object key from URL"""
@@ -38,6 +66,14 @@ class S3Service:
         """Check if file is a PDF"""
         return key.lower().endswith('.pdf')
     
+    def list_pdf_keys(self, prefix: str = "") -> Iterator[str]:
+        """List PDF object keys under a prefix"""
+        paginator = self.s3_client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket_name, Prefix=prefix):
+            for obj in page.get("Contents", []):
+                if self.is_pdf_file(obj["Key"]):
+                    yield obj["Key"]
+    
     def download_file(self, key: str) -> Optional[bytes]:
         """Download file from S3"""
         try:
@@ -53,6 +89,185 @@ class S3Service:
             logger.error(f"Erro ao baixar objeto do S3: {e}")
             return None
     
+    @contextmanager
+    def open_file(self, key: str, deadline: Optional[Deadline] = None) -> Iterator[Optional[DownloadedFile]]:
+        """Download an object, spooling it to a memory-mapped temp file above the memory ceiling
+        
+        With a deadline, the download is abandoned between chunks once the
+        budget runs out and DeadlineExceeded is raised.
+        """
+        deadline = deadline or Deadline.unbounded()
+        temp_file = None
+        mapped = None
+        downloaded = None
+        try:
+            logger.info(f"Baixando arquivo: {key} do bucket: {self.bucket_name}")
+            
+            in_memory_limit = JOB_MEMORY_CEILING_MB * 1024 * 1024
+            
+            if S3_RANGED_GET_ENABLED:
+                head = self.s3_client.head_object(Bucket=self.bucket_name, Key=key)
+                size = head.get("ContentLength", 0)
+                etag = head.get("ETag")
+                
+                if size >= S3_RANGED_GET_THRESHOLD_MB * 1024 * 1024:
+                    if size <= in_memory_limit:
+                        buffer = bytearray(size)
+                        view = memoryview(buffer)
+                        
+                        def write_to_buffer(offset: int, chunk: bytes) -> None:
+                            view[offset:offset + len(chunk)] = chunk
+                        
+                        try:
+                            self._download_ranges(key, size, etag, write_to_buffer, deadline)
+                        finally:
+                            view.release()
+                        downloaded = self._in_memory_file(key, buffer)
+                    else:
+                        temp_file = self._create_temp_file()
+                        temp_file.truncate(size)
+                        fd = temp_file.fileno()
+                        
+                        def write_to_file(offset: int, chunk: bytes) -> None:
+                            os.pwrite(fd, chunk, offset)
+                        
+                        self._download_ranges(key, size, etag, write_to_file, deadline)
+                        mapped = mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+                        downloaded = DownloadedFile(
+                            key=key,
+                            stream=mapped,
+                            size=size,
+                            content_hash=self._hash_stream(mapped),
+                            spooled=True
+                        )
+            
+            if downloaded is None:
+                response = self.s3_client.get_object(Bucket=self.bucket_name, Key=key)
+                size = response.get("ContentLength", 0)
+                body = response["Body"]
+                
+                if size <= in_memory_limit:
+                    content = bytearray()
+                    for chunk in body.iter_chunks(chunk_size=S3_DOWNLOAD_CHUNK_SIZE_KB * 1024):
+                        deadline.check("download")
+                        content += chunk
+                    downloaded = self._in_memory_file(key, content)
+                else:
+                    temp_file = self._create_temp_file()
+                    digest = hashlib.sha256()
+                    written = 0
+                    for chunk in body.iter_chunks(chunk_size=S3_DOWNLOAD_CHUNK_SIZE_KB * 1024):
+                        deadline.check("download")
+                        temp_file.write(chunk)
+                        digest.update(chunk)
+                        written += len(chunk)
+                    temp_file.flush()
+                    
+                    mapped = mmap.mmap(temp_file.fileno(), 0, access=mmap.ACCESS_READ)
+                    downloaded = DownloadedFile(
+                        key=key,
+                        stream=mapped,
+                        size=written,
+                        content_hash=digest.hexdigest(),
+                        spooled=True
+                    )
+            
+            logger.info(
+                f"Arquivo baixado com sucesso. Tamanho: {downloaded.size} bytes"
+                f"{' (em disco)' if downloaded.spooled else ''}"
+            )
+            
+        except DeadlineExceeded:
+            logger.warning(f"Prazo esgotado durante o download de {key}")
+            self._cleanup(mapped, temp_file)
+            raise
+        except Exception as e:
+            logger.error(f"Erro ao baixar objeto do S3: {e}")
+            downloaded = None
+        
+        try:
+            yield downloaded
+        finally:
+            self._cleanup(mapped, temp_file)
+    
+    def _cleanup(self, mapped: Optional[mmap.mmap], temp_file) -> None:
+        """Close the memory map and delete the spool file"""
+        if mapped is not None:
+            mapped.close()
+        if temp_file is not None:
+            temp_file.close()
+            os.unlink(temp_file.name)
+    
+    def _download_ranges(
+        self,
+        key: str,
+        size: int,
+        etag: Optional[str],
+        write_part: Callable[[int, bytes], None],
+        deadline: Deadline
+    ) -> None:
+        """Fetch an object as concurrent byte-range GETs, writing each chunk at its offset"""
+        part_size = S3_RANGED_GET_PART_SIZE_MB * 1024 * 1024
+        ranges = [(start, min(start + part_size, size) - 1) for start in range(0, size, part_size)]
+        logger.info(f"Download paralelo de {key}: {len(ranges)} partes, concorrência {S3_RANGED_GET_CONCURRENCY}")
+        
+        def fetch_range(byte_range: Tuple[int, int]) -> None:
+            start, end = byte_range
+            params = {"Bucket": self.bucket_name, "Key": key, "Range": f"bytes={start}-{end}"}
+            if etag:
+                params["IfMatch"] = etag  # Fail instead of mixing parts of two versions
+            
+            response = self.s3_client.get_object(**params)
+            offset = start
+            for chunk in response["Body"].iter_chunks(chunk_size=S3_DOWNLOAD_CHUNK_SIZE_KB * 1024):
+                deadline.check("download")
+                write_part(offset, chunk)
+                offset += len(chunk)
+            
+            if offset != end + 1:
+                raise IOError(f"Parte {start}-{end} incompleta: {offset - start} bytes recebidos")
+        
+        with ThreadPoolExecutor(max_workers=S3_RANGED_GET_CONCURRENCY) as executor:
+            # list() re-raises the first failed part
+            list(executor.map(fetch_range, ranges))
+    
+    def _in_memory_file(self, key: str, content: Union[bytes, bytearray]) -> DownloadedFile:
+        """Wrap downloaded bytes as a DownloadedFile without copying them"""
+        return DownloadedFile(
+            key=key,
+            stream=BufferReader(content),
+            size=len(content),
+            content_hash=hashlib.sha256(content).hexdigest()
+        )
+    
+    def _create_temp_file(self):
+        """Temp file used to spool large objects"""
+        return tempfile.NamedTemporaryFile(prefix="edital-", suffix=".pdf", delete=False)
+    
+    def _hash_stream(self, mapped: mmap.mmap) -> str:
+        """SHA-256 of a memory-mapped file, read in chunks"""
+        digest = hashlib.sha256()
+        chunk_size = S3_DOWNLOAD_CHUNK_SIZE_KB * 1024
+        for offset in range(0, len(mapped), chunk_size):
+            digest.update(mapped[offset:offset + chunk_size])
+        return digest.hexdigest()
+    
+    @contextmanager
+    def open_file_from_url(self, url: str, deadline: Optional[Deadline] = None) -> Iterator[Optional[DownloadedFile]]:
+        """Complete process: extract key from URL and open the downloaded file"""
+        key = self.extract_key_from_url(url)
+        if not key:
+            yield None
+            return
+        
+        if not self.is_pdf_file(key):
+            logger.warning(f"Arquivo {key} não é PDF. Pulando.")
+            yield None
+            return
+        
+        with self.open_file(key, deadline) as downloaded:
+            yield downloaded
+    
     def process_file_from_url(self, url: str) -> Optional[bytes]:
         """Complete process: extract key from URL and download file"""
         key = self.extract_key_from_url(url)
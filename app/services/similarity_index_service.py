@@ -0,0 +1,247 @@
+"""
+Similarity Index Service - Find near-duplicate editais to reuse their checklists
+
+An edital republished with new dates, a new process number or a re-rendered
+PDF has a different byte hash but almost the same text. Each processed
+document gets a 64-bit SimHash of its normalized text (digits masked, word
+3-shingles). Fingerprints are split into 4 bands of 16 bits kept in memory,
+so any stored document within 3 differing bits shares at least one band and
+is found with a few dictionary lookups. Fingerprints, the normalized text
+(zlib) and the checklist are persisted in SQLite.
+"""
+import re
+import json
+import time
+import zlib
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import Counter
+from dataclasses import dataclass
+from typing import Optional, Dict, Any, List, Tuple
+from app.models.llm_models import DocumentChecklistResponse
+from app.services.requirement_rules_service import fold
+from app.config.config import (
+    SIMILARITY_REUSE_ENABLED,
+    SIMILARITY_THRESHOLD,
+    SIMILARITY_INDEX_PATH,
+)
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS document_fingerprints (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    simhash INTEGER NOT NULL,
+    text BLOB NOT NULL,
+    checklist TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+"""
+
+_BITS = 64
+_BANDS = 4
+_BAND_BITS = _BITS // _BANDS
+_BAND_MASK = (1 << _BAND_BITS) - 1
+_SHINGLE_WORDS = 3
+# Short texts give unstable fingerprints
+_MIN_SHINGLES = 50
+
+_WORD_RE = re.compile(r"\w+")
+_DIGIT_RE = re.compile(r"\d")
+
+
+def _signed(value: int) -> int:
+    """Unsigned 64-bit value as SQLite's signed INTEGER"""
+    return value - (1 << _BITS) if value >= 1 << (_BITS - 1) else value
+
+
+def _unsigned(value: int) -> int:
+    """SQLite's signed INTEGER back to an unsigned 64-bit value"""
+    return value + (1 << _BITS) if value < 0 else value
+
+
+def mask_digits(text: str) -> str:
+    """Fold accents and case and replace every digit with 0 (dates, process numbers, values)"""
+    return _DIGIT_RE.sub("0", fold(text))
+
+
+def simhash(text: str) -> Optional[int]:
+    """64-bit SimHash of the word 3-shingles; None for texts too short to fingerprint"""
+    words = _WORD_RE.findall(mask_digits(text))
+    shingles = len(words) - _SHINGLE_WORDS + 1
+    if shingles < _MIN_SHINGLES:
+        return None
+
+    digests = b"".join(
+        hashlib.blake2b(" ".join(words[index:index + _SHINGLE_WORDS]).encode("utf-8"), digest_size=8).digest()
+        for index in range(shingles)
+    )
+    # Count set bits per position one byte column at a time instead of bit by bit per shingle
+    value = 0
+    for byte_index in range(8):
+        byte_counts = Counter(digests[byte_index::8])
+        for bit in range(8):
+            ones = sum(count for byte, count in byte_counts.items() if byte >> bit & 1)
+            if ones * 2 > shingles:
+                value |= 1 << ((7 - byte_index) * 8 + bit)
+    return value
+
+
+def similarity(a: int, b: int) -> float:
+    """Share of equal bits between two fingerprints"""
+    return 1 - bin(a ^ b).count("1") / _BITS
+
+
+@dataclass
+class SimilarMatch:
+    """Stored document close to the queried one"""
+    row_id: int
+    similarity: float
+    text: str
+    checklist: DocumentChecklistResponse
+
+
+class SimilarityIndexService:
+    """SimHash LSH index of processed documents and their checklists"""
+
+    def __init__(
+        self,
+        path: str = SIMILARITY_INDEX_PATH,
+        enabled: bool = SIMILARITY_REUSE_ENABLED,
+        threshold: float = SIMILARITY_THRESHOLD
+    ):
+        self.path = path
+        self.enabled = enabled
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+        self._fingerprints: Dict[int, int] = {}
+        self._bands: List[Dict[int, List[int]]] = [{} for _ in range(_BANDS)]
+        self.stats = {"lookups": 0, "reused": 0, "verified": 0, "rejected": 0, "indexed": 0}
+
+    def find(self, text: str) -> Optional[SimilarMatch]:
+        """Most similar stored document at or above the threshold"""
+        if not self.enabled:
+            return None
+        fingerprint = simhash(text)
+        if fingerprint is None:
+            return None
+
+        try:
+            with self._lock:
+                connection = self._get_connection()
+                self.stats["lookups"] += 1
+                candidates = {
+                    row_id
+                    for band, index in enumerate(self._bands)
+                    for row_id in index.get(self._band(fingerprint, band), ())
+                }
+                if not candidates:
+                    return None
+                best = max(candidates, key=lambda row_id: similarity(fingerprint, self._fingerprints[row_id]))
+                score = similarity(fingerprint, self._fingerprints[best])
+                if score < self.threshold:
+                    return None
+                row = connection.execute(
+                    "SELECT text, checklist FROM document_fingerprints WHERE id = ?", (best,)
+                ).fetchone()
+
+            return SimilarMatch(
+                row_id=best,
+                similarity=score,
+                text=zlib.decompress(row["text"]).decode("utf-8"),
+                checklist=DocumentChecklistResponse.from_dict(json.loads(row["checklist"]))
+            )
+
+        except Exception as e:
+            logger.error(f"Erro ao consultar índice de similaridade: {e}")
+            return None
+
+    def add(self, text: str, result: DocumentChecklistResponse) -> bool:
+        """Index a processed document and its checklist"""
+        if not self.enabled or result.status != "processed":
+            return False
+        fingerprint = simhash(text)
+        if fingerprint is None:
+            return False
+
+        try:
+            with self._lock:
+                connection = self._get_connection()
+                cursor = connection.execute(
+                    "INSERT INTO document_fingerprints (simhash, text, checklist, created_at) VALUES (?, ?, ?, ?)",
+                    (
+                        _signed(fingerprint),
+                        zlib.compress(text.encode("utf-8")),
+                        json.dumps(result.to_dict(), ensure_ascii=False),
+                        time.time(),
+                    )
+                )
+                connection.commit()
+                self._index(cursor.lastrowid, fingerprint)
+                self.stats["indexed"] += 1
+            return True
+
+        except Exception as e:
+            logger.error(f"Erro ao indexar documento: {e}")
+            return False
+
+    def record(self, outcome: str) -> None:
+        """Count a reuse outcome: reused, verified or rejected"""
+        with self._lock:
+            self.stats[outcome] += 1
+
+    def changed_lines(self, old_text: str, new_text: str) -> Tuple[str, str]:
+        """Lines only in the new text and lines only in the old one
+
+        Digits count here, unlike in the fingerprint: "10%" becoming "30%" in a
+        requirement line must reach the LLM instead of reusing the old checklist.
+        """
+        old_lines = {line.strip() for line in old_text.split("\n")}
+        new_lines = {line.strip() for line in new_text.split("\n")}
+        added = [line for line in new_text.split("\n") if line.strip() not in old_lines]
+        removed = [line for line in old_text.split("\n") if line.strip() not in new_lines]
+        return "\n".join(added).strip(), "\n".join(removed).strip()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Counters and reuse rate"""
+        with self._lock:
+            stats = dict(self.stats)
+            size = len(self._fingerprints)
+        reused = stats["reused"] + stats["verified"]
+        return {
+            "enabled": self.enabled,
+            "threshold": self.threshold,
+            "documents": size,
+            **stats,
+            "reuse_rate": round(reused / stats["lookups"], 3) if stats["lookups"] else 0.0,
+        }
+
+    def _get_connection(self) -> sqlite3.Connection:
+        """Open the database and load the band index on first use (lock must be held)"""
+        if self._connection is None:
+            connection = sqlite3.connect(self.path, check_same_thread=False)
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(_SCHEMA)
+            for row in connection.execute("SELECT id, simhash FROM document_fingerprints"):
+                self._index(row["id"], _unsigned(row["simhash"]))
+            self._connection = connection
+            logger.info(f"Índice de similaridade carregado com {len(self._fingerprints)} documentos")
+        return self._connection
+
+    def _index(self, row_id: int, fingerprint: int) -> None:
+        """Add a fingerprint to the in-memory bands (lock must be held)"""
+        self._fingerprints[row_id] = fingerprint
+        for band, index in enumerate(self._bands):
+            index.setdefault(self._band(fingerprint, band), []).append(row_id)
+
+    def _band(self, fingerprint: int, band: int) -> int:
+        """16-bit slice of a fingerprint"""
+        return fingerprint >> (band * _BAND_BITS) & _BAND_MASK
+
+
+# Global instance for easy import
+similarity_index = SimilarityIndexService()
@@ -13,9 +13,9 @@ logger = logging.getLogger(__name__)
 class SQSService:
     """Service to handle SQS operations"""
     
-    def __init__(self):
+    def __init__(self, queue_url: Optional[str] = None):
         self.sqs_client = sqs
-        self.queue_url = SQS_QUEUE_URL
+        self.queue_url = queue_url or SQS_QUEUE_URL
     
     def receive_messages(self, max_messages: int = 1, wait_time: int = 10) -> List[Dict[str, Any]]:
         """Receive messages from SQS queue"""
@@ -23,7 +23,9 @@ class SQSService:
             response = self.sqs_client.receive_message(
                 QueueUrl=self.queue_url,
                 MaxNumberOfMessages=max_messages,
-                WaitTimeSeconds=wait_time  # Long polling
+                WaitTimeSeconds=wait_time,  # Long polling
+                AttributeNames=["SentTimestamp"],
+                MessageAttributeNames=["source"]
             )
             
             messages = response.get("Messages", [])
@@ -48,6 +50,50 @@ class SQSService:
             logger.error(f"Erro ao deletar mensagem: {e}")
             return False
     
+    def change_message_visibility(self, receipt_handle: str, visibility_timeout: int) -> bool:
+        """Change message visibility timeout (0 returns it to the queue immediately)"""
+        try:
+            self.sqs_client.change_message_visibility(
+                QueueUrl=self.queue_url,
+                ReceiptHandle=receipt_handle,
+                VisibilityTimeout=visibility_timeout
+            )
+            return True
+            
+        except Exception as e:
+            logger.error(f"Erro ao alterar visibilidade da mensagem: {e}")
+            return False
+    
+    def get_visibility_timeout(self) -> Optional[int]:
+        """Queue's default visibility timeout in seconds"""
+        try:
+            response = self.sqs_client.get_queue_attributes(
+                QueueUrl=self.queue_url,
+                AttributeNames=["VisibilityTimeout"]
+            )
+            return int(response.get("Attributes", {}).get("VisibilityTimeout", 0)) or None
+            
+        except Exception as e:
+            logger.error(f"Erro ao consultar visibility timeout da fila: {e}")
+            return None
+    
+    def get_queue_attributes(self) -> Dict[str, int]:
+        """Get approximate queue depth"""
+        response = self.sqs_client.get_queue_attributes(
+            QueueUrl=self.queue_url,
+            AttributeNames=[
+                "ApproximateNumberOfMessages",
+                "ApproximateNumberOfMessagesNotVisible",
+                "ApproximateNumberOfMessagesDelayed",
+            ]
+        )
+        attributes = response.get("Attributes", {})
+        return {
+            "visible": int(attributes.get("ApproximateNumberOfMessages", 0)),
+            "not_visible": int(attributes.get("ApproximateNumberOfMessagesNotVisible", 0)),
+            "delayed": int(attributes.get("ApproximateNumberOfMessagesDelayed", 0)),
+        }
+    
     def parse_message_body(self, message_body: str) -> Dict[str, Any]:
         """Parse message body (JSON or text)"""
         if not message_body.strip():
@@ -0,0 +1,164 @@
+"""
+Text Normalization Service - Strip boilerplate and normalize extracted PDF text
+"""
+import re
+import logging
+from dataclasses import dataclass
+from typing import List, Dict
+from app.config.config import (
+    TEXT_NORMALIZATION_ENABLED,
+    BOILERPLATE_MIN_PAGES,
+    BOILERPLATE_PAGE_RATIO,
+)
+from app.services.token_estimator import token_estimator
+
+logger = logging.getLogger(__name__)
+
+_MAX_BOILERPLATE_LINE_LENGTH = 200
+_MIN_BOILERPLATE_LETTERS = 3
+
+_WHITESPACE_RE = re.compile(r"[ \t\f\v\u00a0]+")
+_DIGITS_RE = re.compile(r"\d+")
+_PAGE_NUMBER_RE = re.compile(
+    r"^(?:-\s*)?(?:p[áa]g(?:ina)?\.?|page|fl(?:s|\.)?\.?|folha)?\s*\d+"
+    r"(?:\s*(?:de|/|of)\s*\d+)?(?:\s*-)?$",
+    re.IGNORECASE,
+)
+_HYPHEN_END_RE = re.compile(r"[A-Za-zÀ-ÿ]-$")
+_LETTER_RE = re.compile(r"[A-Za-zÀ-ÿ]")
+
+
+@dataclass
+class NormalizationResult:
+    """Normalized text with reduction statistics"""
+    text: str
+    original_chars: int
+    normalized_chars: int
+    original_tokens: int
+    normalized_tokens: int
+    removed_lines: int
+
+    @property
+    def reduction_ratio(self) -> float:
+        """Fraction of characters removed by normalization"""
+        if not self.original_chars:
+            return 0.0
+        return 1 - (self.normalized_chars / self.original_chars)
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate token count with the shared estimator"""
+    return token_estimator.count(text)
+
+
+class TextNormalizationService:
+    """Service to shrink extracted text before prompt construction"""
+
+    def __init__(self):
+        self.enabled = TEXT_NORMALIZATION_ENABLED
+        self.min_pages = BOILERPLATE_MIN_PAGES
+        self.page_ratio = BOILERPLATE_PAGE_RATIO
+
+    def normalize_pages(self, pages: List[str]) -> NormalizationResult:
+        """Normalize a list of page texts into a single prompt-ready text"""
+        original_text = "\n".join(pages).strip()
+
+        if not self.enabled:
+            return self._build_result(original_text, original_text, 0)
+
+        page_lines = [self._split_lines(page) for page in pages]
+        boilerplate = self._find_boilerplate(page_lines)
+
+        removed_lines = 0
+        kept_pages = []
+        for lines in page_lines:
+            edges = self._edge_lines(lines)
+            kept = []
+            for index, line in enumerate(lines):
+                if not line:
+                    kept.append(line)
+                    continue
+                # A bare number mid-page is usually a table cell ("15" dias, "90" de validade)
+                is_page_number = index in edges and _PAGE_NUMBER_RE.match(line)
+                if is_page_number or self._line_key(line) in boilerplate:
+                    removed_lines += 1
+                    continue
+                kept.append(line)
+            kept_pages.append(kept)
+
+        text = self._join_lines([line for lines in kept_pages for line in lines])
+        result = self._build_result(original_text, text, removed_lines)
+
+        logger.info(
+            f"Texto normalizado: {result.original_chars} -> {result.normalized_chars} caracteres "
+            f"(~{result.original_tokens} -> ~{result.normalized_tokens} tokens, "
+            f"-{result.reduction_ratio:.1%}, {removed_lines} linhas removidas)"
+        )
+        return result
+
+    def _split_lines(self, page: str) -> List[str]:
+        """Split page into whitespace-collapsed lines"""
+        return [_WHITESPACE_RE.sub(" ", line).strip() for line in page.splitlines()]
+
+    def _edge_lines(self, lines: List[str]) -> set:
+        """Indexes of the first and last non-empty lines of a page, where page numbers sit"""
+        filled = [index for index, line in enumerate(lines) if line]
+        return {filled[0], filled[-1]} if filled else set()
+
+    def _line_key(self, line: str) -> str:
+        """Key used to match a line across pages (digits are wildcarded)"""
+        return _DIGITS_RE.sub("#", line.lower())
+
+    def _find_boilerplate(self, page_lines: List[List[str]]) -> set:
+        """Find lines that repeat across enough pages to be headers or footers"""
+        page_count = len(page_lines)
+        if page_count < self.min_pages:
+            return set()
+
+        counts: Dict[str, int] = {}
+        for lines in page_lines:
+            seen = set()
+            for line in lines:
+                if not line or len(line) > _MAX_BOILERPLATE_LINE_LENGTH:
+                    continue
+                # Short list markers ("a)", "1.") repeat legitimately on every page
+                if len(_LETTER_RE.findall(line)) < _MIN_BOILERPLATE_LETTERS:
+                    continue
+                key = self._line_key(line)
+                if key not in seen:
+                    seen.add(key)
+                    counts[key] = counts.get(key, 0) + 1
+
+        threshold = max(2, int(page_count * self.page_ratio))
+        return {key for key, count in counts.items() if count >= threshold}
+
+    def _join_lines(self, lines: List[str]) -> str:
+        """Join lines fixing hyphenated breaks and collapsing blank runs"""
+        output: List[str] = []
+        blank = False
+        for line in lines:
+            if not line:
+                blank = True
+                continue
+
+            if output and not blank and _HYPHEN_END_RE.search(output[-1]) and line[0].islower():
+                output[-1] = output[-1][:-1] + line
+                continue
+
+            if blank and output:
+                output.append("")
+            output.append(line)
+            blank = False
+
+        return "\n".join(output)
+
+    def _build_result(self, original: str, normalized: str, removed_lines: int) -> NormalizationResult:
+        """Build normalization result with size statistics"""
+        return NormalizationResult(
+            text=normalized,
+            original_chars=len(original),
+            normalized_chars=len(normalized),
+            original_tokens=estimate_tokens(original),
+            normalized_tokens=estimate_tokens(normalized),
+            removed_lines=removed_lines,
+        )
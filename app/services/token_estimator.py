@@ -0,0 +1,81 @@
+"""
+Token Estimator - Shared prompt token estimates, calibrated against provider usage
+
+Uses tiktoken when it is installed and a characters-per-token heuristic
+otherwise. Neither matches every OpenRouter model's tokenizer, so the
+prompt_tokens reported by the provider are used to keep a per-model
+correction factor.
+"""
+import logging
+import threading
+import importlib.util
+from typing import Optional, Dict, Any
+
+logger = logging.getLogger(__name__)
+
+# Rough average for Portuguese text on the tokenizers used by OpenRouter models
+CHARS_PER_TOKEN = 4
+_TIKTOKEN_ENCODING = "cl100k_base"
+# Weight of each new observation in the per-model correction factor
+_CALIBRATION_ALPHA = 0.2
+_MIN_FACTOR = 0.5
+_MAX_FACTOR = 2.0
+# Very short prompts say little about the tokenizer
+_MIN_CALIBRATION_TOKENS = 200
+
+
+class TokenEstimator:
+    """Estimate token counts and learn a correction factor per model"""
+
+    def __init__(self, use_tiktoken: bool = True):
+        self._encoding = None
+        if use_tiktoken and importlib.util.find_spec("tiktoken") is not None:
+            import tiktoken
+            self._encoding = tiktoken.get_encoding(_TIKTOKEN_ENCODING)
+        self.method = "tiktoken" if self._encoding else "heuristic"
+        self._lock = threading.Lock()
+        self._factors: Dict[str, float] = {}
+        self._samples: Dict[str, int] = {}
+
+    def count(self, text: str) -> int:
+        """Uncalibrated token count"""
+        if self._encoding is not None:
+            return len(self._encoding.encode(text, disallowed_special=()))
+        return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+    def estimate(self, text: str, model: Optional[str] = None) -> int:
+        """Token count corrected for the model's tokenizer when it has been observed"""
+        tokens = self.count(text)
+        if model is None:
+            return tokens
+        with self._lock:
+            factor = self._factors.get(model, 1.0)
+        return int(tokens * factor + 0.5)
+
+    def observe(self, model: str, prompt: str, prompt_tokens: Optional[int]) -> None:
+        """Update the model's correction factor from the provider's reported usage"""
+        if not prompt_tokens or prompt_tokens < _MIN_CALIBRATION_TOKENS:
+            return
+        counted = self.count(prompt)
+        if not counted:
+            return
+        ratio = min(_MAX_FACTOR, max(_MIN_FACTOR, prompt_tokens / counted))
+        with self._lock:
+            previous = self._factors.get(model)
+            self._factors[model] = ratio if previous is None else previous + _CALIBRATION_ALPHA * (ratio - previous)
+            self._samples[model] = self._samples.get(model, 0) + 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Method and per-model correction factors"""
+        with self._lock:
+            return {
+                "method": self.method,
+                "models": {
+                    model: {"factor": round(factor, 3), "samples": self._samples[model]}
+                    for model, factor in self._factors.items()
+                },
+            }
+
+
+# Global instance for easy import
+token_estimator = TokenEstimator()
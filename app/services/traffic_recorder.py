@@ -0,0 +1,118 @@
+"""
+Traffic Recorder - Capture production traffic for offline replay
+
+Records SQS message bodies, downloaded object sizes/hashes, extraction sizes
+and LLM timings/payloads into a gzip-compressed JSONL file. Enabled by
+setting TRAFFIC_RECORD_PATH; replay with `python -m app.cli.replay`.
+"""
+import gzip
+import json
+import time
+import atexit
+import logging
+import threading
+from typing import Optional, Dict, Any
+from app.config.config import TRAFFIC_RECORD_PATH
+
+logger = logging.getLogger(__name__)
+
+_FLUSH_EVERY = 50
+
+
+class TrafficRecorder:
+    """Append-only recorder of consumer traffic"""
+
+    def __init__(self, path: Optional[str] = TRAFFIC_RECORD_PATH):
+        self.path = path
+        self.enabled = bool(path)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._file = None
+        self._pending = 0
+
+        if self.enabled:
+            atexit.register(self.close)
+            logger.info(f"Gravação de tráfego habilitada em {path}")
+
+    def record_message(self, message: Dict[str, Any]) -> None:
+        """Record an SQS message and bind it to the current thread"""
+        if not self.enabled:
+            return
+        message_id = message.get("MessageId")
+        self._local.message_id = message_id
+        self._write({"type": "message", "message_id": message_id, "body": message.get("Body", "")})
+
+    def current_message_id(self) -> Optional[str]:
+        """Message bound to the current thread"""
+        return getattr(self._local, "message_id", None)
+
+    def bind_message(self, message_id: Optional[str]) -> None:
+        """Bind a message to the current thread (for helper threads working on it)"""
+        self._local.message_id = message_id
+
+    def record_download(self, size: int, content_hash: str) -> None:
+        """Record the downloaded object for the current message"""
+        self._write_for_message({"type": "download", "size": size, "content_hash": content_hash})
+
+    def record_extraction(self, pages: int, chars: int, seconds: float) -> None:
+        """Record the extracted text size for the current message"""
+        self._write_for_message({"type": "extraction", "pages": pages, "chars": chars, "seconds": round(seconds, 3)})
+
+    def record_llm(
+        self,
+        model: str,
+        latency: Optional[float],
+        prompt_chars: int,
+        content: Optional[str],
+        prompt_tokens: Optional[int] = None,
+        completion_tokens: Optional[int] = None
+    ) -> None:
+        """Record an LLM call for the current message"""
+        self._write_for_message({
+            "type": "llm",
+            "model": model,
+            "latency": round(latency or 0.0, 3),
+            "prompt_chars": prompt_chars,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "content": content,
+        })
+
+    def close(self) -> None:
+        """Flush and close the recording file"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _write_for_message(self, record: Dict[str, Any]) -> None:
+        """Write a record tied to the current thread's message"""
+        if not self.enabled:
+            return
+        message_id = getattr(self._local, "message_id", None)
+        if message_id is None:
+            return
+        self._write({**record, "message_id": message_id})
+
+    def _write(self, record: Dict[str, Any]) -> None:
+        """Append a timestamped record"""
+        if not self.enabled:
+            return
+        try:
+            line = json.dumps({"ts": time.time(), **record}, ensure_ascii=False, separators=(",", ":"))
+            with self._lock:
+                if self._file is None:
+                    # Each process start appends a new gzip member; readers handle concatenated members
+                    self._file = gzip.open(self.path, "at", encoding="utf-8")
+                self._file.write(line + "\n")
+                self._pending += 1
+                if self._pending >= _FLUSH_EVERY:
+                    self._file.flush()
+                    self._pending = 0
+
+        except Exception as e:
+            logger.error(f"Erro ao gravar tráfego: {e}")
+
+
+# Global instance for easy import
+traffic_recorder = TrafficRecorder()
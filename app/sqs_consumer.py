@@ -2,11 +2,24 @@
 SQS Consumer - Polls messages from SQS queue and processes them
 """
 import time
+import signal
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future, wait
+from typing import Dict, List, Tuple
 from app.config.logging_config import setup_logging
 from app.services.sqs_service import SQSService
+from app.services.lane_scheduler_service import LaneScheduler, Lane
 from app.consumers.message_processor import MessageProcessor
-from app.config.config import MAX_MESSAGES_PER_POLL, POLL_WAIT_TIME
+from app.services.metrics_service import consumer_metrics
+from app.services.traffic_recorder import traffic_recorder
+from app.services.checklist_dispatcher_service import checklist_dispatcher
+from app.config.exceptions import RedeliverMessage
+from app.config.config import (
+    POLL_WAIT_TIME,
+    CONSUMER_MAX_WORKERS,
+    SHUTDOWN_DRAIN_TIMEOUT_SECONDS,
+)
 
 # Setup logging
 setup_logging()
@@ -19,9 +32,29 @@ class SQSConsumer:
     def __init__(self):
         self.sqs_service = SQSService()
         self.message_processor = MessageProcessor()
+        self.scheduler = LaneScheduler()
+        consumer_metrics.set_queue_stats_provider(self.scheduler.queue_attributes)
+        
+        self._stop_event = threading.Event()
+        self._stopped_event = threading.Event()
+        self._slots = threading.BoundedSemaphore(CONSUMER_MAX_WORKERS)
+        self._executor = ThreadPoolExecutor(
+            max_workers=CONSUMER_MAX_WORKERS,
+            thread_name_prefix="sqs-worker"
+        )
+        self._in_flight: Dict[Future, Tuple[Lane, dict]] = {}
+        self._in_flight_lock = threading.Lock()
+    
+    @property
+    def draining(self) -> bool:
+        """Whether the consumer has been asked to stop"""
+        return self._stop_event.is_set()
     
     def process_single_message(self, message: dict) -> bool:
         """Process a single SQS message"""
+        consumer_metrics.start_job(message.get("MessageId"))
+        traffic_recorder.record_message(message)
+        success = False
         try:
             # Parse message body
             message_body = message.get("Body", "")
@@ -29,7 +62,8 @@ class SQSConsumer:
             
             if parsed_message["type"] == "empty":
                 logger.info("Mensagem vazia recebida, pulando...")
-                return True
+                success = True
+                return success
             
             # Process message content
             success = self.message_processor.process_message(parsed_message["content"])
@@ -41,48 +75,129 @@ class SQSConsumer:
             
             return success
             
+        except RedeliverMessage:
+            raise
         except Exception as e:
             logger.error(f"Erro ao processar mensagem: {e}")
+            consumer_metrics.record_error(e)
             return False
+        finally:
+            consumer_metrics.finish_job(success)
     
     def poll_messages(self):
-        """Main polling loop for SQS messages"""
-        logger.info("Iniciando polling da fila SQS...")
+        """Main loop: hand messages from the priority lanes to free worker slots"""
+        lanes = ", ".join(f"{lane.name} (peso {lane.weight})" for lane in self.scheduler.lanes)
+        logger.info(f"Iniciando polling das filas SQS [{lanes}] com {CONSUMER_MAX_WORKERS} worker(s)...")
         
-        while True:
-            try:
-                # Receive messages from SQS
-                messages = self.sqs_service.receive_messages(
-                    max_messages=MAX_MESSAGES_PER_POLL,
-                    wait_time=POLL_WAIT_TIME
-                )
-                
-                for message in messages:
-                    try:
-                        # Process message
-                        success = self.process_single_message(message)
-                        
-                        # Always delete message to avoid reprocessing
-                        # Even if processing failed, we don't want infinite retries
-                        receipt_handle = message["ReceiptHandle"]
-                        self.sqs_service.delete_message(receipt_handle)
-                        
-                        if not success:
-                            logger.warning("Mensagem deletada após falha no processamento")
-                            
-                    except Exception as e:
-                        logger.error(f"Erro crítico ao processar mensagem: {e}")
-                        # Delete message to prevent infinite reprocessing
-                        try:
-                            receipt_handle = message["ReceiptHandle"]
-                            self.sqs_service.delete_message(receipt_handle)
-                            logger.info("Mensagem deletada após erro crítico")
-                        except Exception as delete_error:
-                            logger.error(f"Erro ao deletar mensagem com falha: {delete_error}")
+        try:
+            # One long-polling thread per lane fills a small buffer
+            self.scheduler.start(self._stop_event)
+            while not self._stop_event.is_set():
+                try:
+                    if not self._acquire_slot():
+                        break
+                    item = self.scheduler.next_message(self._stop_event)
+                    if item is None:
+                        self._slots.release()
+                        break
+                    self._submit(*item)
+                    
+                except Exception as e:
+                    logger.error(f"Erro ao consumir fila: {e}")
+                    consumer_metrics.record_error(e, stage="poll")
+                    self._stop_event.wait(5)  # Wait before retrying
+        finally:
+            logger.info("Polling da fila SQS encerrado")
+            self._stopped_event.set()
+    
+    def _acquire_slot(self) -> bool:
+        """Wait for a free worker slot; returns False once draining starts"""
+        while not self._stop_event.is_set():
+            if self._slots.acquire(timeout=1):
+                return True
+        return False
+    
+    def _submit(self, lane: Lane, message: dict) -> None:
+        """Run a message on the worker pool (a slot must already be held)"""
+        future = self._executor.submit(self._handle_message, lane, message)
+        with self._in_flight_lock:
+            self._in_flight[future] = (lane, message)
+        future.add_done_callback(self._on_message_done)
+    
+    def _on_message_done(self, future: Future) -> None:
+        """Free the worker slot of a finished message"""
+        with self._in_flight_lock:
+            item = self._in_flight.pop(future, None)
+        if item:
+            self.scheduler.finish(item[0])
+        self._slots.release()
+    
+    def _handle_message(self, lane: Lane, message: dict) -> None:
+        """Process a message and delete it from its lane's queue, unless it asked to be redelivered"""
+        try:
+            # Process message
+            success = self.process_single_message(message)
+            
+            # Always delete message to avoid reprocessing
+            # Even if processing failed, we don't want infinite retries
+            receipt_handle = message["ReceiptHandle"]
+            lane.sqs_service.delete_message(receipt_handle)
+            
+            if not success:
+                logger.warning("Mensagem deletada após falha no processamento")
+        
+        except RedeliverMessage:
+            # Not deleted: SQS delivers it again after the visibility timeout (maxReceiveCount bounds the attempts)
+            logger.warning(f"Mensagem {message.get('MessageId')} mantida na fila para nova entrega")
                 
-            except Exception as e:
-                logger.error(f"Erro ao consumir fila: {e}")
-                time.sleep(5)  # Wait before retrying
+        except Exception as e:
+            logger.error(f"Erro crítico ao processar mensagem: {e}")
+            # Delete message to prevent infinite reprocessing
+            try:
+                receipt_handle = message["ReceiptHandle"]
+                lane.sqs_service.delete_message(receipt_handle)
+                logger.info("Mensagem deletada após erro crítico")
+            except Exception as delete_error:
+                logger.error(f"Erro ao deletar mensagem com falha: {delete_error}")
+    
+    def _release_messages(self, items: List[Tuple[Lane, dict]]) -> None:
+        """Make messages visible again so another consumer picks them up"""
+        for lane, message in items:
+            receipt_handle = message.get("ReceiptHandle")
+            if receipt_handle and lane.sqs_service.change_message_visibility(receipt_handle, 0):
+                logger.info(f"Mensagem {message.get('MessageId')} devolvida à fila")
+    
+    def drain(self, timeout: float = SHUTDOWN_DRAIN_TIMEOUT_SECONDS) -> bool:
+        """Stop polling and wait for in-flight messages; returns True if all finished"""
+        logger.info(f"Iniciando drain do consumer (prazo de {timeout:.0f}s)")
+        deadline = time.monotonic() + timeout
+        self._stop_event.set()
+        
+        # The current long polls return within POLL_WAIT_TIME; buffered messages are released
+        self._stopped_event.wait(max(0.0, min(POLL_WAIT_TIME + 1, deadline - time.monotonic())))
+        self._release_messages(
+            self.scheduler.stop(max(0.0, min(POLL_WAIT_TIME + 1, deadline - time.monotonic())))
+        )
+        
+        with self._in_flight_lock:
+            pending = list(self._in_flight)
+        logger.info(f"Aguardando {len(pending)} mensagem(ns) em processamento")
+        
+        _, not_done = wait(pending, timeout=max(0.0, deadline - time.monotonic()))
+        if not_done:
+            with self._in_flight_lock:
+                unfinished = [self._in_flight[f] for f in not_done if f in self._in_flight]
+            logger.warning(f"Prazo de drain esgotado com {len(unfinished)} mensagem(ns) em processamento")
+            self._release_messages(unfinished)
+        
+        # Send coalesced checklist updates still waiting for their window
+        checklist_dispatcher.flush(max(0.0, deadline - time.monotonic()))
+        
+        self._executor.shutdown(wait=False)
+        # Unfinished messages were released above, so the process can be killed
+        # safely once the deadline passes even if worker threads are still running
+        logger.info("Drain do consumer concluído")
+        return not not_done
 
 
 # Global instance and functions for backward compatibility
@@ -91,3 +206,24 @@ _consumer = SQSConsumer()
 def poll_messages():
     """Backward compatible function"""
     _consumer.poll_messages()
+
+
+def drain_consumer(timeout: float = SHUTDOWN_DRAIN_TIMEOUT_SECONDS) -> bool:
+    """Stop the global consumer gracefully"""
+    return _consumer.drain(timeout)
+
+
+def lane_status() -> dict:
+    """Per-lane counters of the global consumer"""
+    return _consumer.scheduler.snapshot()
+
+
+if __name__ == "__main__":
+    # Standalone consumer: drain on SIGTERM/SIGINT instead of dying mid-job
+    def _handle_signal(signum, frame):
+        logger.info(f"Sinal {signum} recebido, iniciando drain")
+        threading.Thread(target=drain_consumer, name="sqs-drain").start()
+    
+    signal.signal(signal.SIGTERM, _handle_signal)
+    signal.signal(signal.SIGINT, _handle_signal)
+    poll_messages()